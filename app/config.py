@@ -1,11 +1,17 @@
 # app/config.py
 from __future__ import annotations
 
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cached_property
 from pathlib import Path
-from typing import Any, Dict, Optional, List
+from typing import Any, Dict, Mapping, Optional, List
 
 import yaml
 
+from app.cores.routing import RoutingIndex
+
 
 def _normalize_params(params: Any) -> Dict[str, Any]:
     # Supports:
@@ -75,18 +81,41 @@ def _normalize_model_aliases(value: Any) -> List[str]:
     return []
 
 
+def _normalize_urls(value: Any) -> List[str]:
+    # A single URL or a list of replica URLs -> deduplicated list without trailing slashes.
+    items = value if isinstance(value, list) else [value]
+    out: List[str] = []
+    for item in items:
+        if not isinstance(item, str) or not item.strip():
+            continue
+        url = item.strip().rstrip("/")
+        if url not in out:
+            out.append(url)
+    return out
+
+
+# VILMS_CONFIG points the gateway at another file (e.g. the benchmark suite's generated config).
+DEFAULT_CONFIG_PATH = Path(os.environ.get("VILMS_CONFIG") or Path(__file__).resolve().parent / "configs" / "config.yaml")
+
+
 class AppConfig:
     """
     Minimal YAML config loader.
-    Default path: ./app/configs/config.yaml
+    Default path: ./app/configs/config.yaml (override with the VILMS_CONFIG env var)
+
+    An instance is treated as an immutable snapshot: hot reload builds a new one
+    instead of mutating `data` in place. Derived sections (models, ADMISSION,
+    PROFILING, ...) are therefore built once per snapshot and cached, like
+    `routing`; callers must not mutate the returned dicts and lists.
     """
 
-    def __init__(self, path: Optional[str] = None):
-        base_dir = Path(__file__).resolve().parent  # .../app
-        self.path = Path(path) if path else (base_dir / "configs" / "config.yaml")
+    def __init__(self, path: Optional[str] = None, data: Optional[Dict[str, Any]] = None):
+        self.path = Path(path) if path else DEFAULT_CONFIG_PATH
         self.data: Dict[str, Any] = {}
 
-        if self.path.exists():
+        if data is not None:
+            self.data = data
+        elif self.path.exists():
             with self.path.open("r", encoding="utf-8") as f:
                 self.data = yaml.safe_load(f) or {}
 
@@ -115,9 +144,15 @@ class AppConfig:
 
     @property
     def vllm_base_url(self) -> str:
-        return str(self.serving.get("vllm-base-url", "")) or self.base_url
+        # First replica when serving.vllm-base-url is a list.
+        replicas = _normalize_urls(self.serving.get("vllm-base-url"))
+        return replicas[0] if replicas else self.base_url
 
-    @property
+    @cached_property
+    def vllm_replicas(self) -> List[str]:
+        return _normalize_urls(self.serving.get("vllm-base-url")) or _normalize_urls(self.base_url)
+
+    @cached_property
     def models(self) -> List[Dict[str, Any]]:
         raw = self.serving.get("models", [])
         if not isinstance(raw, list):
@@ -133,40 +168,29 @@ class AppConfig:
             m2["type"] = _normalize_model_type(m.get("type"))
             m2["engine"] = _normalize_model_engine(m.get("engine", m.get("backend")))
             m2["aliases"] = _normalize_model_aliases(m.get("aliases"))
+            # Optional vLLM replica base URLs for this model (overrides serving.vllm-base-url).
+            m2["replicas"] = _normalize_urls(m.get("replicas"))
             out.append(m2)
         return out
 
-    def resolve_alias(self, model: str) -> str:
-        current = model
-        seen = set()
-        aliases = self.MODEL_ALIASES
-
-        while isinstance(current, str) and current in aliases and current not in seen:
-            seen.add(current)
-            nxt = aliases.get(current)
-            if not isinstance(nxt, str) or not nxt or nxt == current:
-                break
-            current = nxt
-        return current
+    @cached_property
+    def routing(self) -> RoutingIndex:
+        """Alias/model/engine lookup table, compiled on first use."""
+        return RoutingIndex.from_config(self)
 
-    def find_model(self, model: str) -> Optional[Dict[str, Any]]:
-        """Find model metadata by requested name, alias, or canonical name."""
-        if not isinstance(model, str) or not model.strip():
-            return None
+    def compile(self) -> "AppConfig":
+        """Build the routing index and every cached section now, so no request pays for it."""
+        for name, attr in vars(type(self)).items():
+            if isinstance(attr, cached_property):
+                getattr(self, name)
+        return self
 
-        requested = model.strip()
-        canonical = self.resolve_alias(requested)
+    def resolve_alias(self, model: str) -> str:
+        return self.routing.resolve_alias(model)
 
-        for m in self.models:
-            name = str(m.get("name", "")).strip()
-            if not name:
-                continue
-            if requested == name or canonical == name:
-                return m
-            aliases = m.get("aliases", [])
-            if isinstance(aliases, list) and (requested in aliases or canonical in aliases):
-                return m
-        return None
+    def find_model(self, model: str) -> Optional[Mapping[str, Any]]:
+        """Find model metadata by requested name, alias, or canonical name."""
+        return self.routing.find_model(model)
 
     # ---------- Compatibility aliases (so existing code using settings.ENGINE works) ----------
     @property
@@ -195,12 +219,220 @@ class AppConfig:
     def VLLM_BASE_URL(self) -> str:
         return self.vllm_base_url
 
+    @property
+    def VLLM_REPLICAS(self) -> List[str]:
+        return self.vllm_replicas
+
+    @cached_property
+    def LOAD_BALANCING(self) -> Dict[str, Any]:
+        # vLLM replica selection (serving.load-balancing). Ejection uses serving.endpoint-health.
+        raw = self.serving.get("load-balancing", {})
+        raw = raw if isinstance(raw, dict) else {}
+        return {
+            "policy": str(raw.get("policy", "least-outstanding")).strip().lower(),
+            "eject-on-5xx": bool(raw.get("eject-on-5xx", True)),
+        }
+
     @property
     def DEFAULT_MAX_FRAMES(self) -> int:
         # If not set in YAML, fallback 8
         return int(self.serving.get("default-max-frames", 8))
 
     @property
+    def DEFAULT_FRAME_STRATEGY(self) -> str:
+        # last | uniform | first-last-uniform (per-model override: params.frame-strategy)
+        return str(self.serving.get("default-frame-strategy", "last")).strip().lower()
+
+    @cached_property
+    def HTTP_CLIENT(self) -> Dict[str, Any]:
+        # Shared upstream httpx.AsyncClient settings (serving.http-client).
+        raw = self.serving.get("http-client", {})
+        raw = raw if isinstance(raw, dict) else {}
+        return {
+            "timeout": float(raw.get("timeout", 300)),
+            "connect-timeout": float(raw.get("connect-timeout", 10)),
+            "max-connections": int(raw.get("max-connections", 100)),
+            "max-keepalive-connections": int(raw.get("max-keepalive-connections", 20)),
+            "keepalive-expiry": float(raw.get("keepalive-expiry", 30)),
+            "http2": bool(raw.get("http2", False)),
+        }
+
+    @cached_property
+    def ENDPOINT_HEALTH(self) -> Dict[str, Any]:
+        # Sticky candidate-URL selection and circuit breaker (serving.endpoint-health).
+        raw = self.serving.get("endpoint-health", {})
+        raw = raw if isinstance(raw, dict) else {}
+        return {
+            "failure-threshold": int(raw.get("failure-threshold", 2)),
+            "cooldown-s": float(raw.get("cooldown-s", 10)),
+            "max-cooldown-s": float(raw.get("max-cooldown-s", 120)),
+        }
+
+    @cached_property
+    def RELOAD(self) -> Dict[str, Any]:
+        # Config hot reload (serving.reload): file watch interval and old-snapshot drain timeout.
+        raw = self.serving.get("reload", {})
+        raw = raw if isinstance(raw, dict) else {}
+        return {
+            "watch-interval-s": float(raw.get("watch-interval-s", 2)),
+            "drain-timeout-s": float(raw.get("drain-timeout-s", 330)),
+        }
+
+    @cached_property
+    def PROFILING(self) -> Dict[str, Any]:
+        # Per-request stage timing (Server-Timing header) and the opt-in sampling profiler (serving.profiling).
+        raw = self.serving.get("profiling", {})
+        raw = raw if isinstance(raw, dict) else {}
+        return {
+            "server-timing": bool(raw.get("server-timing", True)),
+            "enabled": bool(raw.get("enabled", False)),
+            "dir": str(raw.get("dir") or "./app/cache/profiles"),
+            "interval-ms": float(raw.get("interval-ms", 5)),
+            "max-seconds": float(raw.get("max-seconds", 60)),
+        }
+
+    @cached_property
+    def READINESS(self) -> Dict[str, Any]:
+        # Background warm-up at startup and the cached per-component checks behind GET /ready (serving.readiness).
+        raw = self.serving.get("readiness", {})
+        raw = raw if isinstance(raw, dict) else {}
+        return {
+            "warmup": bool(raw.get("warmup", True)),
+            "interval-s": float(raw.get("interval-s", 10)),
+            "timeout-s": float(raw.get("timeout-s", 3)),
+            "require": str(raw.get("require") or "all").strip().lower(),
+        }
+
+    @cached_property
+    def SHARED_STATE(self) -> Dict[str, Any]:
+        # Host-wide counters, admission permits, caches and breakers shared by all workers (serving.shared-state).
+        raw = self.serving.get("shared-state", {})
+        raw = raw if isinstance(raw, dict) else {}
+        return {
+            "enabled": bool(raw.get("enabled", False)),
+            "socket": str(raw.get("socket") or "/tmp/vilms-gateway-state.sock"),
+            "max-mb": float(raw.get("max-mb", 256)),
+            "timeout-s": float(raw.get("timeout-s", 0.5)),
+            "autostart": bool(raw.get("autostart", True)),
+            "idle-exit-s": float(raw.get("idle-exit-s", 60)),
+            "breaker-sync-s": float(raw.get("breaker-sync-s", 1)),
+        }
+
+    @cached_property
+    def IMAGE_FETCH(self) -> Dict[str, Any]:
+        # VLM image_url fetching for Ollama native /api/chat (serving.image-fetch).
+        raw = self.serving.get("image-fetch", {})
+        raw = raw if isinstance(raw, dict) else {}
+        return {
+            "max-concurrency": int(raw.get("max-concurrency", 8)),
+            "max-mb": float(raw.get("max-mb", 20)),
+            "timeout-s": float(raw.get("timeout-s", 30)),
+            "cache-max-mb": float(raw.get("cache-max-mb", 256)),
+            "cache-ttl-s": float(raw.get("cache-ttl-s", 300)),
+        }
+
+    @cached_property
+    def IMAGE_PREPROCESS(self) -> Dict[str, Any]:
+        # Gateway-side image downscale/re-encode (serving.image-preprocess).
+        # enabled: auto -> only on Jetson (host.platform=js), like the frame optimizer.
+        raw = self.serving.get("image-preprocess", {})
+        raw = raw if isinstance(raw, dict) else {}
+        enabled = raw.get("enabled", "auto")
+        if not isinstance(enabled, bool):
+            enabled = self.HOST_PLATFORM == "js"
+        return {
+            "enabled": enabled,
+            "max-edge": int(raw.get("max-edge", 1024)),
+            "format": str(raw.get("format", "jpeg")).strip().lower(),
+            "quality": int(raw.get("quality", 85)),
+            "executor": str(raw.get("executor", "thread")).strip().lower(),
+            "workers": int(raw.get("workers", 2)),
+        }
+
+    @cached_property
+    def OLLAMA_PROBE(self) -> Dict[str, Any]:
+        # Ollama capability probing (serving.ollama-probe): routes, version, loaded models.
+        raw = self.serving.get("ollama-probe", {})
+        raw = raw if isinstance(raw, dict) else {}
+        return {
+            "enabled": bool(raw.get("enabled", True)),
+            "interval-s": float(raw.get("interval-s", 60)),
+            "timeout-s": float(raw.get("timeout-s", 3)),
+        }
+
+    @cached_property
+    def OLLAMA_RESIDENCY(self) -> Dict[str, Any]:
+        # Ollama model warm-up / keep_alive / pinning (serving.ollama-residency).
+        # Per-model: params keep-alive, preload, pin.
+        raw = self.serving.get("ollama-residency", {})
+        raw = raw if isinstance(raw, dict) else {}
+        return {
+            "enabled": bool(raw.get("enabled", True)),
+            "default-keep-alive": raw.get("default-keep-alive"),
+            "interval-s": float(raw.get("interval-s", 30)),
+            "load-timeout-s": float(raw.get("load-timeout-s", 300)),
+        }
+
+    @cached_property
+    def ADMISSION(self) -> Dict[str, Any]:
+        # Chat admission control (serving.admission). Per-model limits live in models[*].params.
+        raw = self.serving.get("admission", {})
+        raw = raw if isinstance(raw, dict) else {}
+        engines = raw.get("engines", {})
+        engines = engines if isinstance(engines, dict) else {}
+        return {
+            "queue-timeout-s": float(raw.get("queue-timeout-s", 30)),
+            "engines": {
+                str(name).strip().lower(): {
+                    "max-concurrency": int(limits.get("max-concurrency", 0)),
+                    "max-queue": int(limits.get("max-queue", 0)),
+                    # Serve one model at a time, switching at most every affinity-max-wait-s.
+                    "model-affinity": bool(limits.get("model-affinity", False)),
+                    "affinity-max-wait-s": float(limits.get("affinity-max-wait-s", 10)),
+                }
+                for name, limits in engines.items()
+                if isinstance(limits, dict)
+            },
+        }
+
+    @cached_property
+    def SCHEDULING(self) -> Dict[str, Any]:
+        # Tenant/priority-class fair scheduling of chat requests (serving.scheduling).
+        raw = self.serving.get("scheduling", {})
+        raw = raw if isinstance(raw, dict) else {}
+        classes = raw.get("classes")
+        if not isinstance(classes, dict) or not classes:
+            classes = {"interactive": {"weight": 8}, "batch": {"weight": 1}}
+        classes = {
+            str(name).strip().lower(): {"weight": float((c or {}).get("weight", 1)) if isinstance(c, dict) else float(c)}
+            for name, c in classes.items()
+        }
+        default_class = str(raw.get("default-class", next(iter(classes)))).strip().lower()
+        api_keys = raw.get("api-keys", {})
+        api_keys = {str(k): dict(v) for k, v in api_keys.items() if isinstance(v, dict)} if isinstance(api_keys, dict) else {}
+        return {
+            "classes": classes,
+            "default-class": default_class if default_class in classes else next(iter(classes)),
+            "class-header": str(raw.get("class-header", "X-Priority")),
+            "tenant-header": str(raw.get("tenant-header", "X-Tenant")),
+            "tenant-max-inflight": int(raw.get("tenant-max-inflight", 0)),
+            "tenant-max-queue": int(raw.get("tenant-max-queue", 16)),
+            "api-keys": api_keys,
+        }
+
+    @cached_property
+    def RESPONSE_CACHE(self) -> Dict[str, Any]:
+        # Deterministic chat completion cache (serving.response-cache).
+        # Per-model override: params response-cache (bool), response-cache-ttl-s.
+        raw = self.serving.get("response-cache", {})
+        raw = raw if isinstance(raw, dict) else {}
+        return {
+            "enabled": bool(raw.get("enabled", False)),
+            "max-entries": int(raw.get("max-entries", 1024)),
+            "ttl-s": float(raw.get("ttl-s", 300)),
+        }
+
+    @cached_property
     def MODEL_ALIASES(self) -> Dict[str, str]:
         aliases = self.data.get("model-aliases", {})
         out = dict(aliases) if isinstance(aliases, dict) else {}
@@ -230,6 +462,68 @@ class AppConfig:
         embedding = self.data.get("embedding", {}) or {}
         return bool(embedding.get("enabled", False))
 
+    @cached_property
+    def EMBEDDING_BATCHING(self) -> Dict[str, Any]:
+        # Micro-batching of concurrent requests for the in-process embedding model.
+        embedding = self.data.get("embedding", {}) or {}
+        raw = embedding.get("batching", {})
+        raw = raw if isinstance(raw, dict) else {}
+        return {
+            "enabled": bool(raw.get("enabled", True)),
+            "max-batch-size": int(raw.get("max-batch-size", 32)),
+            "max-wait-ms": float(raw.get("max-wait-ms", 5)),
+        }
+
+    @cached_property
+    def EMBEDDING_CACHE(self) -> Dict[str, Any]:
+        # Content-addressed vector cache in front of the embedding engine.
+        embedding = self.data.get("embedding", {}) or {}
+        raw = embedding.get("cache", {})
+        raw = raw if isinstance(raw, dict) else {}
+        disk_path = raw.get("disk-path")
+        return {
+            "enabled": bool(raw.get("enabled", True)),
+            "max-entries": int(raw.get("max-entries", 10000)),
+            "disk-path": str(disk_path) if isinstance(disk_path, str) and disk_path.strip() else None,
+            "disk-max-mb": int(raw.get("disk-max-mb", 1024)),
+        }
+
+
+_active_config = AppConfig()
+# Pins the config snapshot for the current request/task (see use_config).
+_scoped_config: ContextVar[Optional[AppConfig]] = ContextVar("vilms_scoped_config", default=None)
+
+
+def current_config() -> AppConfig:
+    return _scoped_config.get() or _active_config
+
+
+def set_active_config(cfg: AppConfig) -> AppConfig:
+    """Atomically make `cfg` the snapshot seen by new requests. Returns the previous one."""
+    global _active_config
+    previous, _active_config = _active_config, cfg
+    return previous
+
+
+@contextmanager
+def use_config(cfg: AppConfig):
+    """Read `settings` from `cfg` inside this block (and tasks/threads spawned from it)."""
+    token = _scoped_config.set(cfg)
+    try:
+        yield cfg
+    finally:
+        _scoped_config.reset(token)
+
+
+class _ConfigProxy:
+    """`settings` forwards to the snapshot pinned for this request, else the active one."""
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(current_config(), name)
+
+    def __repr__(self) -> str:
+        return f"<settings -> {current_config().path}>"
+
 
-config = AppConfig()
+config = _ConfigProxy()
 settings = config
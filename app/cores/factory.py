@@ -1,23 +1,209 @@
 # app/factory.py
-from app.config import settings
+import asyncio
+from typing import Optional
+
+from app.config import AppConfig, current_config, settings, use_config
 from app.engines.ollama_engine import OllamaEngine
 from app.engines.vllm_engine import VLLMEngine
-from app.engines.embedding_engine import HFEmbeddingEngine, RemoteEmbeddingEngine
+from app.engines.embedding_engine import CachedEmbeddingEngine, HFEmbeddingEngine, RemoteEmbeddingEngine
+from app.services.admission import AdmissionController
+from app.services.coalescer import SingleFlight
+from app.services.embedding_cache import EmbeddingCache
+from app.services.ollama_probe import root_url
+from app.services.readiness import ReadinessMonitor, http_probe
+from app.services.response_cache import ResponseCache
+from app.services.shared_state import build_shared_state
 
 
 class EngineFactory:
-    def __init__(self):
+    def __init__(self, config: Optional[AppConfig] = None, previous: Optional["EngineFactory"] = None):
+        # Each factory is bound to one config snapshot; hot reload builds a new factory.
+        self.config = config or current_config()
+        self.inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        with use_config(self.config):
+            self._build_engines(previous)
+            # Admission state is carried across reloads so in-flight/queued requests stay counted.
+            # New limits are applied by activate(), once the reload commits.
+            self.admission = previous.admission if previous is not None else AdmissionController()
+            self.coalescer = previous.coalescer if previous is not None else SingleFlight()
+            cache_cfg = settings.RESPONSE_CACHE
+            if previous is not None and previous.config.RESPONSE_CACHE == cache_cfg:
+                self.response_cache = previous.response_cache
+            else:
+                self.response_cache = ResponseCache(cache_cfg["max-entries"], cache_cfg["ttl-s"])
+            # Like the balancer, the sidecar connection outlives reloads unless its config changes.
+            if previous is not None and previous.config.SHARED_STATE == settings.SHARED_STATE:
+                self.shared = previous.shared
+            else:
+                self.shared = build_shared_state(settings.SHARED_STATE)
+            self.readiness = self._build_readiness(previous)
+        if previous is None:
+            self.activate()
+
+    def activate(self) -> None:
+        """
+        Apply this snapshot to state carried over from the previous factory
+        (admission limits, balancer policy, shared-state hooks). Hot reload calls
+        it only after the swap commits, so a rejected reload leaves them untouched.
+        """
+        with use_config(self.config):
+            self.admission.configure(settings.ADMISSION, settings.models, settings.SCHEDULING)
+            self.vllm.balancer.policy = settings.LOAD_BALANCING["policy"]
+            self._attach_shared()
+
+    def _attach_shared(self) -> None:
+        """Point admission, caches and breakers at the host-wide state (or detach them)."""
+        self.admission.shared = self.shared
+        self.response_cache.shared = self.shared
+        if isinstance(self.embedding, CachedEmbeddingEngine):
+            self.embedding.shared = self.shared
+        if self.shared is not None:
+            self.shared.watch_breakers(self._healths())
+        else:
+            for health in self._healths().values():
+                health.on_change = None
+
+    def _build_readiness(self, previous: Optional["EngineFactory"]) -> ReadinessMonitor:
+        """Warm-up steps and probes for the chat engines that serve a model, and the embedding engine."""
+        cfg = settings.READINESS
+        timeout_s = cfg["timeout-s"]
+        chat = {settings.engine.strip().lower()} | {settings.routing.engine_for(m["name"]) for m in settings.models}
+        probes, warmups = {}, {}
+        if "ollama" in chat:
+            urls = [root_url(u, "/api/version") for u in self.ollama.candidate_urls]
+            probes["ollama"] = http_probe(lambda: self.ollama.client, urls, timeout_s)
+        if "vllm" in chat:
+            urls = [root_url(u, "/health") for u in self.vllm.candidate_base_urls]
+            probes["vllm"] = http_probe(lambda: self.vllm.client, urls, timeout_s)
+        embedding = self.embedding.engine if isinstance(self.embedding, CachedEmbeddingEngine) else self.embedding
+        if isinstance(embedding, RemoteEmbeddingEngine):
+            urls = [root_url(u, "/health") for u in embedding.candidate_urls]
+            probes["embedding"] = http_probe(lambda: embedding.client, urls, timeout_s)
+        elif isinstance(embedding, HFEmbeddingEngine):
+            warmup = cfg["warmup"]
+
+            async def model_loaded():
+                if embedding.model is not None:
+                    return f"{embedding.model_name} loaded"
+                if warmup:
+                    raise RuntimeError(f"{embedding.model_name} is not loaded yet")
+                return f"{embedding.model_name} loads on first request (serving.readiness.warmup is off)"
+
+            probes["embedding"] = model_loaded
+            # A reload that kept the engine (same embedding config) keeps its loaded model:
+            # no second warm-up, so /ready does not drop to 503 on every reload.
+            reused = previous is not None and previous.embedding is self.embedding
+            if warmup and not (reused and embedding.model is not None):
+                warmups["embedding"] = embedding.warmup
+        return ReadinessMonitor(
+            probes,
+            warmups,
+            interval_s=cfg["interval-s"],
+            timeout_s=timeout_s,
+            require=cfg["require"],
+            previous=previous.readiness if previous is not None else None,
+        )
+
+    def _healths(self) -> dict:
+        out = {}
+        for name, engine in (("ollama", self.ollama), ("vllm", self.vllm), ("embedding", self.embedding)):
+            health = getattr(engine, "health", None)
+            if health is not None:
+                out[name] = health
+        return out
+
+    @staticmethod
+    def _embedding_signature(cfg: AppConfig):
+        return (cfg.get("embedding"), cfg.HTTP_CLIENT, cfg.ENDPOINT_HEALTH)
+
+    def _build_engines(self, previous: Optional["EngineFactory"]) -> None:
         self.ollama = OllamaEngine(settings.OLLAMA_BASE_URL)
-        self.vllm = VLLMEngine()
-        if settings.EMBEDDING_ENABLED:
+        self.vllm = VLLMEngine(balancer=previous.vllm.balancer if previous is not None else None)
+        if (
+            previous is not None
+            and previous.embedding is not None
+            and self._embedding_signature(previous.config) == self._embedding_signature(self.config)
+        ):
+            # Unchanged embedding config: keep the loaded model, batcher and warm cache across reloads.
+            self.embedding = previous.embedding
+        elif settings.EMBEDDING_ENABLED:
             self.embedding = (
                 RemoteEmbeddingEngine(settings.EMBEDDING_BASE_URL)
                 if getattr(settings, "EMBEDDING_BASE_URL", "").strip()
                 else HFEmbeddingEngine()
             )
+            cache_cfg = settings.EMBEDDING_CACHE
+            if cache_cfg["enabled"]:
+                cache = EmbeddingCache(
+                    max_entries=cache_cfg["max-entries"],
+                    disk_path=cache_cfg["disk-path"],
+                    disk_max_bytes=cache_cfg["disk-max-mb"] * 1024 * 1024,
+                )
+                self.embedding = CachedEmbeddingEngine(self.embedding, cache)
         else:
             self.embedding = None
 
+    @property
+    def chat_engines(self):
+        return [self.ollama, self.vllm]
+
+    @property
+    def managed_engines(self):
+        engines = list(self.chat_engines)
+        if self.embedding is not None and hasattr(self.embedding, "startup"):
+            engines.append(self.embedding)
+        return engines
+
+    async def startup(self) -> None:
+        """Open the pooled upstream clients. Called from the FastAPI startup hook."""
+        with use_config(self.config):
+            for engine in self.managed_engines:
+                await engine.startup()
+            if self.shared is not None:
+                await self.shared.startup()
+        # Background: startup is never delayed; GET /ready says when warm-up is done.
+        self.readiness.start()
+
+    async def aclose(self, keep=(), keep_shared=None) -> None:
+        """Close engines and pools, except those handed over to a newer factory in `keep`."""
+        await self.readiness.aclose()
+        kept = {id(engine) for engine in keep}
+        for engine in self.managed_engines:
+            if id(engine) not in kept:
+                await engine.aclose()
+        if self.shared is not None and self.shared is not keep_shared:
+            await self.shared.aclose()
+
+    # ---------- In-flight tracking (lets hot reload drain the old snapshot) ----------
+    def begin(self) -> None:
+        self.inflight += 1
+        self._idle.clear()
+
+    def end(self) -> None:
+        self.inflight = max(0, self.inflight - 1)
+        if self.inflight == 0:
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until no request is using this factory. Returns False on timeout."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def endpoint_health(self) -> dict:
+        """Per-engine candidate URL health (sticky preference + circuit state)."""
+        out = {}
+        for name, health in self._healths().items():
+            out[name] = health.snapshot()
+            balancer = getattr(getattr(self, name), "balancer", None)
+            if balancer is not None:
+                out[name]["balancer"] = {"policy": balancer.policy, "replicas": balancer.snapshot()}
+        return out
+
     def get_engine(self, name: str):
         engine = (name or "").strip().lower()
         if engine == "ollama":
@@ -26,49 +212,18 @@ class EngineFactory:
             return self.vllm
         raise ValueError(f"Unsupported engine: {name}")
 
+    @property
+    def routing(self):
+        # This factory's own snapshot, whatever config the caller's context points at.
+        return self.config.routing
+
     def resolve_chat_engine_name(self, model: str) -> str:
-        """
-        Decide which engine should handle a chat completion.
-
-        Priority:
-        - Global serving.engine=ollama -> force ollama
-        - Jetson -> prefer ollama
-        - Per-model engine override in config (serving.models[*].engine)
-        - Per-model type=vlm -> ollama
-        - Fallback legacy heuristic on model name ("vl")
-        - Default -> vllm
-        """
-        model = model or ""
-        model_cfg = settings.find_model(model)
-
-        # If user config chooses ollama engine, force route to ollama
-        if getattr(settings, "ENGINE", "").lower() == "ollama":
-            return "ollama"
-
-        # Jetson: prefer Ollama for both LLM and VLM
-        if settings.HOST_PLATFORM == "js":
-            return "ollama"
-
-        if isinstance(model_cfg, dict):
-            model_engine = (model_cfg.get("engine") or "").strip().lower()
-            if model_engine in {"ollama", "vllm"}:
-                return model_engine
-
-        if isinstance(model_cfg, dict):
-            model_type = (model_cfg.get("type") or "").strip().lower()
-            if model_type == "vlm":
-                return "ollama"
-            if model_type == "llm":
-                return "vllm"
-
-        # Backward-compatible fallback when model metadata is absent
-        if "VL" in model or "vl" in model:
-            return "ollama"
-        return "vllm"
+        """Engine name for a chat model, pre-resolved in the routing index (see choose_engine)."""
+        return self.routing.engine_for(model)
 
     def resolve_chat_engine(self, model: str):
         return self.get_engine(self.resolve_chat_engine_name(model))
 
     def map_model_alias(self, model: str) -> str:
         # Resolve chained aliases, e.g. LLM -> Qwen3-4B-Instruct -> qwen3:4b-instruct
-        return settings.resolve_alias(model)
+        return self.routing.resolve_alias(model)
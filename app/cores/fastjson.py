@@ -0,0 +1,76 @@
+# app/cores/fastjson.py
+"""
+JSON helpers for the chat hot path.
+
+Uses orjson when installed (falls back to the stdlib encoder), and can rewrite
+the top-level `model` of an upstream chat.completion body without decoding it.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib fallback
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson; returning it skips FastAPI's jsonable_encoder pass."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+_MODEL_FIELD = re.compile(rb'"model"\s*:\s*"(?:[^"\\]|\\.)*"')
+
+
+def rewrite_model(body: bytes, model: str) -> Optional[bytes]:
+    """
+    Replace the top-level "model" string of an OpenAI chat.completion body.
+
+    Only the bytes before "choices" are searched (vLLM emits id/object/created/model
+    first), so generated text can never match. Returns None when the body does not
+    look like that (no "choices", or no "model" before it); callers then fall back
+    to decoding it.
+    """
+    if body[:64].lstrip()[:1] != b"{":
+        return None
+    end = body.find(b'"choices"')
+    if end < 0:
+        return None
+    match = _MODEL_FIELD.search(body, 0, end)
+    if match is None:
+        return None
+    return b"".join((body[:match.start()], b'"model":', dumps(model), body[match.end():]))
+
+
+def usage_from_body(body: bytes) -> Optional[dict]:
+    """The trailing `usage` object of a chat.completion body, decoding only that object."""
+    i = body.rfind(b'"usage"')
+    if i < 0:
+        return None
+    start = body.find(b"{", i)
+    if start < 0 or body[i + len(b'"usage"'):start].strip() != b":":
+        return None
+    try:
+        usage, _ = json.JSONDecoder().raw_decode(body[start:].decode("utf-8"))
+    except ValueError:
+        return None
+    return usage if isinstance(usage, dict) else None
@@ -0,0 +1,66 @@
+# app/cores/http_client.py
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger("vilms-gateway")
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def build_async_client(options: Optional[Dict[str, Any]] = None) -> httpx.AsyncClient:
+    """
+    Build a pooled upstream client from serving.http-client.
+
+    One client is kept per engine for the whole process lifetime so keep-alive
+    connections to Ollama / vLLM are reused across requests.
+    """
+    opts = dict(settings.HTTP_CLIENT)
+    if options:
+        opts.update(options)
+
+    timeout = httpx.Timeout(opts["timeout"], connect=opts["connect-timeout"])
+    limits = httpx.Limits(
+        max_connections=opts["max-connections"],
+        max_keepalive_connections=opts["max-keepalive-connections"],
+        keepalive_expiry=opts["keepalive-expiry"],
+    )
+
+    http2 = bool(opts.get("http2"))
+    if http2 and not _h2_available():
+        logger.warning("serving.http-client.http2=true but 'h2' is not installed. Falling back to HTTP/1.1.")
+        http2 = False
+
+    return httpx.AsyncClient(timeout=timeout, limits=limits, http2=http2)
+
+
+class PooledClientMixin:
+    """Owns one lazily created, lifecycle-managed upstream client per instance."""
+
+    _client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created at app startup; lazily (re)created if used before startup or after close.
+        if self._client is None or self._client.is_closed:
+            self._client = build_async_client()
+        return self._client
+
+    async def startup(self) -> None:
+        _ = self.client
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
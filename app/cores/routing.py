@@ -0,0 +1,176 @@
+# app/cores/routing.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+
+def _follow_alias_chain(model: str, aliases: Mapping[str, str]) -> str:
+    current = model
+    seen = set()
+
+    while isinstance(current, str) and current in aliases and current not in seen:
+        seen.add(current)
+        nxt = aliases.get(current)
+        if not isinstance(nxt, str) or not nxt or nxt == current:
+            break
+        current = nxt
+    return current
+
+
+def _scan_models(requested: str, canonical: str, models: Iterable[Mapping[str, Any]]) -> Optional[Mapping[str, Any]]:
+    for m in models:
+        name = str(m.get("name", "")).strip()
+        if not name:
+            continue
+        if requested == name or canonical == name:
+            return m
+        aliases = m.get("aliases", ())
+        if requested in aliases or canonical in aliases:
+            return m
+    return None
+
+
+def choose_engine(model: str, model_cfg: Optional[Mapping[str, Any]], engine: str, host_platform: str) -> str:
+    """
+    Decide which engine should handle a chat completion.
+
+    Priority:
+    - Global serving.engine=ollama -> force ollama
+    - Jetson -> prefer ollama
+    - Per-model engine override in config (serving.models[*].engine)
+    - Per-model type=vlm -> ollama
+    - Fallback legacy heuristic on model name ("vl")
+    - Default -> vllm
+    """
+    model = model or ""
+
+    # If user config chooses ollama engine, force route to ollama
+    if (engine or "").lower() == "ollama":
+        return "ollama"
+
+    # Jetson: prefer Ollama for both LLM and VLM
+    if host_platform == "js":
+        return "ollama"
+
+    if model_cfg is not None:
+        model_engine = (model_cfg.get("engine") or "").strip().lower()
+        if model_engine in {"ollama", "vllm"}:
+            return model_engine
+
+        model_type = (model_cfg.get("type") or "").strip().lower()
+        if model_type == "vlm":
+            return "ollama"
+        if model_type == "llm":
+            return "vllm"
+
+    # Backward-compatible fallback when model metadata is absent
+    if "VL" in model or "vl" in model:
+        return "ollama"
+    return "vllm"
+
+
+def _freeze_model(m: Mapping[str, Any]) -> Mapping[str, Any]:
+    m2 = dict(m)
+    if isinstance(m2.get("params"), dict):
+        m2["params"] = MappingProxyType(dict(m2["params"]))
+    m2["aliases"] = tuple(m2.get("aliases") or ())
+    m2["replicas"] = tuple(m2.get("replicas") or ())
+    return MappingProxyType(m2)
+
+
+@dataclass(frozen=True)
+class Route:
+    requested: str
+    canonical: str
+    model: Optional[Mapping[str, Any]]
+    engine: str
+
+
+class RoutingIndex:
+    """
+    Immutable alias/model/engine lookup table compiled once from config.
+
+    Alias chains are flattened, model metadata is indexed by every requested name,
+    alias and canonical name, and the chat engine is pre-resolved per known name,
+    so per-request routing is a couple of dict lookups.
+    """
+
+    __slots__ = ("engine", "host_platform", "_aliases", "_routes")
+
+    def __init__(
+        self,
+        aliases: Optional[Mapping[str, str]] = None,
+        models: Optional[List[Mapping[str, Any]]] = None,
+        engine: str = "ollama",
+        host_platform: str = "dgpu",
+    ):
+        raw_aliases: Dict[str, str] = dict(aliases or {})
+        frozen_models = [_freeze_model(m) for m in (models or []) if isinstance(m, Mapping)]
+        self.engine = engine
+        self.host_platform = host_platform
+
+        # Local serving.models[*].aliases fill in whatever the global block does not define.
+        for m in frozen_models:
+            name = m.get("name")
+            if not isinstance(name, str) or not name:
+                continue
+            for alias in m.get("aliases", ()):
+                if alias not in raw_aliases:
+                    raw_aliases[alias] = name
+
+        names = set(raw_aliases)
+        for m in frozen_models:
+            if m.get("name"):
+                names.add(m["name"])
+            names.update(m.get("aliases", ()))
+
+        self._aliases: Mapping[str, str] = MappingProxyType(
+            {name: _follow_alias_chain(name, raw_aliases) for name in raw_aliases}
+        )
+        routes: Dict[str, Route] = {}
+        for name in names:
+            canonical = self._aliases.get(name, name)
+            model_cfg = _scan_models(name, canonical, frozen_models)
+            routes[name] = Route(name, canonical, model_cfg, choose_engine(name, model_cfg, engine, host_platform))
+        self._routes: Mapping[str, Route] = MappingProxyType(routes)
+
+    @classmethod
+    def from_config(cls, cfg) -> "RoutingIndex":
+        aliases = cfg.data.get("model-aliases", {})
+        return cls(
+            aliases=aliases if isinstance(aliases, dict) else {},
+            models=cfg.models,
+            engine=cfg.ENGINE,
+            host_platform=cfg.HOST_PLATFORM,
+        )
+
+    @property
+    def aliases(self) -> Mapping[str, str]:
+        """Flattened alias map: every alias points at its final target."""
+        return self._aliases
+
+    def resolve_alias(self, model: str) -> str:
+        return self._aliases.get(model, model)
+
+    def route(self, model: str) -> Route:
+        requested = model.strip() if isinstance(model, str) else ""
+        found = self._routes.get(requested)
+        if found is not None:
+            return found
+        # Unknown names are routed on the fly and not cached (user input is unbounded).
+        return Route(requested, requested, None, choose_engine(model or "", None, self.engine, self.host_platform))
+
+    def find_model(self, model: str) -> Optional[Mapping[str, Any]]:
+        """Find model metadata by requested name, alias, or canonical name."""
+        if not isinstance(model, str) or not model.strip():
+            return None
+        found = self._routes.get(model.strip())
+        return found.model if found is not None else None
+
+    def engine_for(self, model: str) -> str:
+        found = self._routes.get(model) if isinstance(model, str) else None
+        if found is not None:
+            return found.engine
+        return choose_engine(model or "", None, self.engine, self.host_platform)
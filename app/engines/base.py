@@ -1,7 +1,36 @@
 # app/engines/base.py
+import json
 from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Optional
+
+import httpx
+
+from app.cores.http_client import PooledClientMixin
+
+
+SSE_DONE = b"data: [DONE]\n\n"
+
+
+def sse_event(data: Any) -> bytes:
+    """Encode one OpenAI-style server-sent event."""
+    return b"data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n\n"
+
+
+class BaseViLMSEngine(PooledClientMixin, ABC):
+    async def _open_stream(self, url: str, json_body: dict) -> httpx.Response:
+        """POST and return the response with its body left unread (caller must aclose it)."""
+        request = self.client.build_request("POST", url, json=json_body)
+        resp = await self.client.send(request, stream=True)
+        if resp.is_error:
+            await resp.aread()
+            await resp.aclose()
+            resp.raise_for_status()
+        return resp
 
-class BaseViLMSEngine(ABC):
     @abstractmethod
     async def chat_completion(self, payload: dict):
         pass
+
+    def chat_completion_stream(self, payload: dict, response_model: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Yield OpenAI `chat.completion.chunk` SSE bytes, ending with `data: [DONE]`."""
+        raise NotImplementedError(f"{type(self).__name__} does not support streaming")
@@ -1,10 +1,18 @@
 # app/engines/embedding_engine.py
+import asyncio
+from array import array
 from typing import List, Optional
 from urllib.parse import urlparse, urlunparse
 
 import httpx
 
 from app.config import settings
+from app.cores.http_client import PooledClientMixin
+from app.services.batcher import MicroBatcher
+from app.services.embedding_cache import EmbeddingCache, embedding_cache_key
+from app.services import metrics
+from app.services.endpoint_health import build_endpoint_health
+from app.services.shared_state import SharedStateUnavailable
 
 
 class _BaseEmbeddingEngine:
@@ -12,9 +20,30 @@ class _BaseEmbeddingEngine:
         raise NotImplementedError
 
 
-class HFEmbeddingEngine(_BaseEmbeddingEngine):
+class _BaseAsyncEmbeddingEngine(_BaseEmbeddingEngine):
+    """Embedding engine usable from async routes without holding a threadpool slot for I/O."""
+
+    # Whether returned vectors are L2-normalized (part of the cache key).
+    normalize: bool = False
+
+    def resolve_model_name(self, model_name: Optional[str] = None) -> str:
+        return str(model_name or "")
+
+    async def aembed(self, inputs: List[str], model_name: Optional[str] = None) -> List[List[float]]:
+        raise NotImplementedError
+
+    async def startup(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+
+class HFEmbeddingEngine(_BaseAsyncEmbeddingEngine):
+    normalize = True
+
     def __init__(self):
-        aliases = settings.MODEL_ALIASES
+        aliases = settings.routing.aliases
         self.model_name = self._resolve_alias(
             aliases.get("Embedding")
             or aliases.get("Embbeding")
@@ -25,18 +54,21 @@ class HFEmbeddingEngine(_BaseEmbeddingEngine):
         )
         self.model = None
 
+        batching = settings.EMBEDDING_BATCHING
+        self.batcher: Optional[MicroBatcher] = None
+        if batching["enabled"]:
+            self.batcher = MicroBatcher(
+                self.embed,
+                max_batch_size=batching["max-batch-size"],
+                max_wait_ms=batching["max-wait-ms"],
+            )
+
     def _resolve_alias(self, model_name: str) -> str:
-        current = model_name
-        seen = set()
-        aliases = settings.MODEL_ALIASES
-
-        while isinstance(current, str) and current in aliases and current not in seen:
-            seen.add(current)
-            nxt = aliases.get(current)
-            if not isinstance(nxt, str) or not nxt or nxt == current:
-                break
-            current = nxt
-        return current
+        return settings.routing.resolve_alias(model_name)
+
+    def resolve_model_name(self, model_name: Optional[str] = None) -> str:
+        # The in-process engine always serves the configured model.
+        return self.model_name
 
     def _ensure_model(self):
         if self.model is not None:
@@ -55,8 +87,23 @@ class HFEmbeddingEngine(_BaseEmbeddingEngine):
         vecs = model.encode(inputs, normalize_embeddings=True)
         return vecs.tolist()
 
+    async def warmup(self) -> None:
+        """Load the model and run one encode off the event loop, so the first request does not pay for it."""
+        await asyncio.to_thread(self.embed, ["warm-up"])
+
+    async def aembed(self, inputs: List[str], model_name: Optional[str] = None) -> List[List[float]]:
+        # In-process model is CPU/GPU bound; keep it off the event loop.
+        # With batching on, concurrent requests share one encode() call.
+        if self.batcher is not None:
+            return await self.batcher.submit(inputs)
+        return await asyncio.to_thread(self.embed, inputs, model_name)
 
-class RemoteEmbeddingEngine(_BaseEmbeddingEngine):
+    async def aclose(self) -> None:
+        if self.batcher is not None:
+            await self.batcher.aclose()
+
+
+class RemoteEmbeddingEngine(PooledClientMixin, _BaseAsyncEmbeddingEngine):
     def __init__(self, base_url: str):
         base = (base_url or "").rstrip("/")
         if base.endswith("/v1/embeddings"):
@@ -64,6 +111,7 @@ class RemoteEmbeddingEngine(_BaseEmbeddingEngine):
         else:
             self.url = f"{base}/v1/embeddings"
         self.candidate_urls = self._build_candidate_urls(self.url)
+        self.health = build_endpoint_health(self.candidate_urls, engine="embedding")
         self.default_model_name = (
             settings.EMBEDDING_MODEL
             or "Qwen/Qwen3-Embedding-4B"
@@ -94,39 +142,182 @@ class RemoteEmbeddingEngine(_BaseEmbeddingEngine):
                 deduped.append(u)
         return deduped
 
-    def embed(self, inputs: List[str], model_name: Optional[str] = None) -> List[List[float]]:
-        payload = {
+    def resolve_model_name(self, model_name: Optional[str] = None) -> str:
+        return model_name or self.default_model_name
+
+    @staticmethod
+    def _parse_response(data: dict) -> List[List[float]]:
+        items = data.get("data")
+        if not isinstance(items, list):
+            raise RuntimeError("Invalid embedding response: missing 'data' list")
+        out: List[List[float]] = []
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or not isinstance(item.get("embedding"), list):
+                raise RuntimeError(f"Invalid embedding response at data[{i}]")
+            out.append(item["embedding"])
+        return out
+
+    def _raise_unreachable(self, tried: List[str], last_http_error: Optional[httpx.HTTPStatusError]):
+        if last_http_error is not None:
+            raise RuntimeError(str(last_http_error)) from last_http_error
+        raise RuntimeError(
+            "Cannot connect to embedding backend. Tried: " + ", ".join(tried) +
+            ". Configure embedding.base-url to either localhost or vilms-* service host depending on runtime."
+        )
+
+    def _build_payload(self, inputs: List[str], model_name: Optional[str]) -> dict:
+        return {
             "model": model_name or self.default_model_name,
             "input": inputs,
         }
 
+    async def aembed(self, inputs: List[str], model_name: Optional[str] = None) -> List[List[float]]:
+        payload = self._build_payload(inputs, model_name)
+
         tried = []
         last_http_error = None
-        with httpx.Client(timeout=300) as client:
-            for url in self.candidate_urls:
+        for url in self.health.candidates():
+            if not self.health.allow(url):
+                tried.append(f"{url} (circuit open)")
+                continue
+            tried.append(url)
+            try:
+                with metrics.span("upstream"):
+                    resp = await self.client.post(url, json=payload)
+                # The host answered; only transport failures count against it.
+                self.health.record_success(url)
+                resp.raise_for_status()
+                return self._parse_response(resp.json())
+            except httpx.RequestError as e:
+                self.health.record_failure(url, e)
+                continue
+            except httpx.HTTPStatusError as e:
+                self.health.record_http_error(url, e)
+                last_http_error = e
+                continue
+
+        self._raise_unreachable(tried, last_http_error)
+
+    def embed(self, inputs: List[str], model_name: Optional[str] = None) -> List[List[float]]:
+        # Blocking variant kept for scripts; the API route uses aembed().
+        payload = self._build_payload(inputs, model_name)
+
+        tried = []
+        last_http_error = None
+        with httpx.Client(timeout=settings.HTTP_CLIENT["timeout"]) as client:
+            for url in self.health.candidates():
+                if not self.health.allow(url):
+                    tried.append(f"{url} (circuit open)")
+                    continue
                 tried.append(url)
                 try:
                     resp = client.post(url, json=payload)
+                    self.health.record_success(url)
                     resp.raise_for_status()
-                    data = resp.json()
-                    items = data.get("data")
-                    if not isinstance(items, list):
-                        raise RuntimeError("Invalid embedding response: missing 'data' list")
-                    out: List[List[float]] = []
-                    for i, item in enumerate(items):
-                        if not isinstance(item, dict) or not isinstance(item.get("embedding"), list):
-                            raise RuntimeError(f"Invalid embedding response at data[{i}]")
-                        out.append(item["embedding"])
-                    return out
-                except httpx.RequestError:
+                    return self._parse_response(resp.json())
+                except httpx.RequestError as e:
+                    self.health.record_failure(url, e)
                     continue
                 except httpx.HTTPStatusError as e:
+                    self.health.record_http_error(url, e)
                     last_http_error = e
                     continue
 
-        if last_http_error is not None:
-            raise RuntimeError(str(last_http_error)) from last_http_error
-        raise RuntimeError(
-            "Cannot connect to embedding backend. Tried: " + ", ".join(tried) +
-            ". Configure embedding.base-url to either localhost or vilms-* service host depending on runtime."
-        )
+        self._raise_unreachable(tried, last_http_error)
+
+
+class CachedEmbeddingEngine(_BaseAsyncEmbeddingEngine):
+    """
+    Content-addressed cache in front of another embedding engine.
+
+    Only inputs missing from the cache are sent to the wrapped engine, once per
+    distinct text, and results are merged back in the original order.
+
+    With `shared` (a SharedStateClient) set, aembed() also consults and fills
+    the host-wide cache, so workers reuse each other's vectors.
+    """
+
+    shared = None
+
+    def __init__(self, engine: _BaseAsyncEmbeddingEngine, cache: EmbeddingCache):
+        self.engine = engine
+        self.cache = cache
+
+    def __getattr__(self, name):
+        # Expose wrapped engine attributes (model_name, batcher, ...) unchanged.
+        return getattr(self.engine, name)
+
+    @property
+    def normalize(self) -> bool:
+        return self.engine.normalize
+
+    def resolve_model_name(self, model_name: Optional[str] = None) -> str:
+        return self.engine.resolve_model_name(model_name)
+
+    def _lookup(self, inputs: List[str], model_name: Optional[str]):
+        resolved = self.resolve_model_name(model_name)
+        keys = [embedding_cache_key(resolved, self.normalize, text) for text in inputs]
+        vecs = self.cache.get_many(keys)
+        misses: dict = {}
+        for i, vec in enumerate(vecs):
+            if vec is None:
+                misses.setdefault(keys[i], []).append(i)
+        return vecs, misses
+
+    @staticmethod
+    def _as_stored(fresh: List[List[float]]) -> List[List[float]]:
+        # The cache keeps float32; hand back the same rounding on a miss so a hit returns identical vectors.
+        return [array("f", vec).tolist() for vec in fresh]
+
+    def _merge(self, vecs: list, misses: dict, fresh: List[List[float]]) -> List[List[float]]:
+        self.cache.put_many(list(zip(misses.keys(), fresh)))
+        for positions, vec in zip(misses.values(), fresh):
+            for i in positions:
+                vecs[i] = vec
+        return vecs
+
+    async def _lookup_shared(self, vecs: list, misses: dict) -> None:
+        """Fill local misses from the host-wide cache (float32 bytes under "emb:<digest>")."""
+        try:
+            found = await self.shared.cache_get(["emb:" + key.hex() for key in misses])
+        except SharedStateUnavailable:
+            return
+        hits = []
+        for key, entry in zip(list(misses), found):
+            if entry is None:
+                continue
+            vec = array("f", entry[0]).tolist()
+            hits.append((key, vec))
+            for i in misses.pop(key):
+                vecs[i] = vec
+        if hits:
+            self.cache.put_many(hits)
+
+    async def aembed(self, inputs: List[str], model_name: Optional[str] = None) -> List[List[float]]:
+        vecs, misses = self._lookup(inputs, model_name)
+        if misses and self.shared is not None:
+            await self._lookup_shared(vecs, misses)
+        if not misses:
+            return vecs
+        miss_inputs = [inputs[positions[0]] for positions in misses.values()]
+        fresh = self._as_stored(await self.engine.aembed(miss_inputs, model_name=model_name))
+        if self.shared is not None:
+            self.shared.cache_set_nowait(
+                ("emb:" + key.hex(), array("f", vec).tobytes(), 0.0) for key, vec in zip(misses, fresh)
+            )
+        return self._merge(vecs, misses, fresh)
+
+    def embed(self, inputs: List[str], model_name: Optional[str] = None) -> List[List[float]]:
+        vecs, misses = self._lookup(inputs, model_name)
+        if not misses:
+            return vecs
+        miss_inputs = [inputs[positions[0]] for positions in misses.values()]
+        fresh = self._as_stored(self.engine.embed(miss_inputs, model_name=model_name))
+        return self._merge(vecs, misses, fresh)
+
+    async def startup(self) -> None:
+        await self.engine.startup()
+
+    async def aclose(self) -> None:
+        await self.engine.aclose()
+        self.cache.close()
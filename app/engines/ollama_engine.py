@@ -1,9 +1,18 @@
 # app/engines/ollama_engine.py
-import base64
+import json
 import time
+from typing import AsyncIterator, List, Optional, Tuple
+
 import httpx
 from urllib.parse import urlparse, urlunparse
-from .base import BaseViLMSEngine
+from app.config import settings
+from app.cores import fastjson
+from app.services import metrics
+from app.services.endpoint_health import build_endpoint_health
+from app.services.image_fetcher import ImageFetcher
+from app.services.ollama_probe import OllamaProber
+from app.services.ollama_residency import OllamaResidency, residency_options
+from .base import BaseViLMSEngine, SSE_DONE, sse_event
 
 class OllamaEngine(BaseViLMSEngine):
     def __init__(self, base_url: str):
@@ -13,6 +22,67 @@ class OllamaEngine(BaseViLMSEngine):
         else:
             self.url = f"{base}/v1/chat/completions"
         self.candidate_urls = self._build_candidate_urls(self.url)
+        self.health = build_endpoint_health(self.candidate_urls, engine="ollama")
+        self.image_fetcher = ImageFetcher.from_settings()
+        probe_cfg = settings.OLLAMA_PROBE
+        self.prober = (
+            OllamaProber(
+                self.candidate_urls,
+                get_client=lambda: self.client,
+                interval_s=probe_cfg["interval-s"],
+                timeout_s=probe_cfg["timeout-s"],
+            )
+            if probe_cfg["enabled"]
+            else None
+        )
+        residency_cfg = settings.OLLAMA_RESIDENCY
+        self.residency = (
+            OllamaResidency(
+                {
+                    m["name"]: residency_options(m, residency_cfg["default-keep-alive"])
+                    for m in settings.models
+                    if m["name"] and settings.routing.engine_for(m["name"]) == "ollama"
+                },
+                get_candidates=lambda: self._protocol_candidates()[0] or self.health.candidates(),
+                get_client=lambda: self.client,
+                interval_s=residency_cfg["interval-s"],
+                load_timeout_s=residency_cfg["load-timeout-s"],
+            )
+            if residency_cfg["enabled"]
+            else None
+        )
+
+    async def startup(self) -> None:
+        await super().startup()
+        # Background tasks, so a slow/unreachable host (or a long model load) never delays startup.
+        if self.prober is not None:
+            self.prober.start()
+        if self.residency is not None:
+            self.residency.start()
+
+    async def aclose(self) -> None:
+        if self.prober is not None:
+            await self.prober.aclose()
+        if self.residency is not None:
+            await self.residency.aclose()
+        await super().aclose()
+
+    def _keep_alive(self, model: str):
+        return self.residency.keep_alive(model) if self.residency is not None else None
+
+    def _observe_native(self, model: str, native: dict) -> None:
+        if self.residency is not None:
+            self.residency.observe(model, native)
+
+    def _protocol_candidates(self) -> Tuple[List[str], List[str]]:
+        """(native candidates, v1 candidates) in health order, narrowed by probed capabilities."""
+        candidates = self.health.candidates()
+        if self.prober is None:
+            return candidates, candidates
+        native, v1 = self.prober.split_by_protocol(candidates)
+        if not native and not v1:
+            return candidates, candidates
+        return native, v1
 
     @staticmethod
     def _replace_host(url: str, host: str, default_port: int):
@@ -66,23 +136,20 @@ class OllamaEngine(BaseViLMSEngine):
         return False
 
     async def _image_url_to_base64(self, client: httpx.AsyncClient, url: str) -> str:
-        if url.startswith("data:") and "," in url:
-            # data:image/png;base64,<payload>
-            return url.split(",", 1)[1]
-
-        resp = await client.get(url, follow_redirects=True)
-        resp.raise_for_status()
-        return base64.b64encode(resp.content).decode("ascii")
+        return await self.image_fetcher.fetch(client, url)
 
     async def _to_native_messages(self, client: httpx.AsyncClient, messages: list) -> list:
+        # Pass 1: build messages and collect every image URL of the request.
         native_messages = []
+        image_urls = []
+        image_slots = []  # (native message index, number of images)
         for msg in messages or []:
             role = msg.get("role", "user")
             content = msg.get("content", "")
 
             if isinstance(content, list):
                 text_parts = []
-                images = []
+                count = 0
                 for item in content:
                     if not isinstance(item, dict):
                         continue
@@ -94,22 +161,40 @@ class OllamaEngine(BaseViLMSEngine):
                         image_url = image_obj.get("url") if isinstance(image_obj, dict) else None
                         if not image_url:
                             continue
-                        images.append(await self._image_url_to_base64(client, str(image_url)))
+                        image_urls.append(str(image_url))
+                        count += 1
 
-                native_msg = {"role": role, "content": "\n".join([p for p in text_parts if p])}
-                if images:
-                    native_msg["images"] = images
-                native_messages.append(native_msg)
+                if count:
+                    image_slots.append((len(native_messages), count))
+                native_messages.append({"role": role, "content": "\n".join([p for p in text_parts if p])})
             else:
                 native_messages.append({"role": role, "content": str(content or "")})
 
+        # Pass 2: fetch all images concurrently, then put them back in order.
+        images = []
+        if image_urls:
+            with metrics.span("image_fetch"):
+                images = await self.image_fetcher.fetch_all(client, image_urls)
+        pos = 0
+        for idx, count in image_slots:
+            native_messages[idx]["images"] = images[pos:pos + count]
+            pos += count
+
         return native_messages
 
     @staticmethod
-    def _native_to_openai_response(native_resp: dict, model_name: str) -> dict:
-        msg = native_resp.get("message") or {}
+    def _native_usage(native_resp: dict) -> dict:
         prompt_tokens = int(native_resp.get("prompt_eval_count") or 0)
         completion_tokens = int(native_resp.get("eval_count") or 0)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    @classmethod
+    def _native_to_openai_response(cls, native_resp: dict, model_name: str) -> dict:
+        msg = native_resp.get("message") or {}
         return {
             "id": f"chatcmpl-{int(time.time())}",
             "object": "chat.completion",
@@ -126,21 +211,92 @@ class OllamaEngine(BaseViLMSEngine):
                     "finish_reason": "stop" if native_resp.get("done", True) else None,
                 }
             ],
-            "usage": {
-                "prompt_tokens": prompt_tokens,
-                "completion_tokens": completion_tokens,
-                "total_tokens": prompt_tokens + completion_tokens,
-            },
+            "usage": cls._native_usage(native_resp),
         }
 
     @staticmethod
-    def _build_native_payload(payload: dict, native_messages: list) -> dict:
+    def _openai_chunk(chunk_id: str, created: int, model_name: str, choices: list, usage: Optional[dict] = None) -> dict:
+        chunk = {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model_name,
+            "system_fingerprint": "fp_ollama",
+            "choices": choices,
+        }
+        if usage is not None:
+            chunk["usage"] = usage
+        return chunk
+
+    @classmethod
+    async def _native_stream_to_openai_sse(
+        cls, resp: httpx.Response, model_name: str, on_done=None
+    ) -> AsyncIterator[bytes]:
+        """Translate Ollama NDJSON `/api/chat` chunks into OpenAI SSE chunk events.
+
+        `on_done(native)` gets the final NDJSON object (durations, token counts).
+        """
+        created = int(time.time())
+        chunk_id = f"chatcmpl-{created}"
+        sent_role = False
+
+        async for line in resp.aiter_lines():
+            if not line.strip():
+                continue
+            native = json.loads(line)
+            if native.get("error"):
+                raise RuntimeError(str(native["error"]))
+
+            msg = native.get("message") or {}
+            content = msg.get("content", "")
+            if content or not sent_role:
+                delta = {"content": content}
+                if not sent_role:
+                    delta = {"role": msg.get("role", "assistant"), "content": content}
+                    sent_role = True
+                choice = {"index": 0, "delta": delta, "finish_reason": None}
+                yield sse_event(cls._openai_chunk(chunk_id, created, model_name, [choice]))
+
+            if native.get("done"):
+                if on_done is not None:
+                    on_done(native)
+                finish_reason = "length" if native.get("done_reason") == "length" else "stop"
+                choice = {"index": 0, "delta": {}, "finish_reason": finish_reason}
+                yield sse_event(cls._openai_chunk(chunk_id, created, model_name, [choice]))
+                # Final usage chunk, same shape as OpenAI stream_options.include_usage.
+                yield sse_event(cls._openai_chunk(chunk_id, created, model_name, [], cls._native_usage(native)))
+                break
+
+        yield SSE_DONE
+
+    @staticmethod
+    async def _relabel_v1_sse(resp: httpx.Response, model_name: str) -> AsyncIterator[bytes]:
+        """Re-emit Ollama `/v1` SSE events with `model` set to the requested name, as the native path does."""
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                yield SSE_DONE
+                break
+            event = fastjson.rewrite_model(data.encode("utf-8"), model_name)
+            if event is None:
+                chunk = json.loads(data)
+                if isinstance(chunk, dict):
+                    chunk["model"] = model_name
+                yield sse_event(chunk)
+                continue
+            yield b"data: " + event + b"\n\n"
+
+    @staticmethod
+    def _build_native_payload(payload: dict, native_messages: list, stream: bool = False, keep_alive=None) -> dict:
         native_payload = {
             "model": payload.get("model"),
             "messages": native_messages,
-            # Gateway currently returns non-stream OpenAI-style responses.
-            "stream": False,
+            "stream": stream,
         }
+        if keep_alive is not None:
+            native_payload["keep_alive"] = keep_alive
 
         options = {}
         if payload.get("temperature") is not None:
@@ -155,18 +311,32 @@ class OllamaEngine(BaseViLMSEngine):
             native_payload["options"] = options
         return native_payload
 
-    async def _post_native_chat(self, client: httpx.AsyncClient, native_payload: dict, model_name: str) -> dict:
+    async def _post_native_chat(
+        self, client: httpx.AsyncClient, native_payload: dict, model_name: str, candidates: List[str]
+    ) -> dict:
         tried = []
         last_http_error = None
-        for url in [self._to_native_chat_url(u) for u in self.candidate_urls]:
+        for candidate in candidates:
+            url = self._to_native_chat_url(candidate)
+            if not self.health.allow(candidate):
+                tried.append(f"{url} (circuit open)")
+                continue
             tried.append(url)
             try:
-                resp = await client.post(url, json=native_payload)
+                with metrics.span("upstream"):
+                    resp = await client.post(url, json=native_payload)
+                # The host answered; only transport failures count against it.
+                self.health.record_success(candidate)
                 resp.raise_for_status()
-                return self._native_to_openai_response(resp.json(), model_name)
-            except httpx.RequestError:
+                with metrics.span("translate"):
+                    native = resp.json()
+                    self._observe_native(native_payload.get("model"), native)
+                    return self._native_to_openai_response(native, model_name)
+            except httpx.RequestError as e:
+                self.health.record_failure(candidate, e)
                 continue
             except httpx.HTTPStatusError as e:
+                self.health.record_http_error(candidate, e)
                 last_http_error = e
                 continue
 
@@ -174,53 +344,169 @@ class OllamaEngine(BaseViLMSEngine):
             raise RuntimeError(str(last_http_error)) from last_http_error
         raise RuntimeError("Cannot connect to Ollama native chat backend. Tried: " + ", ".join(tried))
 
-    async def chat_completion(self, payload: dict):
-        # OpenAI-style payload: {model, messages, stream, ...}
-        has_images = self._has_image_parts(payload)
+    async def _open_native_chat_stream(self, native_payload: dict, candidates: List[str]) -> httpx.Response:
+        tried = []
+        last_http_error = None
+        for candidate in candidates:
+            url = self._to_native_chat_url(candidate)
+            if not self.health.allow(candidate):
+                tried.append(f"{url} (circuit open)")
+                continue
+            tried.append(url)
+            try:
+                with metrics.span("upstream"):
+                    resp = await self._open_stream(url, native_payload)
+                self.health.record_success(candidate)
+                return resp
+            except httpx.RequestError as e:
+                self.health.record_failure(candidate, e)
+                continue
+            except httpx.HTTPStatusError as e:
+                self.health.record_http_error(candidate, e)
+                self.health.record_success(candidate)
+                last_http_error = e
+                continue
+
+        if last_http_error is not None:
+            raise RuntimeError(str(last_http_error)) from last_http_error
+        raise RuntimeError("Cannot connect to Ollama native chat backend. Tried: " + ", ".join(tried))
+
+    async def _open_v1_chat_stream(self, ollama_payload: dict, candidates: List[str]) -> httpx.Response:
+        tried = []
+        last_http_error = None
+        for url in candidates:
+            if not self.health.allow(url):
+                tried.append(f"{url} (circuit open)")
+                continue
+            tried.append(url)
+            try:
+                with metrics.span("upstream"):
+                    resp = await self._open_stream(url, ollama_payload)
+                self.health.record_success(url)
+                return resp
+            except httpx.RequestError as e:
+                self.health.record_failure(url, e)
+                continue
+            except httpx.HTTPStatusError as e:
+                self.health.record_http_error(url, e)
+                self.health.record_success(url)
+                last_http_error = e
+                continue
+
+        if last_http_error is not None:
+            raise RuntimeError(str(last_http_error)) from last_http_error
+        raise RuntimeError(
+            "Cannot connect to Ollama backend. Tried: " + ", ".join(tried) +
+            ". Configure serving.base-url to either localhost or vilms-ollama depending on runtime."
+        )
+
+    @staticmethod
+    def _build_v1_payload(payload: dict, stream: bool = False) -> dict:
         ollama_payload = {
             "model": payload.get("model"),
             "messages": payload.get("messages", []),
-            "stream": payload.get("stream", False),
+            "stream": stream,
         }
 
         # forward optional parameters when present
         for k in ("temperature", "max_tokens", "top_p", "presence_penalty", "frequency_penalty", "stop"):
             if k in payload and payload[k] is not None:
                 ollama_payload[k] = payload[k]
+        if stream:
+            ollama_payload["stream_options"] = {"include_usage": True}
+        return ollama_payload
 
-        async with httpx.AsyncClient(timeout=300) as client:
-            native_messages = await self._to_native_messages(client, payload.get("messages", []))
-            native_payload = self._build_native_payload(payload, native_messages)
+    async def chat_completion_stream(self, payload: dict, response_model: Optional[str] = None) -> AsyncIterator[bytes]:
+        has_images = self._has_image_parts(payload)
+        model_name = response_model or payload.get("model")
 
-            if has_images:
-                return await self._post_native_chat(client, native_payload, payload.get("model"))
+        native_messages = await self._to_native_messages(self.client, payload.get("messages", []))
+        native_payload = self._build_native_payload(
+            payload, native_messages, stream=True, keep_alive=self._keep_alive(payload.get("model"))
+        )
+        native_candidates, v1_candidates = self._protocol_candidates()
 
-            # Prefer native /api/chat for text too, because many Ollama versions/images
-            # (including some current defaults) do not expose OpenAI-compatible /v1 routes.
-            # Keep v1 fallback only for compatibility with setups relying on raw v1 output.
+        resp = None
+        if has_images or native_candidates:
             try:
-                return await self._post_native_chat(client, native_payload, payload.get("model"))
+                resp = await self._open_native_chat_stream(native_payload, native_candidates or self.health.candidates())
             except RuntimeError:
-                pass
+                if has_images or not v1_candidates:
+                    raise
 
-            tried = []
-            last_http_error = None
-            for url in self.candidate_urls:
-                tried.append(url)
-                try:
-                    resp = await client.post(url, json=ollama_payload)
-                    resp.raise_for_status()
-                    return resp.json()
-                except httpx.RequestError:
-                    continue
-                except httpx.HTTPStatusError as e:
-                    last_http_error = e
-                    continue
-
-            if last_http_error is not None:
-                raise RuntimeError(str(last_http_error)) from last_http_error
-
-            raise RuntimeError(
-                "Cannot connect to Ollama backend. Tried: " + ", ".join(tried) +
-                ". Configure serving.base-url to either localhost or vilms-ollama depending on runtime."
+        if resp is not None:
+            try:
+                def on_done(native: dict) -> None:
+                    self._observe_native(payload.get("model"), native)
+
+                async for chunk in self._native_stream_to_openai_sse(resp, model_name, on_done):
+                    yield chunk
+            finally:
+                await resp.aclose()
+            return
+
+        # Same v1 fallback as chat_completion; Ollama's /v1 already speaks OpenAI SSE,
+        # only `model` is relabelled so clients see one name whichever protocol served them.
+        resp = await self._open_v1_chat_stream(self._build_v1_payload(payload, stream=True), v1_candidates)
+        try:
+            async for chunk in self._relabel_v1_sse(resp, model_name):
+                yield chunk
+        finally:
+            await resp.aclose()
+
+    async def chat_completion(self, payload: dict):
+        # OpenAI-style payload: {model, messages, stream, ...}
+        has_images = self._has_image_parts(payload)
+        ollama_payload = self._build_v1_payload(payload)
+
+        client = self.client
+        native_messages = await self._to_native_messages(client, payload.get("messages", []))
+        native_payload = self._build_native_payload(
+            payload, native_messages, keep_alive=self._keep_alive(payload.get("model"))
+        )
+        native_candidates, v1_candidates = self._protocol_candidates()
+
+        if has_images:
+            return await self._post_native_chat(
+                client, native_payload, payload.get("model"), native_candidates or self.health.candidates()
             )
+
+        # Prefer native /api/chat for text too, because many Ollama versions/images
+        # (including some current defaults) do not expose OpenAI-compatible /v1 routes.
+        # Keep v1 fallback only for compatibility with setups relying on raw v1 output.
+        # Probed hosts are only tried on the protocol they support.
+        if native_candidates:
+            try:
+                return await self._post_native_chat(client, native_payload, payload.get("model"), native_candidates)
+            except RuntimeError:
+                if not v1_candidates:
+                    raise
+
+        tried = []
+        last_http_error = None
+        for url in v1_candidates:
+            if not self.health.allow(url):
+                tried.append(f"{url} (circuit open)")
+                continue
+            tried.append(url)
+            try:
+                with metrics.span("upstream"):
+                    resp = await client.post(url, json=ollama_payload)
+                self.health.record_success(url)
+                resp.raise_for_status()
+                return resp.json()
+            except httpx.RequestError as e:
+                self.health.record_failure(url, e)
+                continue
+            except httpx.HTTPStatusError as e:
+                self.health.record_http_error(url, e)
+                last_http_error = e
+                continue
+
+        if last_http_error is not None:
+            raise RuntimeError(str(last_http_error)) from last_http_error
+
+        raise RuntimeError(
+            "Cannot connect to Ollama backend. Tried: " + ", ".join(tried) +
+            ". Configure serving.base-url to either localhost or vilms-ollama depending on runtime."
+        )
@@ -1,13 +1,35 @@
 # app/engines/vllm_engine.py
+from typing import AsyncIterator, List, Optional, Tuple
+
 import httpx
 from urllib.parse import urlparse, urlunparse
 from .base import BaseViLMSEngine
 from app.config import settings
+from app.services import metrics
+from app.services.endpoint_health import build_endpoint_health
+from app.services.load_balancer import ReplicaBalancer
 
 class VLLMEngine(BaseViLMSEngine):
-    def __init__(self):
+    def __init__(self, balancer: Optional[ReplicaBalancer] = None):
         self.base_url = settings.VLLM_BASE_URL.rstrip("/")
-        self.candidate_base_urls = self._build_candidate_base_urls(self.base_url)
+        replicas = settings.VLLM_REPLICAS
+        # One URL: localhost/vilms-vllm fallbacks for failover. Several: balance across exactly those.
+        self.balanced = len(replicas) > 1
+        self.replicas: Tuple[str, ...] = (
+            tuple(replicas) if self.balanced else tuple(self._build_candidate_base_urls(self.base_url))
+        )
+        self.model_replicas = {m["name"]: tuple(m["replicas"]) for m in settings.models if m.get("replicas")}
+        all_urls = list(self.replicas)
+        for urls in self.model_replicas.values():
+            all_urls.extend(u for u in urls if u not in all_urls)
+        self.candidate_base_urls = all_urls
+        self.health = build_endpoint_health(all_urls, engine="vllm")
+
+        lb = settings.LOAD_BALANCING
+        # Carried over across config reloads so in-flight counts stay live;
+        # EngineFactory.activate() applies the new policy once the reload commits.
+        self.balancer = balancer or ReplicaBalancer(lb["policy"])
+        self.eject_on_5xx = lb["eject-on-5xx"]
 
     @staticmethod
     def _replace_host(base_url: str, host: str, default_port: int):
@@ -34,25 +56,124 @@ class VLLMEngine(BaseViLMSEngine):
                 deduped.append(u)
         return deduped
 
+    def _ordered_bases(self, model: str) -> Tuple[List[str], bool]:
+        """(bases in try order, balanced). Ejected replicas go last, as a last resort."""
+        cfg = settings.routing.find_model(model)
+        model_replicas = cfg.get("replicas") if cfg is not None else None
+        replicas = tuple(model_replicas) if model_replicas else self.replicas
+        if len(replicas) <= 1 or not (model_replicas or self.balanced):
+            # Single backend: sticky failover across its host aliases.
+            return [u for u in self.health.candidates() if u in replicas], False
+        live = [u for u in replicas if self.health.is_available(u)]
+        return self.balancer.order(live) + [u for u in replicas if u not in live], True
+
+    def _chat_urls(self, model: str, tried: list):
+        """Yield (base, url, retry_5xx) in balancer/health order, recording circuit-open bases in `tried`."""
+        bases, balanced = self._ordered_bases(model)
+        for base in bases:
+            # If BASE_URL is a format string (e.g. http://host:8000/{}/v1/chat/completions)
+            url = base.format(model) if ("{" in base) else f"{base}/v1/chat/completions"
+            if not self.health.allow(base):
+                tried.append(f"{url} (circuit open)")
+                continue
+            tried.append(url)
+            yield base, url, balanced and self.eject_on_5xx
+
+    def _on_http_error(self, base: str, e: httpx.HTTPStatusError, retry_5xx: bool) -> bool:
+        """Record an error status; True if the next replica should be tried instead of raising."""
+        if retry_5xx and e.response.status_code >= 500:
+            # Passive ejection: a failing replica counts against its circuit like a connect error.
+            self.health.record_failure(base, e)
+            return True
+        self.health.record_success(base)
+        self.health.record_http_error(base, e)
+        return False
+
+    @staticmethod
+    def _raise_unreachable(tried: list, last_http_error: Optional[httpx.HTTPStatusError]):
+        if last_http_error is not None:
+            raise RuntimeError(str(last_http_error)) from last_http_error
+        raise RuntimeError(
+            "Cannot connect to vLLM backend. Tried: " + ", ".join(tried) +
+            ". Configure serving.base-url to either localhost or vilms-* service host depending on runtime."
+        )
+
+    async def chat_completion_stream(self, payload: dict, response_model: Optional[str] = None) -> AsyncIterator[bytes]:
+        # vLLM already emits OpenAI SSE; proxy it byte-for-byte (response_model is not rewritten).
+        model = payload.get("model") or payload.get("model_name")
+        if not model:
+            raise ValueError("Missing 'model' in payload")
+
+        stream_payload = dict(payload)
+        stream_payload["stream"] = True
+        # Keep the client's stream options, but always ask for the final usage chunk.
+        stream_payload["stream_options"] = {**(payload.get("stream_options") or {}), "include_usage": True}
+
+        tried = []
+        resp = None
+        release = None
+        last_http_error = None
+        for base, url, retry_5xx in self._chat_urls(model, tried):
+            release = self.balancer.acquire(base)
+            try:
+                with metrics.span("upstream"):
+                    resp = await self._open_stream(url, stream_payload)
+                self.health.record_success(base)
+                break
+            except httpx.RequestError as e:
+                release()
+                self.health.record_failure(base, e)
+                continue
+            except httpx.HTTPStatusError as e:
+                release()
+                if self._on_http_error(base, e, retry_5xx):
+                    last_http_error = e
+                    continue
+                raise
+
+        if resp is None:
+            self._raise_unreachable(tried, last_http_error)
+
+        try:
+            async for chunk in resp.aiter_bytes():
+                yield chunk
+        finally:
+            await resp.aclose()
+            release()
+
     async def chat_completion(self, payload: dict):
+        return (await self._post_chat(payload)).json()
+
+    async def chat_completion_bytes(self, payload: dict) -> bytes:
+        """Upstream chat.completion body, undecoded (the route rewrites only its `model`)."""
+        return (await self._post_chat(payload)).content
+
+    async def _post_chat(self, payload: dict) -> httpx.Response:
         model = payload.get("model") or payload.get("model_name")
         if not model:
             raise ValueError("Missing 'model' in payload")
 
-        async with httpx.AsyncClient(timeout=300) as client:
-            tried = []
-            for base in self.candidate_base_urls:
-                # If BASE_URL is a format string (e.g. http://host:8000/{}/v1/chat/completions)
-                url = base.format(model) if ("{" in base) else f"{base}/v1/chat/completions"
-                tried.append(url)
-                try:
+        client = self.client
+        tried = []
+        last_http_error = None
+        for base, url, retry_5xx in self._chat_urls(model, tried):
+            release = self.balancer.acquire(base)
+            try:
+                with metrics.span("upstream"):
                     resp = await client.post(url, json=payload)
-                    resp.raise_for_status()
-                    return resp.json()
-                except httpx.RequestError:
+                resp.raise_for_status()
+                # The host answered; only transport failures (and 5xx when balancing) count against it.
+                self.health.record_success(base)
+                return resp
+            except httpx.RequestError as e:
+                self.health.record_failure(base, e)
+                continue
+            except httpx.HTTPStatusError as e:
+                if self._on_http_error(base, e, retry_5xx):
+                    last_http_error = e
                     continue
+                raise
+            finally:
+                release()
 
-            raise RuntimeError(
-                "Cannot connect to vLLM backend. Tried: " + ", ".join(tried) +
-                ". Configure serving.base-url to either localhost or vilms-* service host depending on runtime."
-            )
+        self._raise_unreachable(tried, last_http_error)
@@ -5,8 +5,10 @@ import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.cores.factory import EngineFactory
+from app import routes
 from app.routes import router as api_router
+from app.services.config_reload import ConfigReloader
+from app.services.optimizer import shutdown_executors
 
 # Load settings/config
 # You need app/config.py to provide "settings" or "config".
@@ -40,7 +42,7 @@ models = []
 
 
 @app.on_event("startup")
-def startup() -> None:
+async def startup() -> None:
     global engine, models
 
     # Validate config.yaml early (fail fast)
@@ -62,5 +64,32 @@ def startup() -> None:
     else:
         models = (settings.get("serving", {}) or {}).get("models", [])
 
-    engine = EngineFactory().get_engine(engine_name)
+    # Compile the alias/model/engine routing index and config sections up front so no request pays for it.
+    settings.compile()
+
+    # Open long-lived upstream connection pools once per worker (serving.http-client).
+    await routes.factory.startup()
+    engine = routes.factory.get_engine(engine_name)
+
+    # Hot reload: watch config.yaml, SIGHUP, POST /admin/reload.
+    reload_cfg = settings.RELOAD
+    reloader = ConfigReloader(
+        settings.path,
+        get_factory=lambda: routes.factory,
+        set_factory=routes.set_factory,
+        drain_timeout_s=reload_cfg["drain-timeout-s"],
+    )
+    reloader.start_watching(reload_cfg["watch-interval-s"])
+    reloader.install_sighup()
+    app.state.reloader = reloader
+
     logger.info("Gateway started. Engine=%s | Models=%s", engine_name, [m.get("name") for m in models if isinstance(m, dict)])
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    reloader = getattr(app.state, "reloader", None)
+    if reloader is not None:
+        await reloader.aclose()
+    await routes.factory.aclose()
+    shutdown_executors()
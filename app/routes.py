@@ -1,16 +1,189 @@
 # app/routes.py
-from fastapi import APIRouter, HTTPException
+import json
+import logging
+import time
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from app.config import settings, use_config
+from app.cores import fastjson
 from app.cores.factory import EngineFactory
-from app.services.optimizer import optimize_payload
+from app.engines.base import sse_event
+from app.services import metrics
+from app.services.admission import AdmissionRejected
+from app.services.coalescer import request_key
+from app.services.profiler import PROFILER
+from app.services.scheduler import classify
+from app.services.optimizer import optimize_payload, preprocess_images
 from app.schemas.openai import ChatRequest, EmbeddingRequest, EmbeddingResponse, EmbeddingObject
 
+logger = logging.getLogger("vilms-gateway")
 router = APIRouter()
+# Current engine/config snapshot. Hot reload (app/services/config_reload.py) replaces it;
+# each request pins the one it started with.
 factory = EngineFactory()
 
+
+def set_factory(new_factory: EngineFactory) -> None:
+    global factory
+    factory = new_factory
+
 @router.get("/health_check")
 def health_check():
     return {"status": "ok"}
 
+@router.get("/ready")
+def readiness():
+    """Cached per-component readiness; 503 until warm-up is done and required backends answer."""
+    snapshot = factory.readiness.snapshot()
+    return fastjson.FastJSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+@router.get("/admin/endpoints")
+def endpoint_health():
+    return factory.endpoint_health()
+
+@router.get("/admin/ollama")
+def ollama_capabilities():
+    prober = factory.ollama.prober
+    residency = factory.ollama.residency
+    return {
+        "enabled": prober is not None,
+        "endpoints": prober.snapshot() if prober is not None else {},
+        "models": residency.snapshot() if residency is not None else {},
+    }
+
+@router.post("/admin/reload")
+async def reload_config(request: Request):
+    reloader = getattr(request.app.state, "reloader", None)
+    if reloader is None:
+        raise HTTPException(status_code=503, detail="Config reload is not initialized.")
+    res = await reloader.reload("admin")
+    if not res["ok"]:
+        raise HTTPException(status_code=400, detail=res)
+    return res
+
+@router.get("/admin/profile")
+def profiler_stats():
+    return {"enabled": settings.PROFILING["enabled"], **PROFILER.stats()}
+
+@router.post("/admin/profile")
+def arm_profiler(requests: int = 1):
+    """Profile the next `requests` chat/embedding requests (serving.profiling.enabled must be on)."""
+    if not settings.PROFILING["enabled"]:
+        raise HTTPException(status_code=400, detail="Profiling is disabled (serving.profiling.enabled).")
+    return {"armed": PROFILER.arm(requests)}
+
+@router.get("/admin/admission")
+def admission_stats():
+    return factory.admission.stats()
+
+@router.get("/admin/coalescing")
+def coalescing_stats():
+    return factory.coalescer.stats()
+
+@router.get("/admin/response-cache")
+def response_cache_stats():
+    return {"enabled": settings.RESPONSE_CACHE["enabled"], **factory.response_cache.stats()}
+
+@router.get("/admin/shared-state")
+async def shared_state_stats():
+    if factory.shared is None:
+        return {"enabled": False}
+    return {"enabled": True, **(await factory.shared.stats())}
+
+@router.get("/admin/embedding-cache")
+def embedding_cache_stats():
+    cache = getattr(factory.embedding, "cache", None)
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@router.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(
+        metrics.REGISTRY.render(_metric_families(factory)),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+def _metric_families(current: EngineFactory):
+    """Point-in-time state owned by other components, collected at scrape time."""
+    admission = current.admission.stats()
+    limiter_samples = [
+        ({"scope": scope, "name": name}, lim)
+        for scope in ("engines", "models", "tenants")
+        for name, lim in admission[scope].items()
+    ]
+    families = [
+        ("vilms_admission_active", "gauge", "Admitted requests holding a slot.",
+         [(labels, lim["active"]) for labels, lim in limiter_samples]),
+        ("vilms_admission_queue_depth", "gauge", "Requests waiting for a slot.",
+         [(labels, lim["queued"]) for labels, lim in limiter_samples]),
+        ("vilms_admission_rejected_total", "counter", "Requests rejected with 429 (queue full or deadline).",
+         [(labels, lim["rejected"] + lim["timed_out"]) for labels, lim in limiter_samples]),
+    ]
+
+    coalescing = current.coalescer.stats()
+    families.append(("vilms_coalesced_requests_total", "counter", "Chat requests served by an identical in-flight request.",
+                     [({}, coalescing["coalesced"])]))
+    cache = current.response_cache.stats()
+    families.append(("vilms_response_cache_requests_total", "counter", "Response cache lookups.",
+                     [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]))
+    images = current.ollama.image_fetcher.stats()
+    families.append(("vilms_image_fetch_requests_total", "counter", "Image URL lookups by the Ollama image fetcher.",
+                     [({"result": "hit"}, images["hits"]), ({"result": "miss"}, images["misses"])]))
+    embedding_cache = getattr(current.embedding, "cache", None)
+    if embedding_cache is not None:
+        stats = embedding_cache.stats()
+        families.append(("vilms_embedding_cache_requests_total", "counter", "Embedding cache lookups.",
+                         [({"result": "hit"}, stats.get("hits", 0)), ({"result": "miss"}, stats.get("misses", 0))]))
+
+    circuit = []
+    for engine, snap in current.endpoint_health().items():
+        for ep in snap["endpoints"]:
+            circuit.append(({"engine": engine, "upstream": ep["url"]}, 0 if ep["state"] == "closed" else 1))
+    families.append(("vilms_upstream_inflight_requests", "gauge", "Requests in flight per vLLM replica.",
+                     [({"engine": "vllm", "upstream": url}, r["inflight"])
+                      for url, r in current.vllm.balancer.snapshot().items()]))
+    families.append(("vilms_upstream_circuit_open", "gauge", "1 if the candidate URL's circuit is open or half-open.", circuit))
+    return families
+
+def _model_labels(current: EngineFactory, req, payload: dict, engine_name: str) -> dict:
+    # Only configured names/aliases become label values; anything else is bucketed as "other".
+    requested = req.model if (current.routing.find_model(req.model) or req.model in current.routing.aliases) else "other"
+    model = payload["model"] if current.routing.find_model(payload["model"]) else "other"
+    return {"requested_model": requested, "model": model, "engine": engine_name}
+
+def _observe(route: str, labels: dict, trace, status: int, usage=None) -> None:
+    elapsed = time.perf_counter() - trace.started
+    upstream = trace.upstream
+    metrics.INFLIGHT.dec(route=route)
+    metrics.REQUESTS.inc(route=route, upstream=upstream, status=status, **labels)
+    metrics.REQUEST_LATENCY.observe(elapsed, route=route, upstream=upstream, **labels)
+    metrics.observe_stages(route, trace)
+    if usage is not None:
+        metrics.record_usage(labels["model"], labels["engine"], usage, elapsed)
+
+def _timed(response: Response, trace, sampler=None) -> Response:
+    """Attach the stage timings (serving.profiling.server-timing) and the profile file name, if any."""
+    if settings.PROFILING["server-timing"]:
+        response.headers["Server-Timing"] = trace.server_timing()
+    if sampler is not None:
+        response.headers["X-Profile-File"] = sampler.path.name
+    return response
+
+def _usage_from_sse(chunk: bytes):
+    """`usage` object from an SSE chunk that carries one (final OpenAI stream chunk)."""
+    for line in chunk.split(b"\n"):
+        if line.startswith(b"data: {") and b'"usage"' in line:
+            try:
+                usage = json.loads(line[6:]).get("usage")
+            except ValueError:
+                continue
+            if isinstance(usage, dict):
+                return usage
+    return None
+
 @router.get("/v1/chat/completions")
 def chat_completions_get_hint():
     return {
@@ -18,22 +191,249 @@ def chat_completions_get_hint():
         "hint": "Use POST /v1/chat/completions with JSON body.",
     }
 
+def _image_fetch_for(engine):
+    """url -> base64 through the engine's image fetcher/cache, if it has one (Ollama)."""
+    fetcher = getattr(engine, "image_fetcher", None)
+    if fetcher is None:
+        return None
+    return lambda url: fetcher.fetch(engine.client, url)
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse whose `on_close` also runs when the body never starts
+    (client gone before the first send, header send failed)."""
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._on_close()
+
+async def _stream_chat_completion(
+    engine, payload: dict, requested_model: str, on_close, headers: dict = None, on_first=None
+) -> StreamingResponse:
+    """`on_first()` runs when the first upstream chunk arrives; `on_close(usage, failed)` exactly once
+    when the response ends, whether or not the body was ever sent."""
+    chunks = engine.chat_completion_stream(payload, response_model=requested_model)
+    # Pull the first chunk before sending headers so connect/HTTP errors still map to a 400.
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        raise RuntimeError("Upstream closed the stream without data")
+    if on_first is not None:
+        on_first()
+
+    state = {"usage": None, "failed": False, "closed": False}
+
+    async def close():
+        if state["closed"]:
+            return
+        state["closed"] = True
+        try:
+            await chunks.aclose()
+        finally:
+            on_close(state["usage"], state["failed"])
+
+    async def body():
+        try:
+            yield first
+            async for chunk in chunks:
+                if b'"usage"' in chunk:
+                    state["usage"] = _usage_from_sse(chunk) or state["usage"]
+                yield chunk
+        except Exception as e:
+            # Headers are already sent; report mid-stream failures as a final SSE error event.
+            state["failed"] = True
+            yield sse_event({"error": {"message": str(e), "type": "upstream_error"}})
+        finally:
+            await close()
+
+    return _ClosingStreamingResponse(
+        body(),
+        close,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **(headers or {})},
+    )
+
+async def _admit_and_prepare(current: EngineFactory, req: ChatRequest, request: Request, payload: dict, model_cfg):
+    """Admission (fair-scheduled, may raise AdmissionRejected), then image preprocessing.
+    Returns (engine, payload, response headers, release)."""
+    with metrics.span("admission"):
+        release = await current.admission.acquire(
+            current.resolve_chat_engine_name(req.model),
+            model_cfg["name"] if model_cfg else payload["model"],
+            classify(request.headers, settings.SCHEDULING),
+        )
+    try:
+        engine = current.resolve_chat_engine(req.model)
+        with metrics.span("preprocess"):
+            payload, image_stats = await preprocess_images(payload, model_cfg, fetch=_image_fetch_for(engine))
+    except BaseException:
+        release()
+        raise
+    headers = {}
+    if image_stats["images"]:
+        headers["X-Image-Bytes-Saved"] = str(image_stats["bytes_saved"])
+        logger.info(
+            "Image preprocess: model=%s images=%d bytes_saved=%d",
+            payload["model"], image_stats["images"], image_stats["bytes_saved"],
+        )
+    return engine, payload, headers, release
+
+async def _complete(
+    current: EngineFactory, req: ChatRequest, request: Request, payload: dict, model_cfg, raw: bool = False
+):
+    """(result, headers). With `raw`, engines that can (vLLM) return the upstream body as bytes."""
+    engine, payload, headers, release = await _admit_and_prepare(current, req, request, payload, model_cfg)
+    try:
+        if raw and hasattr(engine, "chat_completion_bytes"):
+            return await engine.chat_completion_bytes(payload), headers
+        return await engine.chat_completion(payload), headers
+    finally:
+        release()
+
+def _request_payload(req: ChatRequest) -> dict:
+    """Shallow dict of the validated request. Unlike model_dump(), message content
+    (images included) is passed on as parsed instead of being walked and rebuilt."""
+    payload = dict(req.__dict__)
+    payload["messages"] = [dict(m.__dict__) for m in req.messages]
+    return payload
+
+def _coalescing_enabled(model_cfg) -> bool:
+    params = (model_cfg or {}).get("params") or {}
+    return bool(params.get("coalesce", False))
+
+def _should_coalesce(model_cfg, payload: dict, request: Request) -> bool:
+    """Share one in-flight result between identical requests only when they are
+    deterministic (temperature 0): sampling clients expect independent completions.
+    X-Coalesce: bypass opts out, use coalesces even if temperature != 0."""
+    mode = request.headers.get("x-coalesce", "").strip().lower()
+    if mode == "bypass" or not _coalescing_enabled(model_cfg):
+        return False
+    return mode == "use" or payload.get("temperature") == 0
+
+def _response_cache_ttl(model_cfg, payload: dict, request: Request):
+    """TTL to cache this request's result with, or None when it must not be cached.
+    X-Response-Cache: bypass skips the cache, use caches even if temperature != 0."""
+    mode = request.headers.get("x-response-cache", "").strip().lower()
+    if mode == "bypass":
+        return None
+    params = (model_cfg or {}).get("params") or {}
+    cache_cfg = settings.RESPONSE_CACHE
+    if not params.get("response-cache", cache_cfg["enabled"]):
+        return None
+    if mode != "use" and payload.get("temperature") != 0:
+        return None
+    return float(params.get("response-cache-ttl-s", cache_cfg["ttl-s"]))
+
 @router.post("/v1/chat/completions")
-async def chat_completions(req: ChatRequest):
+async def chat_completions(req: ChatRequest, request: Request):
     requested_model = req.model
-    payload = req.model_dump()
+    payload = _request_payload(req)
+    current = factory
+    current.begin()
+    streaming = False
+    trace = metrics.start_trace()
+    sampler = None
+    metrics.INFLIGHT.inc(route="chat")
+    labels = {"requested_model": "other", "model": "other", "engine": ""}
+    status = 400
+    usage = None
     try:
-        # map alias: Qwen3-4B-Instruct -> qwen3:4b-instruct ...
-        payload["model"] = factory.map_model_alias(payload["model"])
-        payload = optimize_payload(payload)
-
-        engine = factory.resolve_chat_engine(req.model)
-        result = await engine.chat_completion(payload)
-        if isinstance(result, dict):
-            result["model"] = requested_model
-        return result
+        with use_config(current.config):
+            sampler = PROFILER.start("chat", request.headers, settings.PROFILING)
+            with metrics.span("alias"):
+                # map alias: Qwen3-4B-Instruct -> qwen3:4b-instruct ...
+                payload["model"] = current.map_model_alias(payload["model"])
+                model_cfg = current.routing.find_model(payload["model"])
+                labels = _model_labels(current, req, payload, current.resolve_chat_engine_name(req.model))
+            with metrics.span("optimize"):
+                payload = optimize_payload(payload, model_cfg)
+
+            if payload.get("stream"):
+                engine, payload, headers, release = await _admit_and_prepare(
+                    current, req, request, payload, model_cfg
+                )
+
+                def on_first():
+                    elapsed = time.perf_counter() - trace.started
+                    metrics.TTFT.observe(elapsed, model=labels["model"], engine=labels["engine"])
+
+                def on_close(stream_usage, failed):
+                    release()
+                    if sampler is not None:
+                        sampler.stop()
+                    current.end()
+                    _observe("chat", labels, trace, 502 if failed else 200, stream_usage)
+
+                try:
+                    stream = await _stream_chat_completion(
+                        engine, payload, requested_model, on_close, headers, on_first
+                    )
+                except BaseException:
+                    release()
+                    raise
+                streaming = True
+                return _timed(stream, trace, sampler)
+
+            cache_ttl = _response_cache_ttl(model_cfg, payload, request)
+            coalesce = _should_coalesce(model_cfg, payload, request)
+            key = request_key(payload) if cache_ttl is not None or coalesce else None
+            cached = await current.response_cache.aget(key) if cache_ttl is not None else None
+            if cached is not None:
+                cached["model"] = requested_model
+                trace.upstream = "cache"
+                status = 200
+                return _timed(fastjson.FastJSONResponse(cached, headers={"X-Response-Cache": "hit"}), trace, sampler)
+
+            # Results that are not cached can stay as upstream bytes (vLLM); only `model` is rewritten.
+            raw = cache_ttl is None
+            if coalesce:
+                # Identical deterministic request already in flight: wait for its result instead of generating again.
+                result, headers = await current.coalescer.run(
+                    key, lambda: _complete(current, req, request, payload, model_cfg, raw)
+                )
+                # The result is shared; `model` is rewritten per caller below.
+                result = dict(result) if isinstance(result, dict) else result
+            else:
+                result, headers = await _complete(current, req, request, payload, model_cfg, raw)
+
+            headers = dict(headers)
+            if isinstance(result, bytes):
+                with metrics.span("translate"):
+                    body = fastjson.rewrite_model(result, requested_model)
+                    if body is None:
+                        result = fastjson.loads(result)
+                if body is not None:
+                    usage = fastjson.usage_from_body(body)
+                    status = 200
+                    return _timed(Response(content=body, media_type="application/json", headers=headers), trace, sampler)
+
+            if cache_ttl is not None:
+                current.response_cache.put(key, result, cache_ttl)
+                headers["X-Response-Cache"] = "miss"
+            if isinstance(result, dict):
+                result["model"] = requested_model
+                usage = result.get("usage")
+            status = 200
+            with metrics.span("serialize"):
+                response = fastjson.FastJSONResponse(result, headers=headers)
+            return _timed(response, trace, sampler)
+    except AdmissionRejected as e:
+        status = 429
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after_s)})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # Streaming responses release the snapshot (and admission slots) when the body finishes.
+        if not streaming:
+            if sampler is not None:
+                sampler.stop()
+            current.end()
+            _observe("chat", labels, trace, status, usage)
 
 @router.get("/v1/embeddings")
 def embeddings_get_hint():
@@ -43,14 +443,49 @@ def embeddings_get_hint():
     }
 
 @router.post("/v1/embeddings", response_model=EmbeddingResponse)
-def embeddings(req: EmbeddingRequest):
-    model_mapped = factory.map_model_alias(req.model)
+async def embeddings(req: EmbeddingRequest, request: Request, response: Response):
+    current = factory
+    current.begin()
+    trace = metrics.start_trace()
+    sampler = None
+    metrics.INFLIGHT.inc(route="embeddings")
+    labels = {"requested_model": "other", "model": "other", "engine": "embedding"}
+    status = 400
+    try:
+        with use_config(current.config):
+            sampler = PROFILER.start("embeddings", request.headers, settings.PROFILING)
+            labels = _embedding_labels(current, req.model)
+            result = await _embed(current, req)
+            status = 200
+            _timed(response, trace, sampler)
+            return result
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        current.end()
+        _observe("embeddings", labels, trace, status)
+
+def _embedding_labels(current: EngineFactory, requested: str) -> dict:
+    mapped = current.map_model_alias(requested)
+    resolve = getattr(current.embedding, "resolve_model_name", None)
+    known = resolve is not None and mapped == resolve(None)
+    return {
+        "requested_model": requested if (requested in current.routing.aliases or known) else "other",
+        "model": mapped if known else "other",
+        "engine": "embedding",
+    }
+
+async def _embed(current: EngineFactory, req: EmbeddingRequest) -> EmbeddingResponse:
+    model_mapped = current.map_model_alias(req.model)
     inputs = req.input if isinstance(req.input, list) else [req.input]
 
     try:
-        if factory.embedding is None:
+        if current.embedding is None:
             raise HTTPException(status_code=400, detail="Embedding is disabled in config.")
-        vecs = factory.embedding.embed(inputs, model_name=model_mapped)
+        if hasattr(current.embedding, "aembed"):
+            vecs = await current.embedding.aembed(inputs, model_name=model_mapped)
+        else:
+            vecs = await run_in_threadpool(current.embedding.embed, inputs, model_name=model_mapped)
         data = [EmbeddingObject(index=i, embedding=v) for i, v in enumerate(vecs)]
         return EmbeddingResponse(data=data, model=model_mapped, usage={"prompt_tokens": 0, "total_tokens": 0})
     except Exception as e:
@@ -0,0 +1,453 @@
+# app/services/admission.py
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from app.services import metrics
+from app.services.scheduler import FairQueue, Ticket
+from app.services.shared_state import SharedStateUnavailable
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; mapped to HTTP 429 with Retry-After."""
+
+    def __init__(self, message: str, retry_after_s: int):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionLimiter:
+    """
+    Concurrency limit with a bounded wait queue.
+
+    max_concurrency <= 0 means unlimited. Waiters are ordered by a FairQueue
+    (weighted across priority classes, round-robin across tenants; FIFO for a single
+    tenant/class). A released slot is handed directly to the next waiter, so a
+    newcomer can never overtake the queue.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 0,
+        max_queue: int = 0,
+        weights: Optional[Mapping[str, float]] = None,
+    ):
+        self.name = name
+        self.max_concurrency = int(max_concurrency)
+        self.max_queue = int(max_queue)
+        self.active = 0
+        self._waiters = FairQueue(weights)
+        self._service_s = 1.0  # EWMA of slot hold time, for Retry-After
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def configure(self, max_concurrency: int, max_queue: int) -> None:
+        self.max_concurrency = int(max_concurrency)
+        self.max_queue = int(max_queue)
+        self._wake()
+
+    def retry_after_s(self) -> int:
+        slots = max(1, self.max_concurrency)
+        return max(1, math.ceil(self._service_s * (self.queued + 1) / slots))
+
+    def _has_slot(self) -> bool:
+        return self.max_concurrency <= 0 or self.active < self.max_concurrency
+
+    def _wake(self) -> None:
+        while self._waiters and self._has_slot():
+            fut = self._waiters.pop()
+            if not fut.done():
+                self.active += 1
+                fut.set_result(None)
+
+    def _can_admit_now(self, model: str) -> bool:
+        return self._has_slot() and not self._waiters
+
+    def _admit_now(self, model: str) -> None:
+        self.active += 1
+
+    def _queue_full(self) -> bool:
+        return self.queued >= self.max_queue
+
+    async def acquire(self, deadline: float, ticket: Optional[Ticket] = None, model: str = "") -> None:
+        if self._can_admit_now(model):
+            self._admit_now(model)
+            self.admitted += 1
+            return
+        if self._queue_full():
+            self.rejected += 1
+            raise AdmissionRejected(
+                f"Too many requests for {self.name}: {self.active} running, {self.queued} queued.",
+                self.retry_after_s(),
+            )
+
+        fut = asyncio.get_running_loop().create_future()
+        self._enqueue(ticket or Ticket(), model, fut)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                # Slot was handed over just as the deadline hit; give it back.
+                self.release(0.0)
+            else:
+                fut.cancel()
+                self._discard(fut)
+            self.timed_out += 1
+            raise AdmissionRejected(f"Queue wait deadline exceeded for {self.name}.", self.retry_after_s())
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release(0.0)
+            else:
+                fut.cancel()
+                self._discard(fut)
+            raise
+        self.admitted += 1
+
+    def _enqueue(self, ticket: Ticket, model: str, fut: asyncio.Future) -> None:
+        self._waiters.push(ticket, fut)
+
+    def _discard(self, fut: asyncio.Future) -> None:
+        self._waiters.remove(fut)
+
+    def release(self, held_s: Optional[float] = None) -> None:
+        self.active = max(0, self.active - 1)
+        if held_s:
+            self._service_s = 0.8 * self._service_s + 0.2 * held_s
+        self._wake()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class ModelAffinityLimiter(AdmissionLimiter):
+    """
+    Engine limiter that serves one model at a time (serving.admission.engines.<name>.model-affinity).
+
+    For a backend that holds a single model in memory (Ollama on Jetson), every
+    alternation between models is a reload. Requests for the model currently
+    being served are admitted while any are queued; another model gets the engine
+    once the current one has drained, or when its oldest waiter has waited
+    `max_wait_s` (then the current model stops taking new requests until its
+    in-flight ones finish). Within a model, waiters keep FairQueue order.
+    max_queue bounds all waiting requests together, as in AdmissionLimiter (0 = no queue).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 0,
+        max_queue: int = 0,
+        weights: Optional[Mapping[str, float]] = None,
+        max_wait_s: float = 10.0,
+        engine: str = "",
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(name, max_concurrency, max_queue, weights)
+        self.engine = engine
+        self.max_wait_s = float(max_wait_s)
+        self._clock = clock
+        self._weights = weights
+        self.current: Optional[str] = None
+        self._switched_at = 0.0
+        self._queues: "OrderedDict[str, FairQueue]" = OrderedDict()
+        # future -> (model, enqueued at); also gives per-model oldest waiter in push order.
+        self._enqueued: "OrderedDict[asyncio.Future, Tuple[str, float]]" = OrderedDict()
+        self.swaps = 0
+        self.affinity_wait_s = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._enqueued)
+
+    def configure(self, max_concurrency: int, max_queue: int, max_wait_s: Optional[float] = None) -> None:
+        if max_wait_s is not None:
+            self.max_wait_s = float(max_wait_s)
+        super().configure(max_concurrency, max_queue)
+
+    def _oldest(self, exclude: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        for model, enqueued_at in self._enqueued.values():
+            if model != exclude:
+                return model, enqueued_at
+        return None
+
+    def _switch_due(self) -> bool:
+        # The current model keeps the engine for at least max_wait_s once another model is waiting.
+        now = self._clock()
+        if now - self._switched_at < self.max_wait_s:
+            return False
+        other = self._oldest(exclude=self.current)
+        return other is not None and now - other[1] >= self.max_wait_s
+
+    def _switch_to(self, model: str) -> None:
+        if model == self.current:
+            return
+        if self.current is not None:
+            self.swaps += 1
+            metrics.MODEL_SWAPS.inc(engine=self.engine)
+        self.current = model
+        self._switched_at = self._clock()
+
+    def _enqueue(self, ticket: Ticket, model: str, fut: asyncio.Future) -> None:
+        self._queues.setdefault(model, FairQueue(self._weights)).push(ticket, fut)
+        self._enqueued[fut] = (model, self._clock())
+        self._wake()
+
+    def _discard(self, fut: asyncio.Future) -> None:
+        entry = self._enqueued.pop(fut, None)
+        if entry is not None:
+            queue = self._queues.get(entry[0])
+            if queue is not None:
+                queue.remove(fut)
+                if not queue:
+                    del self._queues[entry[0]]
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._enqueued:
+            if self.active == 0 and (self.current not in self._queues or self._switch_due()):
+                nxt = self._oldest(exclude=self.current) or self._oldest()
+                self._switch_to(nxt[0])
+            queue = self._queues.get(self.current)
+            if queue is None or not self._has_slot() or self._switch_due():
+                return
+            fut = queue.pop()
+            if not queue:
+                del self._queues[self.current]
+            _, enqueued_at = self._enqueued.pop(fut)
+            if fut.done():
+                continue
+            waited = self._clock() - enqueued_at
+            self.affinity_wait_s += waited
+            metrics.AFFINITY_WAIT.observe(waited, engine=self.engine)
+            self.active += 1
+            fut.set_result(None)
+
+    def _can_admit_now(self, model: str) -> bool:
+        return self._has_slot() and not self._enqueued and (self.active == 0 or model == self.current)
+
+    def _admit_now(self, model: str) -> None:
+        self._switch_to(model)
+        self.active += 1
+
+    def stats(self) -> Dict[str, Any]:
+        out = super().stats()
+        out.update({
+            "model_affinity": True,
+            "current_model": self.current,
+            "max_wait_s": self.max_wait_s,
+            "queued_by_model": {model: len(q) for model, q in self._queues.items()},
+            "swaps": self.swaps,
+            "affinity_wait_s": round(self.affinity_wait_s, 6),
+        })
+        return out
+
+
+class AdmissionController:
+    """
+    Per-tenant, per-model and per-engine admission for chat requests.
+
+    Engine limits come from serving.admission.engines, model limits from
+    serving.models[*].params (max-concurrency, max-queue, queue-timeout-s), tenant
+    caps and priority-class weights from serving.scheduling. A request takes its
+    tenant slot, then its model slot, then its engine slot, under one queue-time
+    deadline; every queue is weighted-fair across classes and tenants.
+    Limiters survive config reloads; only limits change.
+
+    With `shared` (a SharedStateClient) set, each capped limiter additionally
+    takes a host-wide permit, so max-concurrency holds across all workers.
+    Per-worker limits keep applying if the sidecar is unreachable.
+    """
+
+    def __init__(self):
+        self.engines: Dict[str, AdmissionLimiter] = {}
+        self.models: Dict[str, AdmissionLimiter] = {}
+        self.tenants: Dict[str, AdmissionLimiter] = {}
+        self.weights: Dict[str, float] = {}
+        self.queue_timeout_s = 30.0
+        self.tenant_max_inflight = 0
+        self.tenant_max_queue = 0
+        self.default_class = "interactive"
+        self._model_timeouts: Dict[str, float] = {}
+        self.queue_wait: Dict[str, Dict[str, float]] = {}
+        self.shared = None
+
+    def configure(
+        self,
+        admission_cfg: Mapping[str, Any],
+        models: List[Mapping[str, Any]],
+        scheduling_cfg: Optional[Mapping[str, Any]] = None,
+    ) -> None:
+        self.queue_timeout_s = float(admission_cfg["queue-timeout-s"])
+        if scheduling_cfg is not None:
+            # Shared by every limiter's FairQueue; updated in place on reload.
+            self.weights.clear()
+            self.weights.update({name: c["weight"] for name, c in scheduling_cfg["classes"].items()})
+            self.default_class = scheduling_cfg["default-class"]
+            self.tenant_max_inflight = int(scheduling_cfg["tenant-max-inflight"])
+            self.tenant_max_queue = int(scheduling_cfg["tenant-max-queue"])
+        for name, limits in admission_cfg["engines"].items():
+            self._engine_limiter(name, limits)
+        seen = set()
+        self._model_timeouts = {}
+        for m in models:
+            params = m.get("params") or {}
+            if int(params.get("max-concurrency", 0) or 0) <= 0:
+                continue
+            name = m["name"]
+            seen.add(name)
+            self._limiter(self.models, f"model {name}", name, params)
+            if params.get("queue-timeout-s") is not None:
+                self._model_timeouts[name] = float(params["queue-timeout-s"])
+        for name, limiter in self.models.items():
+            if name not in seen:
+                limiter.configure(0, 0)  # limit removed; let queued requests through
+
+    def _limiter(self, table: Dict[str, AdmissionLimiter], label: str, key: str, limits: Mapping[str, Any]) -> None:
+        max_concurrency = int(limits.get("max-concurrency", 0) or 0)
+        max_queue = int(limits.get("max-queue", 0) or 0)
+        if key in table:
+            table[key].configure(max_concurrency, max_queue)
+        else:
+            table[key] = AdmissionLimiter(label, max_concurrency, max_queue, self.weights)
+
+    def _engine_limiter(self, name: str, limits: Mapping[str, Any]) -> None:
+        limiter = self.engines.get(name)
+        affinity = bool(limits.get("model-affinity", False))
+        if limiter is not None and isinstance(limiter, ModelAffinityLimiter) != affinity:
+            # Mode changed on reload: let the old limiter drain; holders still release into it.
+            limiter.configure(0, 0)
+            del self.engines[name]
+        if not affinity:
+            self._limiter(self.engines, f"engine {name}", name, limits)
+            return
+        max_concurrency = int(limits.get("max-concurrency", 0) or 0)
+        max_queue = int(limits.get("max-queue", 0) or 0)
+        max_wait_s = float(limits.get("affinity-max-wait-s", 10))
+        if name in self.engines:
+            self.engines[name].configure(max_concurrency, max_queue, max_wait_s)
+        else:
+            self.engines[name] = ModelAffinityLimiter(
+                f"engine {name}", max_concurrency, max_queue, self.weights, max_wait_s=max_wait_s, engine=name
+            )
+
+    def _tenant_limiter(self, ticket: Ticket) -> Optional[AdmissionLimiter]:
+        cap = self.tenant_max_inflight if ticket.max_inflight is None else ticket.max_inflight
+        limiter = self.tenants.get(ticket.tenant)
+        if cap <= 0:
+            return limiter  # may still hold slots from before a reload
+        if limiter is None:
+            limiter = self.tenants[ticket.tenant] = AdmissionLimiter(
+                f"tenant {ticket.tenant}", cap, self.tenant_max_queue, self.weights
+            )
+        elif limiter.max_concurrency != cap:
+            limiter.configure(cap, self.tenant_max_queue)
+        return limiter
+
+    def _forget_idle_tenant(self, tenant: str) -> None:
+        # Tenant names come from clients; do not keep a limiter per tenant forever.
+        limiter = self.tenants.get(tenant)
+        if limiter is not None and limiter.active == 0 and limiter.queued == 0:
+            del self.tenants[tenant]
+
+    def _record_wait(self, priority: str, waited_s: float) -> None:
+        stats = self.queue_wait.get(priority)
+        if stats is None:
+            stats = self.queue_wait[priority] = {"count": 0, "total_s": 0.0, "max_s": 0.0}
+        stats["count"] += 1
+        stats["total_s"] += waited_s
+        stats["max_s"] = max(stats["max_s"], waited_s)
+        metrics.QUEUE_WAIT.observe(waited_s, priority=priority)
+
+    async def acquire(self, engine: str, model: str, ticket: Optional[Ticket] = None) -> Callable[[], None]:
+        """Wait for the tenant, model and engine slots; returns an idempotent release()."""
+        ticket = ticket or Ticket(priority=self.default_class)
+        enqueued = time.monotonic()
+        timeout = self._model_timeouts.get(model, self.queue_timeout_s)
+        deadline = enqueued + timeout
+        limiters = [
+            lim
+            for lim in (self._tenant_limiter(ticket), self.models.get(model), self.engines.get(engine))
+            if lim is not None
+        ]
+        held: List[AdmissionLimiter] = []
+        shared_held: List[Callable[[], None]] = []
+        started = 0.0
+
+        def release() -> None:
+            while shared_held:
+                shared_held.pop()()
+            if not held:
+                return
+            held_s = time.monotonic() - started if started else 0.0
+            while held:
+                held.pop().release(held_s)
+            self._forget_idle_tenant(ticket.tenant)
+
+        try:
+            for limiter in limiters:
+                await limiter.acquire(deadline, ticket, model)
+                held.append(limiter)
+            if self.shared is not None:
+                await self._acquire_shared(held, deadline, shared_held)
+        except BaseException:
+            release()
+            self._forget_idle_tenant(ticket.tenant)
+            raise
+        started = time.monotonic()
+        self._record_wait(ticket.priority, started - enqueued)
+        return release
+
+    async def _acquire_shared(
+        self, limiters: List[AdmissionLimiter], deadline: float, releases: List[Callable[[], None]]
+    ) -> None:
+        """Host-wide permits ("admission:<limiter name>") for every capped limiter, same deadline."""
+        for limiter in limiters:
+            if limiter.max_concurrency <= 0:
+                continue
+            try:
+                release = await self.shared.acquire(
+                    "admission:" + limiter.name, limiter.max_concurrency, deadline - time.monotonic()
+                )
+            except SharedStateUnavailable:
+                return  # fail open: the per-worker limits already hold
+            if release is None:
+                limiter.timed_out += 1
+                raise AdmissionRejected(
+                    f"Host-wide queue wait deadline exceeded for {limiter.name}.", limiter.retry_after_s()
+                )
+            releases.append(release)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_timeout_s": self.queue_timeout_s,
+            "engines": {name: lim.stats() for name, lim in self.engines.items()},
+            "models": {name: lim.stats() for name, lim in self.models.items()},
+            "tenants": {name: lim.stats() for name, lim in self.tenants.items()},
+            "classes": {
+                name: {
+                    "weight": self.weights.get(name, 1.0),
+                    "admitted": w["count"],
+                    "avg_queue_wait_s": round(w["total_s"] / w["count"], 6) if w["count"] else 0.0,
+                    "max_queue_wait_s": round(w["max_s"], 6),
+                }
+                for name, w in self.queue_wait.items()
+            },
+        }
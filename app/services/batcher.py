@@ -0,0 +1,111 @@
+# app/services/batcher.py
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching in front of a blocking batch function.
+
+    Concurrent submit() calls are gathered into one call of `fn` until either
+    `max_batch_size` items are queued or `max_wait_ms` has passed since the first
+    item of the batch arrived. `fn` runs in a worker thread and its results are
+    scattered back to each caller in submission order.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.fn = fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._carry: Optional[Tuple[List[Any], asyncio.Future]] = None
+
+    def _ensure_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._carry = None
+        self._worker = loop.create_task(self._run())
+
+    async def submit(self, items: List[Any]) -> List[Any]:
+        if not items:
+            return []
+        self._ensure_worker()
+        fut = self._loop.create_future()
+        self._queue.put_nowait((list(items), fut))
+        return await fut
+
+    async def _next(self, timeout: Optional[float]):
+        if self._carry is not None:
+            entry, self._carry = self._carry, None
+            return entry
+        if timeout is None:
+            return await self._queue.get()
+        if timeout <= 0:
+            return self._queue.get_nowait()
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    async def _collect(self) -> List[Tuple[List[Any], asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._next(None)]
+        size = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+
+        while size < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0 and self._queue.empty():
+                break
+            try:
+                entry = await self._next(timeout)
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+            if size + len(entry[0]) > self.max_batch_size:
+                # Keep whole requests together; start the next batch with this one.
+                self._carry = entry
+                break
+            batch.append(entry)
+            size += len(entry[0])
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = [(items, fut) for items, fut in await self._collect() if not fut.done()]
+            if not batch:
+                continue
+
+            flat = [x for items, _ in batch for x in items]
+            try:
+                results = await asyncio.to_thread(self.fn, flat)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(flat)
+            offset = 0
+            for items, fut in batch:
+                if not fut.done():
+                    fut.set_result(results[offset : offset + len(items)])
+                offset += len(items)
+
+    async def aclose(self) -> None:
+        if self._worker is not None and not self._worker.done():
+            try:
+                self._worker.cancel()
+                await self._worker
+            except (asyncio.CancelledError, RuntimeError):
+                # RuntimeError: worker belongs to an event loop that is already closed.
+                pass
+        self._worker = None
+        self._queue = None
+        self._carry = None
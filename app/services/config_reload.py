@@ -0,0 +1,160 @@
+# app/services/config_reload.py
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+import signal
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import yaml
+
+from app.config import AppConfig, set_active_config, use_config
+from app.cores.factory import EngineFactory
+from app.services.validator import validate_config_dict
+
+logger = logging.getLogger("vilms-gateway")
+
+
+class ConfigReloader:
+    """
+    Hot reload of config.yaml with an atomic snapshot swap.
+
+    A reload validates the file, builds a new AppConfig snapshot plus a new
+    EngineFactory (engines, pools, routing index) from it, and then swaps both in
+    at once. Requests already running keep the factory/snapshot they started with;
+    the old factory is closed after it drains.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        get_factory: Callable[[], EngineFactory],
+        set_factory: Callable[[EngineFactory], None],
+        drain_timeout_s: float = 330.0,
+    ):
+        self.path = Path(path)
+        self.get_factory = get_factory
+        self.set_factory = set_factory
+        self.drain_timeout_s = drain_timeout_s
+        self.generation = 0
+        self.last_result: Dict[str, Any] = {}
+        self._lock = asyncio.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+        self._drain_tasks: set = set()
+        self._last_mtime = self._mtime()
+
+    def _mtime(self) -> Optional[float]:
+        try:
+            return self.path.stat().st_mtime
+        except OSError:
+            return None
+
+    async def reload(self, reason: str = "manual") -> Dict[str, Any]:
+        async with self._lock:
+            self._last_mtime = self._mtime()
+            try:
+                with self.path.open("r", encoding="utf-8") as f:
+                    data = yaml.safe_load(f) or {}
+                if not isinstance(data, dict):
+                    raise ValueError("Config YAML must be a mapping (top-level dict).")
+            except Exception as e:
+                return self._reject(reason, [f"Cannot read {self.path}: {e}"], [])
+
+            # Validate a copy: validate_config_dict normalizes nested sections in place.
+            res = validate_config_dict(copy.deepcopy(data))
+            if not res.ok:
+                return self._reject(reason, res.errors, res.warnings)
+
+            new_config = AppConfig(str(self.path), data=data)
+            old_factory = self.get_factory()
+            new_factory = None
+            try:
+                with use_config(new_config):
+                    new_config.compile()
+                    new_factory = EngineFactory(new_config, previous=old_factory)
+                    await new_factory.startup()
+            except Exception as e:
+                if new_factory is not None:
+                    # Close what the half-built factory opened; engines it shares with the old one stay.
+                    await new_factory.aclose(keep=old_factory.managed_engines, keep_shared=old_factory.shared)
+                return self._reject(reason, [f"Cannot build engines from new config: {e}"], res.warnings)
+
+            set_active_config(new_config)
+            self.set_factory(new_factory)
+            new_factory.activate()
+            self.generation += 1
+
+            task = asyncio.create_task(self._retire(old_factory, new_factory))
+            self._drain_tasks.add(task)
+            task.add_done_callback(self._drain_tasks.discard)
+
+            logger.info("Config reloaded (%s): generation=%d", reason, self.generation)
+            self.last_result = {
+                "ok": True,
+                "reason": reason,
+                "generation": self.generation,
+                "errors": [],
+                "warnings": res.warnings,
+            }
+            return self.last_result
+
+    def _reject(self, reason: str, errors, warnings) -> Dict[str, Any]:
+        logger.error("Config reload (%s) rejected, keeping current snapshot:\n%s", reason, "\n".join(errors))
+        self.last_result = {
+            "ok": False,
+            "reason": reason,
+            "generation": self.generation,
+            "errors": list(errors),
+            "warnings": list(warnings),
+        }
+        return self.last_result
+
+    async def _retire(self, old_factory: EngineFactory, new_factory: EngineFactory) -> None:
+        try:
+            if not await old_factory.drain(self.drain_timeout_s):
+                logger.warning(
+                    "Old config snapshot still has %d in-flight request(s) after %.0fs; closing it anyway.",
+                    old_factory.inflight,
+                    self.drain_timeout_s,
+                )
+        finally:
+            # Also on shutdown (task cancelled): stop waiting for the drain, but still close it.
+            await old_factory.aclose(keep=new_factory.managed_engines, keep_shared=new_factory.shared)
+
+    # ---------- Triggers ----------
+    async def _watch(self, interval_s: float) -> None:
+        while True:
+            await asyncio.sleep(interval_s)
+            mtime = self._mtime()
+            if mtime is not None and mtime != self._last_mtime:
+                await self.reload("file-change")
+
+    def start_watching(self, interval_s: float) -> None:
+        if interval_s > 0 and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch(interval_s))
+
+    def install_sighup(self) -> bool:
+        if not hasattr(signal, "SIGHUP"):
+            return False
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(self.reload("SIGHUP")))
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Not on the main thread (e.g. TestClient) or unsupported platform.
+            return False
+        return True
+
+    async def aclose(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        tasks = list(self._drain_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
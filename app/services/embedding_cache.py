@@ -0,0 +1,190 @@
+# app/services/embedding_cache.py
+from __future__ import annotations
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX hosts
+    fcntl = None
+
+logger = logging.getLogger("vilms-gateway")
+
+
+def embedding_cache_key(model_name: str, normalize: bool, text: str) -> bytes:
+    """Content address for one vector: sha256 over (resolved model, normalize flag, text)."""
+    h = hashlib.sha256()
+    h.update(str(model_name).encode("utf-8"))
+    h.update(b"\0" + (b"1" if normalize else b"0") + b"\0")
+    h.update(str(text).encode("utf-8"))
+    return h.digest()
+
+
+class _DiskTier:
+    """
+    Append-only vector file read through mmap.
+
+    Record layout: 32-byte key digest | uint32 dim | dim * float32 (native byte order).
+    The index is rebuilt by scanning the file at startup; a torn tail is truncated.
+    """
+
+    HEADER = struct.Struct("<32sI")
+
+    def __init__(self, directory: str, max_bytes: int):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.path = Path(directory) / "embeddings.bin"
+        self.max_bytes = max_bytes
+        self._fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._mm: Optional[mmap.mmap] = None
+        self._mapped = 0
+        self._index: Dict[bytes, Tuple[int, int]] = {}
+        self._size = 0
+        self._full_logged = False
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def _remap(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        size = os.fstat(self._fd).st_size
+        if size:
+            self._mm = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+        self._mapped = size
+
+    def _load(self) -> None:
+        self._remap()
+        offset = 0
+        while self._mm is not None and offset + self.HEADER.size <= self._mapped:
+            digest, dim = self.HEADER.unpack_from(self._mm, offset)
+            end = offset + self.HEADER.size + dim * 4
+            if end > self._mapped:
+                break
+            self._index[digest] = (offset + self.HEADER.size, dim)
+            offset = end
+
+        if offset < self._mapped:
+            logger.warning("Embedding disk cache %s has a torn tail; truncating to %d bytes.", self.path, offset)
+            os.ftruncate(self._fd, offset)
+            self._remap()
+        self._size = offset
+
+    def get(self, digest: bytes) -> Optional[array]:
+        loc = self._index.get(digest)
+        if loc is None:
+            return None
+        offset, dim = loc
+        if offset + dim * 4 > self._mapped:
+            self._remap()
+        vec = array("f")
+        vec.frombytes(self._mm[offset : offset + dim * 4])
+        return vec
+
+    def put(self, digest: bytes, vec: array) -> None:
+        if digest in self._index:
+            return
+        record = self.HEADER.pack(digest, len(vec)) + vec.tobytes()
+        if self._size + len(record) > self.max_bytes:
+            if not self._full_logged:
+                logger.warning("Embedding disk cache %s reached its size limit; new vectors stay in memory only.", self.path)
+                self._full_logged = True
+            return
+
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # Other workers may append to the same file; take the real end of file as our offset.
+            offset = os.fstat(self._fd).st_size
+            os.write(self._fd, record)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        self._index[digest] = (offset + self.HEADER.size, len(vec))
+        self._size = offset + len(record)
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class EmbeddingCache:
+    """Bounded in-memory LRU of embedding vectors with an optional mmap-backed disk tier."""
+
+    def __init__(self, max_entries: int = 10000, disk_path: Optional[str] = None, disk_max_bytes: int = 1 << 30):
+        self.max_entries = max(0, int(max_entries))
+        self._memory: "OrderedDict[bytes, array]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = _DiskTier(disk_path, disk_max_bytes) if disk_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, digest: bytes, vec: array) -> None:
+        if self.max_entries <= 0:
+            return
+        self._memory[digest] = vec
+        self._memory.move_to_end(digest)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, digests: Sequence[bytes]) -> List[Optional[List[float]]]:
+        out: List[Optional[List[float]]] = []
+        with self._lock:
+            for digest in digests:
+                vec = self._memory.get(digest)
+                if vec is not None:
+                    self._memory.move_to_end(digest)
+                    self.hits += 1
+                elif self._disk is not None and (vec := self._disk.get(digest)) is not None:
+                    self._remember(digest, vec)
+                    self.hits += 1
+                    self.disk_hits += 1
+                else:
+                    self.misses += 1
+                out.append(vec.tolist() if vec is not None else None)
+        return out
+
+    def put_many(self, items: Sequence[Tuple[bytes, Sequence[float]]]) -> None:
+        with self._lock:
+            for digest, values in items:
+                vec = array("f", values)
+                self._remember(digest, vec)
+                if self._disk is not None:
+                    self._disk.put(digest, vec)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk) if self._disk is not None else 0,
+                "disk_bytes": self._disk.size_bytes if self._disk is not None else 0,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
@@ -0,0 +1,193 @@
+# app/services/endpoint_health.py
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.config import settings
+from app.services import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+@dataclass
+class _EndpointState:
+    url: str
+    state: str = CLOSED
+    consecutive_failures: int = 0
+    cooldown: float = 0.0
+    retry_at: float = 0.0
+    probing: bool = False
+    successes: int = 0
+    failures: int = 0
+    last_error: Optional[str] = None
+
+
+class EndpointHealth:
+    """
+    Per-engine health tracker for candidate backend URLs.
+
+    - Sticky: the last URL that answered is tried first on the next request.
+    - Circuit breaker: after `failure_threshold` consecutive connect failures a URL is
+      skipped for `cooldown_s` (doubling up to `max_cooldown_s`); once the cooldown
+      elapses a single request is let through as a half-open probe.
+
+    Only transport-level failures count; an HTTP error status means the host is reachable.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        failure_threshold: int = 2,
+        cooldown_s: float = 10.0,
+        max_cooldown_s: float = 120.0,
+        clock: Callable[[], float] = time.monotonic,
+        engine: str = "",
+    ):
+        self.engine = engine
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown_s = max(0.0, float(cooldown_s))
+        self.max_cooldown_s = max(self.cooldown_s, float(max_cooldown_s))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._states: Dict[str, _EndpointState] = {}
+        for url in urls:
+            if url not in self._states:
+                self._states[url] = _EndpointState(url=url)
+        self.preferred: Optional[str] = next(iter(self._states), None)
+        # Called as on_change(url, opened, cooldown_s) when a circuit opens or closes
+        # locally; the shared-state client uses it to publish breakers host-wide.
+        self.on_change: Optional[Callable[[str, bool, float], None]] = None
+
+    @property
+    def urls(self) -> List[str]:
+        return list(self._states)
+
+    def _state_of(self, st: _EndpointState, now: float) -> str:
+        if st.state == OPEN and not st.probing and now >= st.retry_at:
+            return HALF_OPEN
+        return st.state
+
+    def candidates(self) -> List[str]:
+        """URLs in try order: preferred first, then closed ones, then open ones."""
+        with self._lock:
+            now = self._clock()
+            ordered = sorted(
+                self._states.values(),
+                key=lambda st: (st.url != self.preferred, self._state_of(st, now) == OPEN),
+            )
+            return [st.url for st in ordered]
+
+    def is_available(self, url: str) -> bool:
+        """Closed, or open with the cooldown elapsed. Unlike allow(), claims nothing."""
+        with self._lock:
+            st = self._states.get(url)
+            if st is None or st.state == CLOSED:
+                return True
+            return not st.probing and self._clock() >= st.retry_at
+
+    def allow(self, url: str) -> bool:
+        """Whether a request may try `url` now. Claims the half-open probe slot if due."""
+        with self._lock:
+            st = self._states.get(url)
+            if st is None or st.state == CLOSED:
+                return True
+            if st.probing or self._clock() < st.retry_at:
+                return False
+            st.probing = True
+            return True
+
+    def record_success(self, url: str) -> None:
+        with self._lock:
+            st = self._states.get(url)
+            if st is None:
+                return
+            reopened = st.state != CLOSED
+            st.state = CLOSED
+            st.consecutive_failures = 0
+            st.cooldown = 0.0
+            st.probing = False
+            st.successes += 1
+            self.preferred = url
+        metrics.note_upstream(self.engine, url)
+        if reopened and self.on_change is not None:
+            self.on_change(url, False, 0.0)
+
+    def record_failure(self, url: str, error: Any = None) -> None:
+        with self._lock:
+            st = self._states.get(url)
+            if st is None:
+                return
+            st.failures += 1
+            st.consecutive_failures += 1
+            st.last_error = str(error) if error is not None else None
+            was_probe = st.probing
+            st.probing = False
+            opened = was_probe or st.consecutive_failures >= self.failure_threshold
+            if opened:
+                st.cooldown = min(self.max_cooldown_s, st.cooldown * 2 if st.cooldown else self.cooldown_s)
+                st.state = OPEN
+                st.retry_at = self._clock() + st.cooldown
+            if self.preferred == url:
+                self.preferred = None
+            cooldown = st.cooldown
+        metrics.record_upstream_error(self.engine, url, error)
+        if opened and self.on_change is not None:
+            self.on_change(url, True, cooldown)
+
+    def open_remote(self, url: str, remaining_s: float) -> None:
+        """Another worker opened this circuit: skip `url` here too for `remaining_s`."""
+        with self._lock:
+            st = self._states.get(url)
+            if st is None or st.probing:
+                return
+            retry_at = self._clock() + remaining_s
+            if st.state == OPEN and st.retry_at >= retry_at:
+                return
+            st.state = OPEN
+            st.retry_at = retry_at
+            st.cooldown = max(st.cooldown, min(self.max_cooldown_s, remaining_s))
+            if self.preferred == url:
+                self.preferred = None
+
+    def record_http_error(self, url: str, error: Any) -> None:
+        """An error status from a reachable host: counted in metrics, not against the circuit."""
+        with self._lock:
+            st = self._states.get(url)
+            if st is not None:
+                st.last_error = str(error)
+        metrics.record_upstream_error(self.engine, url, error)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = self._clock()
+            return {
+                "preferred": self.preferred,
+                "endpoints": [
+                    {
+                        "url": st.url,
+                        "state": self._state_of(st, now),
+                        "consecutive_failures": st.consecutive_failures,
+                        "retry_in_s": round(max(0.0, st.retry_at - now), 3) if st.state == OPEN else 0.0,
+                        "successes": st.successes,
+                        "failures": st.failures,
+                        "last_error": st.last_error,
+                    }
+                    for st in self._states.values()
+                ],
+            }
+
+
+def build_endpoint_health(urls: Sequence[str], engine: str = "") -> EndpointHealth:
+    cfg = settings.ENDPOINT_HEALTH
+    return EndpointHealth(
+        urls,
+        engine=engine,
+        failure_threshold=cfg["failure-threshold"],
+        cooldown_s=cfg["cooldown-s"],
+        max_cooldown_s=cfg["max-cooldown-s"],
+    )
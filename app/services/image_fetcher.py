@@ -0,0 +1,197 @@
+# app/services/image_fetcher.py
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from app.config import settings
+
+_BASE64 = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+# Also accepted, then normalized: URL-safe alphabet, whitespace and line breaks.
+_LENIENT_BASE64 = re.compile(r"[A-Za-z0-9+/\-_\s]*={0,2}\s*")
+_URLSAFE_TO_STANDARD = str.maketrans("-_", "+/", " \t\r\n\f\v")
+
+
+def data_url_payload(url: str, max_bytes: int = 0) -> str:
+    """
+    Standard base64 payload of a `data:...;base64,<payload>` URL, after checking it
+    is well-formed (and at most `max_bytes` decoded, if > 0).
+
+    Standard base64 is validated in place, so multi-MB inline frames are only
+    copied once; missing or wrong padding is fixed from the tail alone. URL-safe
+    or whitespace-padded payloads are rewritten to the standard alphabet, which
+    is what Ollama's `images` field expects.
+    """
+    start = url.find(",") + 1
+    if start <= 0 or not url.startswith("data:"):
+        raise ValueError("Invalid data URL: missing ',' separator")
+    if not url[:start - 1].lower().endswith(";base64"):
+        raise ValueError("Invalid data URL: only ;base64 payloads are supported")
+    if max_bytes > 0 and (len(url) - start) * 3 // 4 > max_bytes:
+        raise ValueError(f"Inline image exceeds {max_bytes} bytes")
+    if _BASE64.fullmatch(url, start) is not None:
+        end = len(url) - url.endswith("=") - url.endswith("==")
+        missing = -(end - start) % 4
+        if missing == 3:
+            raise ValueError("Inline image is not valid base64")
+        if len(url) - end == missing:
+            return url[start:]
+        return url[start:end] + "=" * missing
+    if _LENIENT_BASE64.fullmatch(url, start) is None:
+        raise ValueError("Inline image is not valid base64")
+    payload = url[start:].translate(_URLSAFE_TO_STANDARD).rstrip("=")
+    if len(payload) % 4 == 1:
+        raise ValueError("Inline image is not valid base64")
+    return payload + "=" * (-len(payload) % 4)
+
+
+class ImageFetcher:
+    """
+    Fetches VLM image URLs as base64 for Ollama's native `images` field.
+
+    - All images of a request are fetched concurrently, at most `max_concurrency` at a time.
+    - Each download is capped by `max_bytes` and `timeout_s`.
+    - Results are cached by URL (with a TTL) and stored content-addressed, so identical
+      frames under different URLs share one base64 string. Concurrent requests for the
+      same URL share one download.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_bytes: int = 20 * 1024 * 1024,
+        timeout_s: float = 30.0,
+        cache_max_bytes: int = 256 * 1024 * 1024,
+        cache_ttl_s: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_bytes = int(max_bytes)
+        self.timeout_s = float(timeout_s)
+        self.cache_max_bytes = max(0, int(cache_max_bytes))
+        self.cache_ttl_s = float(cache_ttl_s)
+        self._clock = clock
+        self._urls: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._blobs: Dict[bytes, List] = {}  # digest -> [base64 str, url refcount]
+        self._cached_bytes = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_fetched = 0
+
+    @classmethod
+    def from_settings(cls) -> "ImageFetcher":
+        cfg = settings.IMAGE_FETCH
+        return cls(
+            max_concurrency=cfg["max-concurrency"],
+            max_bytes=cfg["max-mb"] * 1024 * 1024,
+            timeout_s=cfg["timeout-s"],
+            cache_max_bytes=cfg["cache-max-mb"] * 1024 * 1024,
+            cache_ttl_s=cfg["cache-ttl-s"],
+        )
+
+    # ---------- Cache ----------
+    def _lookup(self, url: str) -> Optional[str]:
+        entry = self._urls.get(url)
+        if entry is None:
+            return None
+        digest, expires_at = entry
+        if self._clock() >= expires_at:
+            self._forget(url)
+            return None
+        self._urls.move_to_end(url)
+        return self._blobs[digest][0]
+
+    def _forget(self, url: str) -> None:
+        digest, _ = self._urls.pop(url)
+        blob = self._blobs[digest]
+        blob[1] -= 1
+        if blob[1] <= 0:
+            del self._blobs[digest]
+            self._cached_bytes -= len(blob[0])
+
+    def _store(self, url: str, raw: bytes, b64: str) -> str:
+        if self.cache_max_bytes <= 0 or len(b64) > self.cache_max_bytes:
+            return b64
+        if url in self._urls:
+            self._forget(url)
+        digest = hashlib.sha256(raw).digest()
+        blob = self._blobs.get(digest)
+        if blob is None:
+            blob = self._blobs[digest] = [b64, 0]
+            self._cached_bytes += len(b64)
+        blob[1] += 1
+        self._urls[url] = (digest, self._clock() + self.cache_ttl_s)
+        while self._cached_bytes > self.cache_max_bytes and self._urls:
+            self._forget(next(iter(self._urls)))
+        return blob[0]
+
+    # ---------- Fetching ----------
+    async def _download(self, client: httpx.AsyncClient, url: str) -> bytes:
+        async with client.stream("GET", url, follow_redirects=True, timeout=self.timeout_s) as resp:
+            resp.raise_for_status()
+            declared = resp.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                raise ValueError(f"Image exceeds {self.max_bytes} bytes: {url}")
+            buf = bytearray()
+            async for chunk in resp.aiter_bytes():
+                buf += chunk
+                if len(buf) > self.max_bytes:
+                    raise ValueError(f"Image exceeds {self.max_bytes} bytes: {url}")
+        return bytes(buf)
+
+    async def _fetch_and_store(self, client: httpx.AsyncClient, url: str) -> str:
+        try:
+            raw = await asyncio.wait_for(self._download(client, url), self.timeout_s)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Image fetch exceeded {self.timeout_s:g}s: {url}")
+        self.bytes_fetched += len(raw)
+        return self._store(url, raw, base64.b64encode(raw).decode("ascii"))
+
+    async def fetch(self, client: httpx.AsyncClient, url: str) -> str:
+        if url.startswith("data:") and "," in url:
+            # data:image/png;base64,<payload>; the native `images` field takes the payload only.
+            return data_url_payload(url, self.max_bytes)
+
+        cached = self._lookup(url)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        task = self._inflight.get(url)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch_and_store(client, url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda t, u=url: self._inflight.pop(u, None))
+        # Shield: one caller giving up must not cancel the download other callers wait on.
+        return await asyncio.shield(task)
+
+    async def fetch_all(self, client: httpx.AsyncClient, urls: Sequence[str]) -> List[str]:
+        """Fetch every URL concurrently (bounded), preserving order."""
+        if not urls:
+            return []
+        sem = asyncio.Semaphore(self.max_concurrency)
+
+        async def one(url: str) -> str:
+            async with sem:
+                return await self.fetch(client, url)
+
+        return list(await asyncio.gather(*(one(u) for u in urls)))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_fetched": self.bytes_fetched,
+            "cached_urls": len(self._urls),
+            "cached_blobs": len(self._blobs),
+            "cached_bytes": self._cached_bytes,
+        }
@@ -0,0 +1,76 @@
+# app/services/load_balancer.py
+from __future__ import annotations
+
+import itertools
+import random
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+LEAST_OUTSTANDING = "least-outstanding"
+POWER_OF_TWO = "power-of-two"
+SUPPORTED_POLICIES = (LEAST_OUTSTANDING, POWER_OF_TWO)
+
+
+class ReplicaBalancer:
+    """
+    Chooses which backend replica serves a request from live in-flight counts.
+
+    - least-outstanding: the replica with the fewest requests in flight
+      (ties rotate round-robin so idle replicas share the load).
+    - power-of-two: two replicas sampled at random, the less loaded one wins.
+
+    The chosen replica comes first in `order()`, the rest follow by load for
+    failover. Ejection is not tracked here: callers drop replicas whose circuit
+    is open (EndpointHealth) before ordering.
+    """
+
+    def __init__(self, policy: str = LEAST_OUTSTANDING, rng: Optional[random.Random] = None):
+        self.policy = policy if policy in SUPPORTED_POLICIES else LEAST_OUTSTANDING
+        self._rng = rng or random.Random()
+        self._rr = itertools.count()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, int] = {}
+        self._picks: Dict[str, int] = {}
+
+    def inflight(self, url: str) -> int:
+        return self._inflight.get(url, 0)
+
+    def _choose(self, urls: Sequence[str]) -> str:
+        if self.policy == POWER_OF_TWO:
+            a, b = self._rng.sample(list(urls), 2)
+            return a if self.inflight(a) <= self.inflight(b) else b
+        start = next(self._rr) % len(urls)
+        rotated = list(urls[start:]) + list(urls[:start])
+        return min(rotated, key=self.inflight)
+
+    def order(self, urls: Sequence[str]) -> List[str]:
+        """`urls` in try order: the balanced choice first, then the rest least-loaded first."""
+        urls = list(dict.fromkeys(urls))
+        if len(urls) <= 1:
+            return urls
+        with self._lock:
+            first = self._choose(urls)
+            self._picks[first] = self._picks.get(first, 0) + 1
+            rest = sorted((u for u in urls if u != first), key=self.inflight)
+        return [first] + rest
+
+    def acquire(self, url: str) -> Callable[[], None]:
+        """Count a request against `url`; returns an idempotent release()."""
+        with self._lock:
+            self._inflight[url] = self._inflight.get(url, 0) + 1
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if released:
+                return
+            released = True
+            with self._lock:
+                self._inflight[url] = max(0, self._inflight.get(url, 0) - 1)
+
+        return release
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            urls = list(dict.fromkeys(list(self._inflight) + list(self._picks)))
+            return {u: {"inflight": self._inflight.get(u, 0), "picks": self._picks.get(u, 0)} for u in urls}
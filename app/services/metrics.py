@@ -0,0 +1,297 @@
+# app/services/metrics.py
+"""
+Prometheus metrics for the gateway, exposed at GET /metrics.
+
+Small self-contained implementation of the Prometheus text exposition format
+(counters, gauges, histograms with labels), so the gateway image does not need
+prometheus_client. Point-in-time state owned by other components (admission
+queues, caches, circuit breakers) is collected at scrape time via `render(families)`.
+"""
+from __future__ import annotations
+
+import contextvars
+from contextlib import contextmanager
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import httpx
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TTFT_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STAGE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30, 120)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(labels: Mapping[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _fmt_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Mapping[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_fmt_labels(dict(zip(self.labelnames, k)))} {_fmt_value(v)}" for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels: Any) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        lines = self._header()
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_fmt_labels({**labels, 'le': _fmt_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(labels)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(labels)} {count}")
+        return lines
+
+
+# (name, type, help, [(labels, value), ...]) collected at scrape time.
+Family = Tuple[str, str, str, Iterable[Tuple[Mapping[str, Any], float]]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, families: Iterable[Family] = ()) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, mtype, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {mtype}")
+            lines.extend(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "vilms_requests_total",
+    "Gateway requests by route, requested/resolved model, engine, upstream URL and HTTP status.",
+    ("route", "requested_model", "model", "engine", "upstream", "status"),
+))
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "vilms_request_duration_seconds",
+    "End-to-end request latency (streams: until the last byte).",
+    ("route", "requested_model", "model", "engine", "upstream"),
+))
+INFLIGHT = REGISTRY.register(Gauge("vilms_inflight_requests", "Requests currently being served.", ("route",)))
+UPSTREAM_ERRORS = REGISTRY.register(Counter(
+    "vilms_upstream_errors_total", "Upstream failures by engine, URL and type.", ("engine", "upstream", "type"),
+))
+TOKENS = REGISTRY.register(Counter(
+    "vilms_tokens_total", "Tokens reported in upstream usage blocks.", ("model", "engine", "kind"),
+))
+TOKENS_PER_SECOND = REGISTRY.register(Histogram(
+    "vilms_completion_tokens_per_second",
+    "Completion tokens / request duration.",
+    ("model", "engine"),
+    buckets=RATE_BUCKETS,
+))
+TTFT = REGISTRY.register(Histogram(
+    "vilms_time_to_first_token_seconds",
+    "Streaming requests: time until the first upstream chunk.",
+    ("model", "engine"),
+    buckets=TTFT_BUCKETS,
+))
+MODEL_LOAD = REGISTRY.register(Histogram(
+    "vilms_model_load_seconds",
+    "Ollama cold model loads (load_duration), reported apart from inference time.",
+    ("model",),
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+))
+MODEL_INFERENCE = REGISTRY.register(Histogram(
+    "vilms_model_inference_seconds",
+    "Ollama total_duration minus load_duration.",
+    ("model",),
+))
+MODEL_SWAPS = REGISTRY.register(Counter(
+    "vilms_model_swaps_total",
+    "Model-affinity scheduling: times the engine switched to serving another model.",
+    ("engine",),
+))
+AFFINITY_WAIT = REGISTRY.register(Histogram(
+    "vilms_affinity_wait_seconds",
+    "Model-affinity scheduling: time a request waited for its model's turn.",
+    ("engine",),
+    buckets=WAIT_BUCKETS,
+))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "vilms_request_stage_seconds",
+    "Time per request stage (alias, optimize, admission, image_fetch, upstream, translate, ...).",
+    ("route", "stage"),
+    buckets=STAGE_BUCKETS,
+))
+QUEUE_WAIT = REGISTRY.register(Histogram(
+    "vilms_admission_queue_wait_seconds",
+    "Time spent waiting for admission, by priority class.",
+    ("priority",),
+    buckets=WAIT_BUCKETS,
+))
+
+
+def error_type(error: Any) -> str:
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code}"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.ConnectError):
+        return "connect"
+    if isinstance(error, httpx.RequestError):
+        return "transport"
+    return type(error).__name__ if error is not None else "unknown"
+
+
+# ---------- Per-request trace (which upstream URL served it, time per stage) ----------
+@dataclass
+class RequestTrace:
+    started: float = field(default_factory=time.perf_counter)
+    upstream: str = ""
+    engine: str = ""
+    # stage -> seconds; a stage entered several times (one per image, retries) accumulates.
+    stages: Dict[str, float] = field(default_factory=dict)
+
+    def server_timing(self) -> str:
+        """Stages so far plus `total`, as a Server-Timing header value (milliseconds)."""
+        entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.3f}")
+        return ", ".join(entries)
+
+
+_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("vilms_request_trace", default=None)
+
+
+def start_trace() -> RequestTrace:
+    trace = RequestTrace()
+    _trace.set(trace)
+    return trace
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a block as `stage` of the current request (no-op outside a request)."""
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.stages[stage] = trace.stages.get(stage, 0.0) + time.perf_counter() - started
+
+
+def observe_stages(route: str, trace: RequestTrace) -> None:
+    for stage, seconds in trace.stages.items():
+        STAGE_LATENCY.observe(seconds, route=route, stage=stage)
+
+
+def note_upstream(engine: str, url: str) -> None:
+    trace = _trace.get()
+    if trace is not None:
+        trace.upstream = url
+        trace.engine = engine or trace.engine
+
+
+def record_upstream_error(engine: str, url: str, error: Any) -> None:
+    UPSTREAM_ERRORS.inc(engine=engine, upstream=url, type=error_type(error))
+
+
+def record_usage(model: str, engine: str, usage: Any, duration_s: float) -> None:
+    """Token counters and tokens/s from an OpenAI `usage` block."""
+    if not isinstance(usage, dict):
+        return
+    prompt = int(usage.get("prompt_tokens") or 0)
+    completion = int(usage.get("completion_tokens") or 0)
+    if prompt:
+        TOKENS.inc(prompt, model=model, engine=engine, kind="prompt")
+    if completion:
+        TOKENS.inc(completion, model=model, engine=engine, kind="completion")
+        if duration_s > 0:
+            TOKENS_PER_SECOND.observe(completion / duration_s, model=model, engine=engine)
@@ -0,0 +1,147 @@
+# app/services/ollama_probe.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse, urlunparse
+
+import httpx
+
+logger = logging.getLogger("vilms-gateway")
+
+
+@dataclass(frozen=True)
+class OllamaCapabilities:
+    """What one Ollama endpoint speaks, as last seen by the prober."""
+
+    native: bool  # /api/chat family (answered /api/version)
+    v1: bool  # OpenAI-compatible /v1 routes (answered /v1/models)
+    version: Optional[str] = None
+    loaded_models: Tuple[str, ...] = field(default_factory=tuple)
+    probed_at: float = 0.0
+
+
+def root_url(url: str, path: str) -> str:
+    parsed = urlparse(url)
+    return urlunparse((parsed.scheme or "http", parsed.netloc, path, "", "", ""))
+
+
+class OllamaProber:
+    """
+    Probes each Ollama candidate URL at startup and every `interval_s` seconds.
+
+    The result lets OllamaEngine send a request straight to the protocol a host
+    supports instead of trying native /api/chat and then /v1 on every call.
+    Hosts that were never reached stay unknown (None) and keep the try-both path.
+    """
+
+    def __init__(
+        self,
+        candidate_urls: Sequence[str],
+        get_client: Callable[[], httpx.AsyncClient],
+        interval_s: float = 60.0,
+        timeout_s: float = 3.0,
+    ):
+        self.candidate_urls = list(candidate_urls)
+        self.get_client = get_client
+        self.interval_s = float(interval_s)
+        self.timeout_s = float(timeout_s)
+        self._caps: Dict[str, OllamaCapabilities] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, candidate: str) -> Optional[OllamaCapabilities]:
+        return self._caps.get(candidate)
+
+    async def _ok_json(self, client: httpx.AsyncClient, url: str) -> Tuple[bool, Optional[dict]]:
+        resp = await client.get(url, timeout=self.timeout_s)
+        if resp.status_code != 200:
+            return False, None
+        try:
+            body = resp.json()
+        except ValueError:
+            body = None
+        return True, body if isinstance(body, dict) else None
+
+    async def probe_one(self, candidate: str) -> Optional[OllamaCapabilities]:
+        client = self.get_client()
+        try:
+            native, version_body = await self._ok_json(client, root_url(candidate, "/api/version"))
+            v1, _ = await self._ok_json(client, root_url(candidate, "/v1/models"))
+            loaded: Tuple[str, ...] = ()
+            if native:
+                ok, ps_body = await self._ok_json(client, root_url(candidate, "/api/ps"))
+                if ok and ps_body:
+                    loaded = tuple(
+                        str(m.get("name") or m.get("model"))
+                        for m in ps_body.get("models") or []
+                        if isinstance(m, dict)
+                    )
+        except httpx.HTTPError as e:
+            # Unreachable: forget what we knew; the circuit breaker handles the host itself.
+            logger.debug("Ollama probe failed for %s: %s", candidate, e)
+            self._caps.pop(candidate, None)
+            return None
+
+        caps = OllamaCapabilities(
+            native=native,
+            v1=v1,
+            version=(version_body or {}).get("version"),
+            loaded_models=loaded,
+            probed_at=time.time(),
+        )
+        previous = self._caps.get(candidate)
+        if previous is None or (previous.native, previous.v1, previous.version) != (caps.native, caps.v1, caps.version):
+            logger.info(
+                "Ollama endpoint %s: version=%s native=%s v1=%s", candidate, caps.version, caps.native, caps.v1
+            )
+        self._caps[candidate] = caps
+        return caps
+
+    async def probe_all(self) -> Dict[str, Optional[OllamaCapabilities]]:
+        results = await asyncio.gather(*(self.probe_one(c) for c in self.candidate_urls))
+        return dict(zip(self.candidate_urls, results))
+
+    def split_by_protocol(self, candidates: Sequence[str]) -> Tuple[List[str], List[str]]:
+        """Candidates (in the given order) to try for native /api/chat and for /v1."""
+        native, v1 = [], []
+        for candidate in candidates:
+            caps = self._caps.get(candidate)
+            if caps is None or caps.native:
+                native.append(candidate)
+            if caps is None or caps.v1:
+                v1.append(candidate)
+        return native, v1
+
+    def snapshot(self) -> Dict[str, Optional[dict]]:
+        out = {}
+        for candidate in self.candidate_urls:
+            caps = self._caps.get(candidate)
+            out[candidate] = None if caps is None else {**asdict(caps), "loaded_models": list(caps.loaded_models)}
+        return out
+
+    # ---------- Background refresh ----------
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as e:  # never let the refresher die
+                logger.warning("Ollama capability probe failed: %s", e)
+            if self.interval_s <= 0:
+                return
+            await asyncio.sleep(self.interval_s)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
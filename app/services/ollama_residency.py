@@ -0,0 +1,198 @@
+# app/services/ollama_residency.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+import httpx
+
+from app.services import metrics
+
+logger = logging.getLogger("vilms-gateway")
+
+NS_PER_S = 1e9
+# A load_duration above this means Ollama had to (re)load the weights.
+COLD_LOAD_THRESHOLD_S = 0.5
+
+
+@dataclass
+class ModelResidency:
+    """Gateway-side view of one Ollama model."""
+
+    keep_alive: Any = None
+    pinned: bool = False
+    preload: bool = False
+    resident: bool = False
+    expires_at: Optional[str] = None
+    size_vram: int = 0
+    cold_loads: int = 0
+    load_s_total: float = 0.0
+    last_load_s: float = 0.0
+
+
+def ollama_tag(name: str) -> str:
+    """`moondream` and `moondream:latest` are the same model; /api/ps always reports the tag."""
+    return name if ":" in name.rsplit("/", 1)[-1] else f"{name}:latest"
+
+
+def residency_options(model_cfg: Optional[Mapping[str, Any]], default_keep_alive: Any = None) -> Dict[str, Any]:
+    """Per-model params: keep-alive, preload, pin (pinned models stay loaded: keep_alive -1)."""
+    params = (model_cfg or {}).get("params") or {}
+    pinned = bool(params.get("pin", False))
+    keep_alive = params.get("keep-alive", default_keep_alive)
+    return {
+        "keep-alive": -1 if pinned else keep_alive,
+        "pin": pinned,
+        "preload": pinned or bool(params.get("preload", False)),
+    }
+
+
+class OllamaResidency:
+    """
+    Keeps configured Ollama models warm and tracks which ones are resident.
+
+    - Preloads `preload`/`pin` models at startup (empty /api/generate request).
+    - Every `interval_s` reads /api/ps and reloads pinned models Ollama evicted.
+    - Splits each native response's `load_duration` from inference time, so cold
+      loads show up as their own metric instead of a random latency spike.
+    """
+
+    def __init__(
+        self,
+        models: Mapping[str, Dict[str, Any]],
+        get_candidates: Callable[[], Sequence[str]],
+        get_client: Callable[[], httpx.AsyncClient],
+        interval_s: float = 30.0,
+        load_timeout_s: float = 300.0,
+    ):
+        self.get_candidates = get_candidates
+        self.get_client = get_client
+        self.interval_s = float(interval_s)
+        self.load_timeout_s = float(load_timeout_s)
+        self.models: Dict[str, ModelResidency] = {
+            name: ModelResidency(keep_alive=o["keep-alive"], pinned=o["pin"], preload=o["preload"])
+            for name, o in models.items()
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    def keep_alive(self, model: str) -> Any:
+        state = self.models.get(model)
+        return state.keep_alive if state is not None else None
+
+    # ---------- Upstream calls ----------
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        """First candidate host that answers; raises the last error if none does."""
+        last_error: Optional[Exception] = None
+        for candidate in self.get_candidates():
+            url = httpx.URL(candidate).copy_with(path=path, query=None)
+            try:
+                resp = await self.get_client().request(method, url, **kwargs)
+                resp.raise_for_status()
+                body = resp.json()
+                return body if isinstance(body, dict) else {}
+            except httpx.RequestError as e:
+                last_error = e
+                continue
+        raise RuntimeError(f"No Ollama endpoint answered {path}: {last_error}")
+
+    async def load(self, model: str) -> float:
+        """Load `model` (no-op if already resident) with its keep_alive; returns load seconds."""
+        body: Dict[str, Any] = {"model": model, "stream": False}
+        keep_alive = self.keep_alive(model)
+        if keep_alive is not None:
+            body["keep_alive"] = keep_alive
+        started = time.perf_counter()
+        data = await self._request("POST", "/api/generate", json=body, timeout=self.load_timeout_s)
+        self.observe(model, data)
+        elapsed = time.perf_counter() - started
+        logger.info("Ollama model %s ready in %.2fs (keep_alive=%s)", model, elapsed, keep_alive)
+        return elapsed
+
+    async def preload(self, models: Optional[Sequence[str]] = None) -> None:
+        if models is None:
+            models = [name for name, st in self.models.items() if st.preload]
+        # Sequential: loading several models at once on Jetson just makes them evict each other.
+        for model in models:
+            try:
+                await self.load(model)
+            except Exception as e:
+                logger.warning("Ollama preload of %s failed: %s", model, e)
+
+    async def refresh(self) -> List[str]:
+        """Update residency from /api/ps; returns the resident model names."""
+        data = await self._request("GET", "/api/ps", timeout=10.0)
+        resident = {}
+        for m in data.get("models") or []:
+            if isinstance(m, dict):
+                resident[ollama_tag(str(m.get("name") or m.get("model")))] = m
+        for name, st in self.models.items():
+            info = resident.get(ollama_tag(name))
+            st.resident = info is not None
+            st.expires_at = info.get("expires_at") if info else None
+            st.size_vram = int(info.get("size_vram") or 0) if info else 0
+        return list(resident)
+
+    # ---------- Per-response accounting ----------
+    def observe(self, model: str, native: Mapping[str, Any]) -> None:
+        """Split a native response's durations into model load and inference."""
+        load_s = float(native.get("load_duration") or 0) / NS_PER_S
+        total_s = float(native.get("total_duration") or 0) / NS_PER_S
+        st = self.models.get(model)
+        label = model if st is not None else "other"
+        if total_s:
+            metrics.MODEL_INFERENCE.observe(max(0.0, total_s - load_s), model=label)
+        if load_s >= COLD_LOAD_THRESHOLD_S:
+            metrics.MODEL_LOAD.observe(load_s, model=label)
+        if st is None:
+            return
+        st.resident = True
+        if load_s >= COLD_LOAD_THRESHOLD_S:
+            st.cold_loads += 1
+            st.load_s_total += load_s
+            st.last_load_s = load_s
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "resident": st.resident,
+                "pinned": st.pinned,
+                "preload": st.preload,
+                "keep_alive": st.keep_alive,
+                "expires_at": st.expires_at,
+                "size_vram": st.size_vram,
+                "cold_loads": st.cold_loads,
+                "last_load_s": round(st.last_load_s, 3),
+                "avg_load_s": round(st.load_s_total / st.cold_loads, 3) if st.cold_loads else 0.0,
+            }
+            for name, st in self.models.items()
+        }
+
+    # ---------- Background warm-up / refresh ----------
+    async def _run(self) -> None:
+        await self.preload()
+        while self.interval_s > 0:
+            await asyncio.sleep(self.interval_s)
+            try:
+                await self.refresh()
+                evicted = [name for name, st in self.models.items() if st.pinned and not st.resident]
+                if evicted:
+                    logger.info("Reloading pinned Ollama models evicted by the backend: %s", evicted)
+                    await self.preload(evicted)
+            except Exception as e:  # never let the refresher die
+                logger.warning("Ollama residency refresh failed: %s", e)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,33 +1,222 @@
 # app/services/optimizer.py
 from __future__ import annotations
 
-from copy import deepcopy
+import asyncio
+import base64
+import binascii
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
 from app.config import settings
+from app.services.image_fetcher import data_url_payload
+
+try:  # Optional: image preprocessing is skipped when OpenCV is not installed.
+    import cv2
+    import numpy as np
+except ImportError:  # pragma: no cover
+    cv2 = None
+    np = None
+
+logger = logging.getLogger("vilms-gateway")
+
+_MIME = {"jpeg": "image/jpeg", "webp": "image/webp"}
+_executors: Dict[Tuple[str, int], Executor] = {}
+_warned_no_cv2 = False
+
+
+def select_frames(count: int, max_frames: int, strategy: str = "last") -> List[int]:
+    """
+    Indices of the frames to keep, in clip order.
+
+    - last: the latest `max_frames` frames
+    - uniform: one frame from the middle of each of `max_frames` equal segments
+    - first-last-uniform: first and last frame plus evenly spaced frames in between
+    """
+    if max_frames <= 0 or count <= max_frames:
+        return list(range(count))
+    if strategy == "uniform":
+        step = count / max_frames
+        return [int(i * step + step / 2) for i in range(max_frames)]
+    if strategy == "first-last-uniform" and max_frames >= 2:
+        step = (count - 1) / (max_frames - 1)
+        return [round(i * step) for i in range(max_frames)]
+    return list(range(count - max_frames, count))
+
+
+def frame_options(model_cfg: Optional[Mapping[str, Any]] = None) -> Tuple[int, str]:
+    """(max-frames, frame-strategy): per-model params first, then serving defaults."""
+    params = (model_cfg or {}).get("params") or {}
+    max_frames = int(params.get("max-frames", settings.DEFAULT_MAX_FRAMES))
+    strategy = str(params.get("frame-strategy", settings.DEFAULT_FRAME_STRATEGY)).strip().lower()
+    return max_frames, strategy
 
 
-def optimize_payload(payload: dict) -> dict:
-    """Trim image frames on Jetson while keeping the OpenAI vision schema."""
+def optimize_payload(payload: dict, model_cfg: Optional[Mapping[str, Any]] = None) -> dict:
+    """
+    Trim image frames on Jetson while keeping the OpenAI vision schema.
+
+    Copy-free: only the messages whose frames are trimmed get a new container; all
+    other messages, parts and base64 image strings are shared with the input payload.
+    """
     if settings.HOST_PLATFORM != "js":
         return payload
 
-    out = deepcopy(payload)
-    messages = out.get("messages", [])
+    max_frames, strategy = frame_options(model_cfg)
+    messages = payload.get("messages")
+    if not isinstance(messages, list):
+        return payload
 
-    for msg in messages:
-        content = msg.get("content")
+    out_messages = None
+    for i, msg in enumerate(messages):
+        content = msg.get("content") if isinstance(msg, dict) else None
         if not isinstance(content, list):
             continue
 
-        text_items = [it for it in content if isinstance(it, dict) and it.get("type") == "text"]
         image_items = [it for it in content if isinstance(it, dict) and it.get("type") == "image_url"]
+        if len(image_items) <= max_frames:
+            continue
+
+        text_items = [it for it in content if isinstance(it, dict) and it.get("type") == "text"]
+        keep = select_frames(len(image_items), max_frames, strategy)
+        if out_messages is None:
+            out_messages = list(messages)
+        out_messages[i] = {**msg, "content": text_items + [image_items[k] for k in keep]}
+
+    if out_messages is None:
+        return payload
+    return {**payload, "messages": out_messages}
+
 
-        if len(image_items) > settings.DEFAULT_MAX_FRAMES:
-            image_items = image_items[-settings.DEFAULT_MAX_FRAMES :]
+# ---------- Image downscale / re-encode ----------
+def image_preprocess_options(model_cfg: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """serving.image-preprocess, overridden per model by params image-max-edge/-format/-quality."""
+    opts = dict(settings.IMAGE_PREPROCESS)
+    params = (model_cfg or {}).get("params") or {}
+    for key in ("max-edge", "format", "quality"):
+        if f"image-{key}" in params:
+            opts[key] = params[f"image-{key}"]
+    opts["max-edge"] = int(opts["max-edge"])
+    opts["quality"] = int(opts["quality"])
+    opts["format"] = str(opts["format"]).strip().lower()
+    return opts
 
-        msg["content"] = text_items + image_items
 
-    out["messages"] = messages
-    return out
+def _get_executor(kind: str, workers: int) -> Executor:
+    key = (kind, max(1, workers))
+    executor = _executors.get(key)
+    if executor is None:
+        if kind == "process":
+            executor = ProcessPoolExecutor(max_workers=key[1])
+        else:
+            executor = ThreadPoolExecutor(max_workers=key[1], thread_name_prefix="image-preprocess")
+        _executors[key] = executor
+    return executor
+
+
+def shutdown_executors() -> None:
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
+
+
+def resize_encode_image(b64: str, max_edge: int, fmt: str, quality: int) -> Optional[str]:
+    """
+    Decode a base64 image, shrink it to `max_edge` and re-encode it.
+    Returns the new base64 payload, or None if the image is not decodable or would not get smaller.
+    Runs in a worker thread/process (OpenCV releases the GIL).
+    """
+    try:
+        raw = base64.b64decode(b64, validate=False)
+    except (binascii.Error, ValueError):
+        return None
+    img = cv2.imdecode(np.frombuffer(raw, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+
+    h, w = img.shape[:2]
+    scale = max_edge / float(max(h, w)) if max_edge > 0 else 1.0
+    if scale < 1.0:
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+    if fmt == "webp":
+        ok, buf = cv2.imencode(".webp", img, [cv2.IMWRITE_WEBP_QUALITY, quality])
+    else:
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok or len(buf) >= len(raw):
+        return None
+    return base64.b64encode(buf.tobytes()).decode("ascii")
+
+
+async def preprocess_images(
+    payload: dict,
+    model_cfg: Optional[Mapping[str, Any]] = None,
+    fetch: Optional[Callable[[str], Awaitable[str]]] = None,
+) -> Tuple[dict, Dict[str, int]]:
+    """
+    Downscale and re-encode image_url parts off the event loop.
+
+    `data:` URLs are always processed; http(s) URLs only when `fetch` (url -> base64) is given.
+    Only the messages/parts that change are rebuilt. Returns (payload, stats) where stats
+    reports images processed and bytes saved (base64 bytes, as sent upstream).
+    """
+    stats = {"images": 0, "bytes_in": 0, "bytes_out": 0, "bytes_saved": 0}
+    opts = image_preprocess_options(model_cfg)
+    if not opts["enabled"] or opts["format"] not in _MIME:
+        return payload, stats
+    if cv2 is None:
+        global _warned_no_cv2
+        if not _warned_no_cv2:
+            logger.warning("serving.image-preprocess is enabled but OpenCV is not installed; skipping.")
+            _warned_no_cv2 = True
+        return payload, stats
+
+    targets = []  # (message index, part index, url)
+    for i, msg in enumerate(payload.get("messages") or []):
+        content = msg.get("content") if isinstance(msg, dict) else None
+        if not isinstance(content, list):
+            continue
+        for j, item in enumerate(content):
+            if not isinstance(item, dict) or item.get("type") != "image_url":
+                continue
+            image_obj = item.get("image_url")
+            url = image_obj.get("url") if isinstance(image_obj, dict) else None
+            if isinstance(url, str) and ((url.startswith("data:") and "," in url) or fetch is not None):
+                targets.append((i, j, url))
+    if not targets:
+        return payload, stats
+
+    loop = asyncio.get_running_loop()
+    executor = _get_executor(opts["executor"], opts["workers"])
+
+    async def one(url: str) -> Tuple[str, Optional[str]]:
+        b64 = data_url_payload(url) if url.startswith("data:") else await fetch(url)
+        out = await loop.run_in_executor(
+            executor, resize_encode_image, b64, opts["max-edge"], opts["format"], opts["quality"]
+        )
+        return b64, out
+
+    results = await asyncio.gather(*(one(url) for _, _, url in targets))
+
+    messages = list(payload["messages"])
+    rebuilt = set()
+    prefix = f"data:{_MIME[opts['format']]};base64,"
+    for (i, j, _), (b64, out) in zip(targets, results):
+        if out is None:
+            continue
+        stats["images"] += 1
+        stats["bytes_in"] += len(b64)
+        stats["bytes_out"] += len(out)
+        if i not in rebuilt:
+            messages[i] = {**messages[i], "content": list(messages[i]["content"])}
+            rebuilt.add(i)
+        item = messages[i]["content"][j]
+        messages[i]["content"][j] = {**item, "image_url": {**item["image_url"], "url": prefix + out}}
+
+    stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+    if not rebuilt:
+        return payload, stats
+    return {**payload, "messages": messages}, stats
 
 
 class PayloadOptimizer:
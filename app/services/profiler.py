@@ -0,0 +1,136 @@
+# app/services/profiler.py
+"""
+Opt-in sampling profiler for selected requests (serving.profiling).
+
+While a profiled request is in flight, a background thread samples the event
+loop thread's Python stack every `interval-ms` and writes the samples in
+folded-stack format (`frame;frame;frame count`, one stack per line) to
+`dir/<time>-<route>-<id>.folded`, readable by speedscope or flamegraph.pl.
+
+The loop thread is shared, so a profile shows everything the worker ran
+during the request, including other requests and idle time in the selector.
+Only one request is profiled at a time per worker.
+"""
+from __future__ import annotations
+
+import itertools
+import logging
+import sys
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional
+
+logger = logging.getLogger("vilms-gateway")
+
+PROFILE_HEADER = "x-profile"
+_TRUTHY = {"1", "true", "yes", "on"}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})"
+
+
+class StackSampler:
+    """Samples one thread's stack on a daemon thread; the file is written when sampling stops."""
+
+    def __init__(self, thread_id: int, path: Path, interval_s: float = 0.005, max_s: float = 60.0):
+        self.thread_id = thread_id
+        self.path = path
+        self.interval_s = max(0.0005, float(interval_s))
+        self.max_s = float(max_s)
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="vilms-profiler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        self._thread.join(timeout)
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        if stack:
+            self.samples[";".join(reversed(stack))] += 1
+
+    def _run(self) -> None:
+        deadline = time.monotonic() + self.max_s
+        while not self._stop.wait(self.interval_s):
+            self._sample()
+            if time.monotonic() >= deadline:
+                break
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("w", encoding="utf-8") as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            logger.info("Profile written: %s (%d samples)", self.path, sum(self.samples.values()))
+        except OSError as e:
+            logger.warning("Could not write profile %s: %s", self.path, e)
+
+
+class RequestProfiler:
+    """
+    Decides which requests get profiled and runs their samplers.
+
+    A request is profiled when profiling is enabled and either it carries
+    `X-Profile: 1` or the next-N counter armed via POST /admin/profile is > 0.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._armed = 0
+        self._active: Optional[StackSampler] = None
+        self._ids = itertools.count(1)
+        self.recent: deque = deque(maxlen=20)
+
+    def arm(self, requests: int) -> int:
+        with self._lock:
+            self._armed = max(0, int(requests))
+            return self._armed
+
+    def start(self, route: str, headers: Mapping[str, str], cfg: Mapping[str, Any]) -> Optional[StackSampler]:
+        """A running sampler if this request should be profiled, else None."""
+        if not cfg["enabled"]:
+            return None
+        requested = headers.get(PROFILE_HEADER, "").strip().lower() in _TRUTHY
+        with self._lock:
+            if self._active is not None and self._active.running:
+                return None
+            if not requested:
+                if self._armed <= 0:
+                    return None
+                self._armed -= 1
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{route}-{next(self._ids)}.folded"
+            sampler = StackSampler(
+                threading.get_ident(),
+                Path(cfg["dir"]) / name,
+                interval_s=cfg["interval-ms"] / 1000.0,
+                max_s=cfg["max-seconds"],
+            )
+            self._active = sampler.start()
+            self.recent.append(str(sampler.path))
+        return sampler
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = self._active is not None and self._active.running
+            return {"armed": self._armed, "active": active, "recent": list(self.recent)}
+
+
+PROFILER = RequestProfiler()
@@ -0,0 +1,178 @@
+# app/services/readiness.py
+"""
+Startup warm-up and cached readiness for GET /ready (serving.readiness).
+
+At startup the monitor runs the warm-up steps (e.g. loading the in-process
+embedding model) in the background, then keeps one cached result per
+component (ollama, vllm, embedding), refreshed concurrently every
+`interval-s`. GET /ready only reads the cache, so orchestrators can poll it
+as often as they like; it answers 503 until warm-up has finished and the
+required components are ready, so the first user never pays for it.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, Optional, Sequence
+
+import httpx
+
+logger = logging.getLogger("vilms-gateway")
+
+# A probe raises when its component is not ready; the returned string is shown as detail.
+Probe = Callable[[], Awaitable[Optional[str]]]
+
+
+@dataclass
+class ComponentStatus:
+    ready: bool = False
+    detail: Optional[str] = None
+    error: Optional[str] = None
+    checked_at: float = 0.0
+    latency_ms: float = 0.0
+
+
+def http_probe(get_client: Callable[[], httpx.AsyncClient], urls: Sequence[str], timeout_s: float) -> Probe:
+    """
+    Ready when any of `urls` answers. Any status below 500 counts: the host is up.
+
+    Requests go through the engine's pooled client, so a probe also leaves a
+    keep-alive connection open for the first real request. Endpoint health is
+    not touched; circuit breakers only react to real traffic.
+    """
+
+    async def one(client: httpx.AsyncClient, url: str) -> Optional[str]:
+        try:
+            resp = await client.get(url, timeout=timeout_s)
+        except httpx.HTTPError as e:
+            return f"{url} ({type(e).__name__})"
+        return None if resp.status_code < 500 else f"{url} (HTTP {resp.status_code})"
+
+    async def probe() -> Optional[str]:
+        client = get_client()
+        errors = await asyncio.gather(*(one(client, url) for url in urls))
+        up = [url for url, error in zip(urls, errors) if error is None]
+        if not up:
+            raise RuntimeError("No backend answered. Tried: " + ", ".join(e for e in errors if e))
+        return f"{len(up)}/{len(urls)} up: " + ", ".join(up)
+
+    return probe
+
+
+class ReadinessMonitor:
+    """
+    Runs `warmups` once in the background, then caches `probes` results.
+
+    require="all": every component must be ready; "any": at least one.
+    """
+
+    def __init__(
+        self,
+        probes: Dict[str, Probe],
+        warmups: Optional[Dict[str, Callable[[], Awaitable[None]]]] = None,
+        interval_s: float = 10.0,
+        timeout_s: float = 5.0,
+        require: str = "all",
+        previous: Optional["ReadinessMonitor"] = None,
+    ):
+        self.probes = dict(probes)
+        self.warmups = dict(warmups or {})
+        self.interval_s = float(interval_s)
+        self.timeout_s = float(timeout_s)
+        self.require = require
+        # After a reload, keep answering from the last results while the new snapshot warms up.
+        self.components: Dict[str, ComponentStatus] = {
+            name: previous.components[name]
+            for name in self.probes
+            if previous is not None and name in previous.components
+        }
+        for name in self.probes:
+            self.components.setdefault(name, ComponentStatus())
+        self.warmed_up = previous is not None and previous.warmed_up and not self.warmups
+        self.warmup_s: Optional[float] = previous.warmup_s if previous is not None else None
+        self.warmup_errors: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        if not self.warmed_up:
+            return False
+        states = [st.ready for st in self.components.values()]
+        if not states:
+            return True
+        return any(states) if self.require == "any" else all(states)
+
+    async def _check(self, name: str, probe: Probe) -> None:
+        started = time.perf_counter()
+        status = ComponentStatus(checked_at=time.time())
+        try:
+            status.detail = await asyncio.wait_for(probe(), self.timeout_s)
+            status.ready = True
+        except asyncio.TimeoutError:
+            status.error = f"no answer within {self.timeout_s:g}s"
+        except Exception as e:
+            status.error = str(e)
+        status.latency_ms = round((time.perf_counter() - started) * 1000.0, 3)
+        previous = self.components.get(name)
+        if previous is not None and previous.checked_at and previous.ready != status.ready:
+            logger.info("Readiness of %s: %s", name, "ready" if status.ready else f"not ready ({status.error})")
+        self.components[name] = status
+
+    async def refresh(self) -> None:
+        await asyncio.gather(*(self._check(name, probe) for name, probe in self.probes.items()))
+
+    async def _warm_one(self, name: str, warmup: Callable[[], Awaitable[None]]) -> None:
+        try:
+            await warmup()
+        except Exception as e:
+            # Recorded, not fatal: the component's probe reports whether it is usable.
+            self.warmup_errors[name] = str(e)
+            logger.warning("Warm-up of %s failed: %s", name, e)
+
+    async def warm_up(self) -> None:
+        started = time.perf_counter()
+        await self.refresh()  # cheap probes first: /ready shows backend state during a long model load
+        await asyncio.gather(*(self._warm_one(name, warmup) for name, warmup in self.warmups.items()))
+        await self.refresh()
+        self.warmup_s = round(time.perf_counter() - started, 3)
+        self.warmed_up = True
+        logger.info("Warm-up finished in %.2fs; ready=%s", self.warmup_s, self.ready)
+
+    async def _run(self) -> None:
+        try:
+            await self.warm_up()
+        except Exception as e:  # never leave /ready stuck on "warming up"
+            logger.warning("Warm-up failed: %s", e)
+            self.warmed_up = True
+        while self.interval_s > 0:
+            await asyncio.sleep(self.interval_s)
+            try:
+                await self.refresh()
+            except Exception as e:  # never let the refresher die
+                logger.warning("Readiness refresh failed: %s", e)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "ready": self.ready,
+            "warming_up": not self.warmed_up,
+            "warmup_s": self.warmup_s,
+            "require": self.require,
+            "components": {name: asdict(st) for name, st in self.components.items()},
+            "warmup_errors": dict(self.warmup_errors),
+        }
+
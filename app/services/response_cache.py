@@ -0,0 +1,97 @@
+# app/services/response_cache.py
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.cores import fastjson
+from app.services.shared_state import SharedStateUnavailable
+
+SHARED_PREFIX = "rc:"
+
+
+class ResponseCache:
+    """
+    Bounded TTL + LRU cache of chat completion results, keyed by the canonical
+    (post-alias, post-optimizer) request hash. Only used for deterministic requests.
+
+    With `shared` (a SharedStateClient) set, entries are also written to the
+    host-wide cache and local misses are looked up there via aget().
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shared_hits = 0
+        self.shared = None
+
+    def _lookup(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if self._clock() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        # Top-level copy: callers rewrite `model` per request.
+        return dict(result)
+
+    def get(self, key: str) -> Optional[dict]:
+        result = self._lookup(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    async def aget(self, key: str) -> Optional[dict]:
+        """get(), falling back to the host-wide cache shared with other workers."""
+        result = self._lookup(key)
+        if result is None and self.shared is not None and self.max_entries > 0:
+            try:
+                found = (await self.shared.cache_get([SHARED_PREFIX + key]))[0]
+            except SharedStateUnavailable:
+                found = None
+            if found is not None:
+                value, ttl_left = found
+                result = fastjson.loads(value)
+                self._store(key, result, ttl_left or self.ttl_s)
+                self.shared_hits += 1
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def put(self, key: str, result: Any, ttl_s: Optional[float] = None) -> None:
+        if self.max_entries <= 0 or not isinstance(result, dict):
+            return
+        ttl_s = self.ttl_s if ttl_s is None else float(ttl_s)
+        self._store(key, result, ttl_s)
+        if self.shared is not None:
+            self.shared.cache_set_nowait([(SHARED_PREFIX + key, fastjson.dumps(result), ttl_s)])
+
+    def _store(self, key: str, result: dict, ttl_s: float) -> None:
+        self._entries[key] = (self._clock() + ttl_s, dict(result))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "shared_hits": self.shared_hits,
+        }
@@ -0,0 +1,118 @@
+# app/services/scheduler.py
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Mapping, Optional
+
+
+@dataclass(frozen=True)
+class Ticket:
+    """Who a request belongs to (tenant) and how urgent it is (priority class)."""
+
+    tenant: str = "anonymous"
+    priority: str = "interactive"
+    max_inflight: Optional[int] = None  # per-tenant cap override (serving.scheduling.api-keys)
+
+
+def _bearer_token(headers: Mapping[str, str]) -> str:
+    auth = headers.get("authorization", "")
+    if auth.lower().startswith("bearer "):
+        return auth[7:].strip()
+    return ""
+
+
+def classify(headers: Mapping[str, str], scheduling: Mapping[str, Any]) -> Ticket:
+    """
+    Map a request to a Ticket from its API key or headers (serving.scheduling).
+
+    Order: api-keys entry for the bearer token, then the tenant/class headers, then
+    defaults. Unknown class names fall back to the default class, so a client cannot
+    invent a class with its own weight.
+    """
+    classes = scheduling["classes"]
+    default_class = scheduling["default-class"]
+    token = _bearer_token(headers)
+    key_cfg = scheduling["api-keys"].get(token) if token else None
+
+    if key_cfg is not None:
+        tenant = key_cfg.get("tenant") or f"key:{hashlib.sha256(token.encode()).hexdigest()[:12]}"
+        priority = key_cfg.get("class") or default_class
+        max_inflight = key_cfg.get("max-inflight")
+    else:
+        tenant = headers.get(scheduling["tenant-header"].lower(), "").strip()
+        if not tenant and token:
+            # Never expose raw keys in stats/metrics.
+            tenant = f"key:{hashlib.sha256(token.encode()).hexdigest()[:12]}"
+        tenant = tenant or "anonymous"
+        priority = headers.get(scheduling["class-header"].lower(), "").strip().lower() or default_class
+        max_inflight = None
+
+    if priority not in classes:
+        priority = default_class
+    return Ticket(tenant=tenant, priority=priority, max_inflight=None if max_inflight is None else int(max_inflight))
+
+
+class FairQueue:
+    """
+    Weighted fair wait queue (stride scheduling) across priority classes, with
+    round-robin across tenants inside a class.
+
+    Each class advances its virtual pass by 1/weight per dequeued item; the backlogged
+    class with the lowest pass goes next. A class that was idle restarts at the current
+    virtual time, so it cannot bank credit while idle. With a single class and tenant
+    this is plain FIFO.
+    """
+
+    def __init__(self, weights: Optional[Mapping[str, float]] = None):
+        self.weights = weights if weights is not None else {}
+        self._classes: Dict[str, "OrderedDict[str, Deque[Any]]"] = {}
+        self._pass: Dict[str, float] = {}
+        self._vtime = 0.0
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _weight(self, priority: str) -> float:
+        return max(float(self.weights.get(priority, 1.0)), 1e-6)
+
+    def push(self, ticket: Ticket, item: Any) -> None:
+        tenants = self._classes.get(ticket.priority)
+        if tenants is None:
+            tenants = self._classes[ticket.priority] = OrderedDict()
+            self._pass[ticket.priority] = max(self._pass.get(ticket.priority, 0.0), self._vtime)
+        tenants.setdefault(ticket.tenant, deque()).append(item)
+        self._len += 1
+
+    def pop(self) -> Any:
+        priority = min(self._classes, key=lambda c: (self._pass[c], -self._weight(c)))
+        tenants = self._classes[priority]
+        tenant, items = next(iter(tenants.items()))
+        item = items.popleft()
+        if items:
+            tenants.move_to_end(tenant)  # round-robin between tenants of the class
+        else:
+            del tenants[tenant]
+        if not tenants:
+            del self._classes[priority]
+        self._vtime = self._pass[priority]
+        self._pass[priority] += 1.0 / self._weight(priority)
+        self._len -= 1
+        return item
+
+    def remove(self, item: Any) -> bool:
+        for priority, tenants in list(self._classes.items()):
+            for tenant, items in list(tenants.items()):
+                try:
+                    items.remove(item)
+                except ValueError:
+                    continue
+                if not items:
+                    del tenants[tenant]
+                if not tenants:
+                    del self._classes[priority]
+                self._len -= 1
+                return True
+        return False
@@ -0,0 +1,641 @@
+# app/services/shared_state.py
+"""
+Host-wide state shared by all gateway workers (serving.shared-state).
+
+`uvicorn --workers N` runs N processes, each with its own caches, admission
+limiters and circuit breakers. This module adds a small sidecar process on a
+local Unix socket that every worker on the host talks to:
+
+- counters (incr / read)
+- semaphores: host-wide concurrency caps. Permits are tied to the worker's
+  connection and released if it drops, so a crashed worker cannot leak slots.
+- an LRU byte cache with per-entry TTL, bounded by total size.
+
+Workers fail open: while the sidecar is unreachable, callers fall back to
+their per-process state and the client reconnects in the background. The
+first worker to start launches the sidecar (`autostart`); a lock file keeps it
+to one instance per socket path, and it exits once no worker has been
+connected for `idle-exit-s`.
+
+    python -m app.services.shared_state --socket /tmp/vilms-gateway-state.sock --max-mb 256
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import os
+import struct
+import subprocess
+import sys
+import time
+from collections import Counter, OrderedDict, deque
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX hosts
+    fcntl = None
+
+logger = logging.getLogger("vilms-gateway")
+
+_FRAME = struct.Struct("!II")  # header length, payload length
+_REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+class SharedStateUnavailable(RuntimeError):
+    """The sidecar could not be reached or did not answer in time."""
+
+
+def _encode(header: Dict[str, Any], payload: bytes = b"") -> bytes:
+    head = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return _FRAME.pack(len(head), len(payload)) + head + payload
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], bytes]:
+    head_len, payload_len = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    header = json.loads(await reader.readexactly(head_len))
+    payload = await reader.readexactly(payload_len) if payload_len else b""
+    return header, payload
+
+
+# ---------- Sidecar ----------
+class ByteLRU:
+    """Bytes values with optional TTL, evicted least-recently-used beyond `max_bytes`."""
+
+    def __init__(self, max_bytes: int, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max(0, int(max_bytes))
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """(value, seconds left; 0 = no expiry) or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        left = expires_at - self._clock() if expires_at else 0.0
+        if expires_at and left <= 0:
+            self.delete(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value, left
+
+    def set(self, key: str, value: bytes, ttl_s: float = 0.0) -> None:
+        if len(value) > self.max_bytes:
+            return
+        self.delete(key)
+        self._entries[key] = (self._clock() + ttl_s if ttl_s > 0 else 0.0, value)
+        self.size_bytes += len(value)
+        while self.size_bytes > self.max_bytes:
+            _, (_, old) = self._entries.popitem(last=False)
+            self.size_bytes -= len(old)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= len(entry[1])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class _Connection:
+    def __init__(self):
+        self.holds: Counter = Counter()  # semaphore key -> permits held
+        self.tasks: set = set()
+        self.closed = False
+
+
+class _Semaphore:
+    def __init__(self):
+        self.held = 0
+        self.waiters: deque = deque()  # (future, limit, connection)
+
+
+class SharedStateServer:
+    def __init__(self, path: str, max_bytes: int, idle_exit_s: float = 0.0):
+        self.path = path
+        self.cache = ByteLRU(max_bytes)
+        self.counters: Dict[str, int] = {}
+        self.idle_exit_s = float(idle_exit_s)
+        self._sems: Dict[str, _Semaphore] = {}
+        self._connections = 0
+        self._idle_since = time.monotonic()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> "SharedStateServer":
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # stale socket; the instance lock says nobody else serves it
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o600)
+        return self
+
+    async def serve_forever(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_exit_s / 4) if self.idle_exit_s > 0 else 3600)
+            if self.idle_exit_s > 0 and self._connections == 0 and time.monotonic() - self._idle_since >= self.idle_exit_s:
+                logger.info("Shared-state sidecar idle for %.0fs, exiting", self.idle_exit_s)
+                return
+
+    async def aclose(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    # ---------- Semaphores ----------
+    def _wake(self, key: str, sem: _Semaphore) -> None:
+        while sem.waiters:
+            fut, limit, conn = sem.waiters[0]
+            if fut.done() or conn.closed:
+                sem.waiters.popleft()
+                continue
+            if sem.held >= limit:
+                break
+            sem.waiters.popleft()
+            sem.held += 1
+            conn.holds[key] += 1
+            fut.set_result(None)
+
+    async def _sem_acquire(self, conn: _Connection, key: str, limit: int, timeout_s: float) -> bool:
+        sem = self._sems.setdefault(key, _Semaphore())
+        if sem.held < limit and not sem.waiters:
+            sem.held += 1
+            conn.holds[key] += 1
+            return True
+        if timeout_s <= 0:
+            return False
+        fut = asyncio.get_running_loop().create_future()
+        sem.waiters.append((fut, limit, conn))
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout_s)
+            return True
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                return True  # granted as the deadline hit
+            fut.cancel()
+            return False
+
+    def _sem_release(self, conn: _Connection, key: str) -> None:
+        if conn.holds[key] <= 0:
+            return  # not ours (e.g. a release sent before a reconnect)
+        conn.holds[key] -= 1
+        sem = self._sems[key]
+        sem.held -= 1
+        self._wake(key, sem)
+
+    # ---------- Requests ----------
+    async def _reply_acquire(self, writer: asyncio.StreamWriter, conn: _Connection, header: Dict[str, Any]) -> None:
+        ok = await self._sem_acquire(conn, header["key"], int(header["limit"]), float(header.get("timeout_s", 0)))
+        if conn.closed:
+            return
+        writer.write(_encode({"id": header["id"], "ok": True, "acquired": ok}))
+
+    def _dispatch(self, conn: _Connection, header: Dict[str, Any], payload: bytes) -> Tuple[Dict[str, Any], bytes]:
+        op = header.get("op")
+        if op == "ping":
+            return {}, b""
+        if op == "incr":
+            key = header["key"]
+            self.counters[key] = self.counters.get(key, 0) + int(header.get("delta", 1))
+            return {"value": self.counters[key]}, b""
+        if op == "sem_release":
+            self._sem_release(conn, header["key"])
+            return {}, b""
+        if op == "get":
+            sizes, ttls, chunks = [], [], []
+            for key in header["keys"]:
+                found = self.cache.get(key)
+                sizes.append(len(found[0]) if found else -1)
+                ttls.append(round(found[1], 3) if found else 0)
+                if found:
+                    chunks.append(found[0])
+            return {"sizes": sizes, "ttls": ttls}, b"".join(chunks)
+        if op == "set":
+            offset = 0
+            for key, size, ttl_s in header["items"]:
+                self.cache.set(key, payload[offset:offset + size], float(ttl_s))
+                offset += size
+            return {}, b""
+        if op == "delete":
+            for key in header["keys"]:
+                self.cache.delete(key)
+            return {}, b""
+        if op == "stats":
+            return {"stats": self.stats()}, b""
+        raise ValueError(f"unknown op: {op}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        conn = _Connection()
+        self._connections += 1
+        try:
+            while True:
+                header, payload = await _read_frame(reader)
+                if header.get("op") == "sem_acquire":
+                    task = asyncio.create_task(self._reply_acquire(writer, conn, header))
+                    conn.tasks.add(task)
+                    task.add_done_callback(conn.tasks.discard)
+                    continue
+                try:
+                    reply, data = self._dispatch(conn, header, payload)
+                    reply["ok"] = True
+                except (KeyError, TypeError, ValueError) as e:
+                    reply, data = {"ok": False, "error": str(e)}, b""
+                if header.get("id"):  # id 0: fire-and-forget, no reply
+                    reply["id"] = header["id"]
+                    writer.write(_encode(reply, data))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            # The worker is gone: drop its waiters and give back every permit it held.
+            conn.closed = True
+            for task in list(conn.tasks):
+                task.cancel()
+            for key, count in list(conn.holds.items()):
+                for _ in range(count):
+                    self._sem_release(conn, key)
+            self._connections -= 1
+            if self._connections == 0:
+                self._idle_since = time.monotonic()
+            writer.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": self._connections,
+            "counters": len(self.counters),
+            "semaphores": {
+                key: {"held": sem.held, "waiting": len(sem.waiters)}
+                for key, sem in self._sems.items()
+                if sem.held or sem.waiters
+            },
+            "cache": self.cache.stats(),
+        }
+
+
+def _lock_instance(path: str) -> Optional[int]:
+    """Exclusive lock next to the socket; None if another sidecar already holds it."""
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+    if fcntl is None:
+        return fd
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+async def serve(path: str, max_bytes: int, idle_exit_s: float = 0.0) -> None:
+    server = await SharedStateServer(path, max_bytes, idle_exit_s).start()
+    logger.info("Shared-state sidecar listening on %s (%d MB cache)", path, max_bytes // (1024 * 1024))
+    try:
+        await server.serve_forever()
+    finally:
+        await server.aclose()
+
+
+# ---------- Worker-side client ----------
+class SharedStateClient:
+    """
+    One multiplexed connection per worker. Calls raise SharedStateUnavailable
+    instead of blocking when the sidecar is down; `*_nowait` writes are dropped.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        timeout_s: float = 0.5,
+        autostart: bool = True,
+        max_mb: float = 256,
+        idle_exit_s: float = 60.0,
+        breaker_sync_s: float = 1.0,
+        reconnect_s: float = 1.0,
+    ):
+        self.path = path
+        self.timeout_s = float(timeout_s)
+        self.autostart = autostart
+        self.max_mb = max_mb
+        self.idle_exit_s = idle_exit_s
+        self.breaker_sync_s = float(breaker_sync_s)
+        self.reconnect_s = float(reconnect_s)
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._abandoned: Dict[int, str] = {}  # sem_acquire id -> key, for waiters that gave up
+        self._ids = itertools.count(1)
+        self._generation = 0  # bumped per connection; permits do not outlive theirs
+        self._next_attempt = 0.0
+        self._next_spawn = 0.0  # relaunch a crashed or idle-exited sidecar at most every reconnect_s
+        self._breakers: List[Tuple[str, Any]] = []  # (engine, EndpointHealth)
+        self.errors = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    # ---------- Connection ----------
+    def _spawn_sidecar(self) -> None:
+        self._next_spawn = time.monotonic() + self.reconnect_s
+        cmd = [
+            sys.executable, "-m", "app.services.shared_state",
+            "--socket", self.path,
+            "--max-mb", str(self.max_mb),
+            "--idle-exit-s", str(self.idle_exit_s),
+        ]
+        subprocess.Popen(
+            cmd,
+            cwd=str(_REPO_ROOT),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        logger.info("Started shared-state sidecar on %s", self.path)
+
+    def _may_spawn(self) -> bool:
+        # Safe to repeat: the sidecar's lock file keeps it to one instance per socket.
+        return self.autostart and time.monotonic() >= self._next_spawn
+
+    async def _open(self) -> None:
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        self._writer = writer
+        self._generation += 1
+        self._read_task = asyncio.create_task(self._read_loop(reader))
+
+    async def _ensure_connected(self) -> bool:
+        if self.connected:
+            return True
+        if time.monotonic() < self._next_attempt:
+            return False
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.connected:
+                return True
+            attempt, attempts = 0, 1
+            if self._may_spawn() and not os.path.exists(self.path):
+                self._spawn_sidecar()
+                attempts = 20
+            while True:
+                attempt += 1
+                try:
+                    await self._open()
+                    logger.info("Connected to shared-state sidecar %s", self.path)
+                    return True
+                except OSError as e:
+                    if isinstance(e, ConnectionRefusedError) and self._may_spawn():
+                        # Nothing listens on the socket file: a crashed sidecar left it behind.
+                        logger.info("Removing stale shared-state socket %s", self.path)
+                        with contextlib.suppress(OSError):
+                            os.unlink(self.path)
+                        self._spawn_sidecar()
+                        attempts = attempt + 20
+                    elif attempt >= attempts:
+                        self._next_attempt = time.monotonic() + self.reconnect_s
+                        logger.warning("Shared-state sidecar %s unavailable (%s); using per-worker state", self.path, e)
+                        return False
+                    await asyncio.sleep(0.1)
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                header, payload = await _read_frame(reader)
+                request_id = header.get("id")
+                fut = self._pending.pop(request_id, None)
+                if fut is not None and not fut.done():
+                    fut.set_result((header, payload))
+                elif request_id in self._abandoned:
+                    key = self._abandoned.pop(request_id)
+                    if header.get("acquired"):
+                        self._send_nowait("sem_release", key=key)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            pending, self._pending = self._pending, {}
+            self._abandoned.clear()  # the sidecar frees this connection's permits itself
+            for fut in pending.values():
+                if not fut.done():
+                    fut.set_exception(SharedStateUnavailable("shared-state connection lost"))
+
+    async def _call(self, op: str, payload: bytes = b"", wait_s: Optional[float] = None, **args) -> Tuple[Dict[str, Any], bytes]:
+        if not await self._ensure_connected():
+            raise SharedStateUnavailable(f"shared-state sidecar {self.path} is not reachable")
+        request_id = next(self._ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = fut
+        self._writer.write(_encode({"id": request_id, "op": op, **args}, payload))
+        try:
+            header, data = await asyncio.wait_for(fut, self.timeout_s if wait_s is None else wait_s)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            self._pending.pop(request_id, None)
+            if op == "sem_acquire":
+                self._abandon_acquire(request_id, fut, args["key"])
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.errors += 1
+            raise SharedStateUnavailable(f"shared-state {op} timed out")
+        except SharedStateUnavailable:
+            self.errors += 1
+            raise
+        if not header.get("ok"):
+            self.errors += 1
+            raise SharedStateUnavailable(str(header.get("error")))
+        return header, data
+
+    def _abandon_acquire(self, request_id: int, fut: asyncio.Future, key: str) -> None:
+        """The waiter gave up, but the sidecar may still grant the permit: hand it straight back."""
+        if fut.cancelled():
+            self._abandoned[request_id] = key  # released by _read_loop if the grant arrives
+        elif fut.done() and fut.exception() is None and fut.result()[0].get("acquired"):
+            self._send_nowait("sem_release", key=key)  # granted just as the waiter was cancelled
+
+    def _send_nowait(self, op: str, payload: bytes = b"", **args) -> None:
+        if self.connected:
+            self._writer.write(_encode({"id": 0, "op": op, **args}, payload))
+
+    # ---------- Counters ----------
+    async def incr(self, key: str, delta: int = 1) -> int:
+        header, _ = await self._call("incr", key=key, delta=int(delta))
+        return int(header["value"])
+
+    # ---------- Semaphores ----------
+    async def acquire(self, key: str, limit: int, timeout_s: float) -> Optional[Callable[[], None]]:
+        """A host-wide permit of `key` (at most `limit` held); None if none freed up within `timeout_s`."""
+        timeout_s = max(0.0, float(timeout_s))
+        header, _ = await self._call(
+            "sem_acquire", wait_s=timeout_s + self.timeout_s, key=key, limit=int(limit), timeout_s=timeout_s
+        )
+        if not header.get("acquired"):
+            return None
+        generation = self._generation
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if released:
+                return
+            released = True
+            if generation == self._generation:
+                self._send_nowait("sem_release", key=key)
+
+        return release
+
+    # ---------- Byte cache ----------
+    async def cache_get(self, keys: Sequence[str]) -> List[Optional[Tuple[bytes, float]]]:
+        """Per key: (value, TTL left in seconds, 0 = none) or None."""
+        header, data = await self._call("get", keys=list(keys))
+        out: List[Optional[Tuple[bytes, float]]] = []
+        offset = 0
+        for size, ttl in zip(header["sizes"], header["ttls"]):
+            if size < 0:
+                out.append(None)
+                continue
+            out.append((data[offset:offset + size], float(ttl)))
+            offset += size
+        return out
+
+    def cache_set_nowait(self, items: Iterable[Tuple[str, bytes, float]]) -> None:
+        items = list(items)
+        if items:
+            meta = [[key, len(value), float(ttl_s)] for key, value, ttl_s in items]
+            self._send_nowait("set", b"".join(value for _, value, _ in items), items=meta)
+
+    def cache_delete_nowait(self, keys: Sequence[str]) -> None:
+        self._send_nowait("delete", keys=list(keys))
+
+    # ---------- Circuit breakers ----------
+    @staticmethod
+    def _breaker_key(engine: str, url: str) -> str:
+        return f"breaker:{engine}|{url}"
+
+    def watch_breakers(self, healths: Mapping[str, Any]) -> None:
+        """Share open circuits of these EndpointHealth objects (engine -> health) with other workers."""
+        self._breakers = list(healths.items())
+        for engine, health in self._breakers:
+            health.on_change = self._breaker_publisher(engine)
+
+    def _breaker_publisher(self, engine: str) -> Callable[[str, bool, float], None]:
+        def publish(url: str, opened: bool, cooldown_s: float) -> None:
+            key = self._breaker_key(engine, url)
+            if opened:
+                self.cache_set_nowait([(key, b"1", cooldown_s)])
+            else:
+                self.cache_delete_nowait([key])
+
+        return publish
+
+    async def sync_breakers(self) -> None:
+        """Open locally every circuit another worker has opened."""
+        targets = [(health, url, self._breaker_key(engine, url)) for engine, health in self._breakers for url in health.urls]
+        if not targets:
+            return
+        found = await self.cache_get([key for _, _, key in targets])
+        for (health, url, _), entry in zip(targets, found):
+            if entry is not None and entry[1] > 0:
+                health.open_remote(url, entry[1])
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.breaker_sync_s)
+            try:
+                await self.sync_breakers()
+            except SharedStateUnavailable:
+                pass
+            except Exception as e:  # never let the sync loop die
+                logger.warning("Shared breaker sync failed: %s", e)
+
+    # ---------- Lifecycle ----------
+    async def startup(self) -> None:
+        await self._ensure_connected()
+        if self._sync_task is None and self.breaker_sync_s > 0:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+
+    async def aclose(self) -> None:
+        for task in (self._sync_task, self._read_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._sync_task = self._read_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"socket": self.path, "connected": self.connected, "errors": self.errors}
+        try:
+            header, _ = await self._call("stats")
+            out["sidecar"] = header["stats"]
+        except SharedStateUnavailable as e:
+            out["sidecar"] = None
+            out["last_error"] = str(e)
+        return out
+
+
+def build_shared_state(cfg: Mapping[str, Any]) -> Optional[SharedStateClient]:
+    if not cfg["enabled"]:
+        return None
+    return SharedStateClient(
+        cfg["socket"],
+        timeout_s=cfg["timeout-s"],
+        autostart=cfg["autostart"],
+        max_mb=cfg["max-mb"],
+        idle_exit_s=cfg["idle-exit-s"],
+        breaker_sync_s=cfg["breaker-sync-s"],
+    )
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Shared-state sidecar for ViLMS gateway workers")
+    p.add_argument("--socket", default="/tmp/vilms-gateway-state.sock")
+    p.add_argument("--max-mb", type=float, default=256)
+    p.add_argument("--idle-exit-s", type=float, default=0, help="exit after this long without workers (0 = never)")
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = _parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    lock = _lock_instance(args.socket)
+    if lock is None:
+        logger.info("Shared-state sidecar already running for %s", args.socket)
+        return
+    try:
+        asyncio.run(serve(args.socket, int(args.max_mb * 1024 * 1024), args.idle_exit_s))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        os.close(lock)
+
+
+if __name__ == "__main__":
+    main()
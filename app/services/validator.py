@@ -11,6 +11,9 @@ import yaml
 
 SUPPORTED_ENGINES = {"ollama", "vllm", "openai"}
 SUPPORTED_MODEL_TYPES = {"llm", "vlm", "embedding", "reranker"}
+SUPPORTED_FRAME_STRATEGIES = ("last", "uniform", "first-last-uniform")
+SUPPORTED_LB_POLICIES = ("least-outstanding", "power-of-two")
+SUPPORTED_READINESS_REQUIRE = ("all", "any")
 
 
 @dataclass
@@ -35,6 +38,23 @@ def _is_http_url(s: str) -> bool:
     return bool(re.match(r"^https?://", s.strip()))
 
 
+def _is_keep_alive(value: Any) -> bool:
+    # Ollama keep_alive: number of seconds (negative = forever) or a Go duration string.
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    return isinstance(value, str) and bool(re.fullmatch(r"-?\d+(\.\d+)?(ns|us|ms|s|m|h)?(\d+(\.\d+)?(ns|us|ms|s|m|h))*", value.strip()))
+
+
+def _replica_url_errors(field: str, urls: List[Any]) -> List[str]:
+    errors = []
+    for j, url in enumerate(urls):
+        if not isinstance(url, str) or not _is_http_url(url):
+            errors.append(f"{field}[{j}] must be an http:// or https:// URL (got: {url}).")
+    return errors
+
+
 def normalize_params(params: Any) -> Dict[str, Any]:
     """
     Normalize YAML params to a dict.
@@ -156,16 +176,208 @@ def validate_config_dict(cfg: Dict[str, Any]) -> ValidationResult:
 
     _validate_url_field("base-url")
     _validate_url_field("ollama-base-url")
-    _validate_url_field("vllm-base-url")
+
+    # vllm-base-url may list several replicas to load-balance across.
+    vllm_base_url = serving.get("vllm-base-url")
+    if isinstance(vllm_base_url, list):
+        errors.extend(_replica_url_errors("serving.vllm-base-url", vllm_base_url))
+        vllm_base_url = next((u for u in vllm_base_url if isinstance(u, str) and u.strip()), None)
+    else:
+        _validate_url_field("vllm-base-url")
 
     base_url = serving.get("base-url")
     ollama_base_url = serving.get("ollama-base-url")
-    vllm_base_url = serving.get("vllm-base-url")
     if not any(isinstance(v, str) and v.strip() for v in (base_url, ollama_base_url, vllm_base_url)):
         errors.append(
             "At least one backend URL is required: serving.base-url or serving.ollama-base-url or serving.vllm-base-url."
         )
 
+    http_client = serving.get("http-client")
+    if http_client is not None:
+        if not isinstance(http_client, dict):
+            errors.append("serving.http-client must be a mapping when provided.")
+        else:
+            for key in ("timeout", "connect-timeout", "keepalive-expiry"):
+                value = http_client.get(key)
+                if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+                    errors.append(f"serving.http-client.{key} must be a positive number (got: {value}).")
+            for key in ("max-connections", "max-keepalive-connections"):
+                value = http_client.get(key)
+                if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value <= 0):
+                    errors.append(f"serving.http-client.{key} must be a positive integer (got: {value}).")
+            http2 = http_client.get("http2")
+            if http2 is not None and not isinstance(http2, bool):
+                errors.append("serving.http-client.http2 must be a boolean.")
+
+    image_fetch = serving.get("image-fetch")
+    if image_fetch is not None:
+        if not isinstance(image_fetch, dict):
+            errors.append("serving.image-fetch must be a mapping when provided.")
+        else:
+            for key in ("max-mb", "timeout-s", "cache-ttl-s"):
+                value = image_fetch.get(key)
+                if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+                    errors.append(f"serving.image-fetch.{key} must be a positive number (got: {value}).")
+            value = image_fetch.get("max-concurrency")
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value <= 0):
+                errors.append(f"serving.image-fetch.max-concurrency must be a positive integer (got: {value}).")
+            value = image_fetch.get("cache-max-mb")
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0):
+                errors.append(f"serving.image-fetch.cache-max-mb must be a number >= 0 (got: {value}).")
+
+    residency = serving.get("ollama-residency")
+    if residency is not None:
+        if not isinstance(residency, dict):
+            errors.append("serving.ollama-residency must be a mapping when provided.")
+        else:
+            for key in ("interval-s", "load-timeout-s"):
+                value = residency.get(key)
+                if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0):
+                    errors.append(f"serving.ollama-residency.{key} must be a number >= 0 (got: {value}).")
+            keep_alive = residency.get("default-keep-alive")
+            if keep_alive is not None and not _is_keep_alive(keep_alive):
+                errors.append(f"serving.ollama-residency.default-keep-alive is not a valid duration (got: {keep_alive}).")
+
+    profiling = serving.get("profiling")
+    if profiling is not None:
+        if not isinstance(profiling, dict):
+            errors.append("serving.profiling must be a mapping when provided.")
+        else:
+            for key in ("server-timing", "enabled"):
+                value = profiling.get(key)
+                if value is not None and not isinstance(value, bool):
+                    errors.append(f"serving.profiling.{key} must be a boolean.")
+            for key in ("interval-ms", "max-seconds"):
+                value = profiling.get(key)
+                if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+                    errors.append(f"serving.profiling.{key} must be a positive number (got: {value}).")
+            directory = profiling.get("dir")
+            if directory is not None and (not isinstance(directory, str) or not directory.strip()):
+                errors.append("serving.profiling.dir must be a non-empty string when provided.")
+
+    readiness = serving.get("readiness")
+    if readiness is not None:
+        if not isinstance(readiness, dict):
+            errors.append("serving.readiness must be a mapping when provided.")
+        else:
+            warmup = readiness.get("warmup")
+            if warmup is not None and not isinstance(warmup, bool):
+                errors.append("serving.readiness.warmup must be a boolean.")
+            interval = readiness.get("interval-s")
+            if interval is not None and (isinstance(interval, bool) or not isinstance(interval, (int, float)) or interval < 0):
+                errors.append(f"serving.readiness.interval-s must be a non-negative number (got: {interval}).")
+            timeout = readiness.get("timeout-s")
+            if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+                errors.append(f"serving.readiness.timeout-s must be a positive number (got: {timeout}).")
+            require = readiness.get("require")
+            if require is not None and str(require).strip().lower() not in SUPPORTED_READINESS_REQUIRE:
+                errors.append(
+                    f"serving.readiness.require must be one of {', '.join(SUPPORTED_READINESS_REQUIRE)} (got: {require})."
+                )
+
+    shared_state = serving.get("shared-state")
+    if shared_state is not None:
+        if not isinstance(shared_state, dict):
+            errors.append("serving.shared-state must be a mapping when provided.")
+        else:
+            for key in ("enabled", "autostart"):
+                value = shared_state.get(key)
+                if value is not None and not isinstance(value, bool):
+                    errors.append(f"serving.shared-state.{key} must be a boolean.")
+            for key in ("max-mb", "timeout-s"):
+                value = shared_state.get(key)
+                if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+                    errors.append(f"serving.shared-state.{key} must be a positive number (got: {value}).")
+            for key in ("idle-exit-s", "breaker-sync-s"):
+                value = shared_state.get(key)
+                if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0):
+                    errors.append(f"serving.shared-state.{key} must be a non-negative number (got: {value}).")
+            socket_path = shared_state.get("socket")
+            if socket_path is not None and (not isinstance(socket_path, str) or not socket_path.strip()):
+                errors.append("serving.shared-state.socket must be a non-empty string when provided.")
+
+    load_balancing = serving.get("load-balancing")
+    if load_balancing is not None:
+        if not isinstance(load_balancing, dict):
+            errors.append("serving.load-balancing must be a mapping when provided.")
+        else:
+            policy = load_balancing.get("policy")
+            if policy is not None and str(policy).strip().lower() not in SUPPORTED_LB_POLICIES:
+                errors.append(
+                    f"serving.load-balancing.policy must be one of {', '.join(SUPPORTED_LB_POLICIES)} (got: {policy})."
+                )
+            eject = load_balancing.get("eject-on-5xx")
+            if eject is not None and not isinstance(eject, bool):
+                errors.append("serving.load-balancing.eject-on-5xx must be a boolean.")
+
+    admission = serving.get("admission")
+    if admission is not None:
+        if not isinstance(admission, dict):
+            errors.append("serving.admission must be a mapping when provided.")
+        else:
+            timeout = admission.get("queue-timeout-s")
+            if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+                errors.append(f"serving.admission.queue-timeout-s must be a positive number (got: {timeout}).")
+            engines = admission.get("engines")
+            if engines is not None and not isinstance(engines, dict):
+                errors.append("serving.admission.engines must be a mapping of engine name -> limits.")
+            for name, limits in (engines or {}).items() if isinstance(engines, dict) else ():
+                if not isinstance(limits, dict):
+                    errors.append(f"serving.admission.engines.{name} must be a mapping.")
+                    continue
+                for key in ("max-concurrency", "max-queue"):
+                    value = limits.get(key)
+                    if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+                        errors.append(f"serving.admission.engines.{name}.{key} must be an integer >= 0 (got: {value}).")
+                affinity = limits.get("model-affinity")
+                if affinity is not None and not isinstance(affinity, bool):
+                    errors.append(f"serving.admission.engines.{name}.model-affinity must be a boolean.")
+                max_wait = limits.get("affinity-max-wait-s")
+                if max_wait is not None and (isinstance(max_wait, bool) or not isinstance(max_wait, (int, float)) or max_wait < 0):
+                    errors.append(
+                        f"serving.admission.engines.{name}.affinity-max-wait-s must be a number >= 0 (got: {max_wait})."
+                    )
+
+    scheduling = serving.get("scheduling")
+    if scheduling is not None:
+        if not isinstance(scheduling, dict):
+            errors.append("serving.scheduling must be a mapping when provided.")
+        else:
+            classes = scheduling.get("classes")
+            if classes is not None and (not isinstance(classes, dict) or not classes):
+                errors.append("serving.scheduling.classes must be a non-empty mapping of class name -> {weight}.")
+            for name, c in (classes or {}).items() if isinstance(classes, dict) else ():
+                weight = c.get("weight") if isinstance(c, dict) else c
+                if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight <= 0:
+                    errors.append(f"serving.scheduling.classes.{name}.weight must be a positive number (got: {weight}).")
+            default_class = scheduling.get("default-class")
+            if default_class is not None and isinstance(classes, dict) and default_class not in classes:
+                errors.append(f"serving.scheduling.default-class '{default_class}' is not in serving.scheduling.classes.")
+            api_keys = scheduling.get("api-keys")
+            if api_keys is not None and not isinstance(api_keys, dict):
+                errors.append("serving.scheduling.api-keys must be a mapping of key -> {tenant, class, max-inflight}.")
+
+    frame_strategy = serving.get("default-frame-strategy")
+    if frame_strategy is not None and str(frame_strategy).strip().lower() not in SUPPORTED_FRAME_STRATEGIES:
+        errors.append(
+            f"serving.default-frame-strategy must be one of {', '.join(SUPPORTED_FRAME_STRATEGIES)} (got: {frame_strategy})."
+        )
+
+    image_preprocess = serving.get("image-preprocess")
+    if image_preprocess is not None:
+        if not isinstance(image_preprocess, dict):
+            errors.append("serving.image-preprocess must be a mapping when provided.")
+        else:
+            enabled = image_preprocess.get("enabled")
+            if enabled is not None and not isinstance(enabled, bool) and enabled != "auto":
+                errors.append("serving.image-preprocess.enabled must be true, false or auto.")
+            fmt = image_preprocess.get("format")
+            if fmt is not None and str(fmt).strip().lower() not in ("jpeg", "webp"):
+                errors.append(f"serving.image-preprocess.format must be jpeg or webp (got: {fmt}).")
+            executor = image_preprocess.get("executor")
+            if executor is not None and str(executor).strip().lower() not in ("thread", "process"):
+                errors.append(f"serving.image-preprocess.executor must be thread or process (got: {executor}).")
+
     models = serving.get("models")
     if models is None:
         errors.append("serving.models is required (must be a list).")
@@ -195,6 +407,29 @@ def validate_config_dict(cfg: Dict[str, Any]) -> ValidationResult:
         m2["name"] = name.strip()
         m2["params"] = normalize_params(m.get("params"))
         m2["aliases"] = _normalize_aliases(m.get("aliases"))
+        for key in ("max-concurrency", "max-queue"):
+            value = m2["params"].get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+                errors.append(f"serving.models[{i}].params.{key} must be an integer >= 0 (got: {value}).")
+        keep_alive = m2["params"].get("keep-alive")
+        if keep_alive is not None and not _is_keep_alive(keep_alive):
+            errors.append(
+                f"serving.models[{i}].params.keep-alive must be seconds or a duration like 30m / 1h, -1 = forever "
+                f"(got: {keep_alive})."
+            )
+        strategy = m2["params"].get("frame-strategy")
+        if strategy is not None and str(strategy).strip().lower() not in SUPPORTED_FRAME_STRATEGIES:
+            errors.append(
+                f"serving.models[{i}].params.frame-strategy must be one of "
+                f"{', '.join(SUPPORTED_FRAME_STRATEGIES)} (got: {strategy})."
+            )
+
+        replicas = m.get("replicas")
+        if replicas is not None:
+            if not isinstance(replicas, list) or not replicas:
+                errors.append(f"serving.models[{i}].replicas must be a non-empty list of base URLs.")
+            else:
+                errors.extend(_replica_url_errors(f"serving.models[{i}].replicas", replicas))
 
         model_type = _normalize_model_type(m.get("type"))
         if model_type is not None:
@@ -0,0 +1,394 @@
+# bench/run.py
+"""
+Gateway-overhead benchmark.
+
+Starts the stub backends (bench/stubs.py) and a real gateway process
+(uvicorn app.main:app) pointed at them through a generated config, then drives
+each request type at several concurrency levels. Stubs answer after exactly
+`--latency-ms`, so per-request overhead = client latency - stub latency.
+
+    python -m bench.run --concurrency 1,8,32 --requests 200 --output bench.json
+
+Results are JSON (one row per scenario x concurrency) so releases can be diffed.
+Gateway CPU/RSS come from /proc and are null on other platforms.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import httpx
+import yaml
+
+from bench.stubs import StubProfile
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SCHEMA_VERSION = 1
+
+TEXT_MODEL = "bench-text"
+VLM_MODEL = "bench-vlm"
+VLLM_MODEL = "bench-vllm"
+EMBED_MODEL = "bench-embed"
+
+
+# ---------- Statistics ----------
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Linear-interpolated percentile (pct in 0..100); 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    lo, hi = math.floor(rank), math.ceil(rank)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (rank - lo)
+
+
+def summarize(values_ms: Sequence[float]) -> Dict[str, float]:
+    return {
+        "p50": round(percentile(values_ms, 50), 3),
+        "p95": round(percentile(values_ms, 95), 3),
+        "p99": round(percentile(values_ms, 99), 3),
+        "mean": round(sum(values_ms) / len(values_ms), 3) if values_ms else 0.0,
+        "max": round(max(values_ms), 3) if values_ms else 0.0,
+    }
+
+
+class ProcessSampler:
+    """CPU time and RSS of one process, read from /proc (None where unavailable)."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self._ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def cpu_seconds(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/stat", "r", encoding="ascii") as f:
+                # Fields after the ")" closing the command name; utime/stime are 14/15 overall.
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self._ticks
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def rss_bytes(self) -> Optional[int]:
+        try:
+            with open(f"/proc/{self.pid}/status", "r", encoding="ascii") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            return None
+        return None
+
+
+# ---------- Scenarios ----------
+@dataclass
+class Scenario:
+    name: str
+    path: str
+    body: Callable[[int], dict]  # request index -> JSON body
+    backend_ms: float  # time the stub spends before answering
+
+
+def _text_body(model: str) -> Callable[[int], dict]:
+    def body(i: int) -> dict:
+        return {"model": model, "messages": [{"role": "user", "content": f"Benchmark prompt {i}: say something."}]}
+
+    return body
+
+
+def _vlm_body(frames: int, image_kb: int) -> Callable[[int], dict]:
+    # Random bytes: the gateway validates base64 but does not decode images unless preprocessing is on.
+    image = base64.b64encode(random.Random(0).randbytes(image_kb * 1024)).decode("ascii")
+    parts = [{"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}"}} for _ in range(frames)]
+
+    def body(i: int) -> dict:
+        content = [{"type": "text", "text": f"Describe frame set {i}."}] + parts
+        return {"model": VLM_MODEL, "messages": [{"role": "user", "content": content}]}
+
+    return body
+
+
+def _embedding_body(batch: int) -> Callable[[int], dict]:
+    def body(i: int) -> dict:
+        # Distinct texts per request so an enabled embedding cache would not hide backend calls.
+        return {"model": EMBED_MODEL, "input": [f"benchmark sentence {i}-{j}" for j in range(batch)]}
+
+    return body
+
+
+def build_scenarios(args: argparse.Namespace) -> List[Scenario]:
+    all_scenarios = {
+        "text-ollama": Scenario("text-ollama", "/v1/chat/completions", _text_body(TEXT_MODEL), args.latency_ms),
+        "text-vllm": Scenario("text-vllm", "/v1/chat/completions", _text_body(VLLM_MODEL), args.latency_ms),
+        "vlm-ollama": Scenario(
+            f"vlm-ollama-{args.frames}f", "/v1/chat/completions", _vlm_body(args.frames, args.image_kb), args.latency_ms
+        ),
+        "embeddings": Scenario(
+            f"embeddings-b{args.embed_batch}", "/v1/embeddings", _embedding_body(args.embed_batch), args.latency_ms
+        ),
+    }
+    unknown = [s for s in args.scenarios if s not in all_scenarios]
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(unknown)}. Choose from: {', '.join(all_scenarios)}")
+    return [all_scenarios[s] for s in args.scenarios]
+
+
+def gateway_config(ollama_url: str, vllm_url: str, embedding_url: str, args: argparse.Namespace) -> dict:
+    """Config the benchmarked gateway runs with: every backend is a local stub."""
+    return {
+        "host": {"platform": "dgpu"},
+        "serving": {
+            # serving.engine=ollama would force every model onto Ollama; per-model engines route instead.
+            "engine": "vllm",
+            "base-url": f"{ollama_url}/v1/chat/completions",
+            "ollama-base-url": f"{ollama_url}/v1/chat/completions",
+            "vllm-base-url": vllm_url,
+            "default-max-frames": max(8, args.frames),
+            "reload": {"watch-interval-s": 0},
+            "ollama-residency": {"enabled": False},
+            "models": [
+                {"name": TEXT_MODEL, "engine": "ollama", "type": "llm"},
+                {"name": VLM_MODEL, "engine": "ollama", "type": "vlm"},
+                {"name": VLLM_MODEL, "engine": "vllm", "type": "llm"},
+            ],
+        },
+        "embedding": {
+            "enabled": True,
+            "base-url": embedding_url,
+            "model": EMBED_MODEL,
+            "cache": {"enabled": args.embedding_cache},
+        },
+    }
+
+
+# ---------- Processes ----------
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_ready(url: str, proc: Optional[subprocess.Popen], timeout_s: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            if proc is not None and proc.poll() is not None:
+                raise RuntimeError(f"Process for {url} exited with code {proc.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.RequestError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout_s}s")
+
+
+def _spawn(cmd: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen(cmd, cwd=str(REPO_ROOT), env={**os.environ, **(env or {})})
+
+
+def _stop(proc: Optional[subprocess.Popen]) -> None:
+    if proc is None or proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# ---------- Load generation ----------
+async def run_level(
+    client: httpx.AsyncClient,
+    gateway_url: str,
+    scenario: Scenario,
+    concurrency: int,
+    requests: int,
+    sampler: Optional[ProcessSampler],
+) -> Dict[str, Any]:
+    url = gateway_url + scenario.path
+    # Warm-up: open connections and fill gateway caches/pools before measuring.
+    await asyncio.gather(
+        *(client.post(url, json=scenario.body(-1 - i)) for i in range(concurrency)), return_exceptions=True
+    )
+
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(requests))
+    rss_peak = sampler.rss_bytes() if sampler else None
+
+    async def worker() -> None:
+        nonlocal rss_peak
+        for i in counter:
+            body = scenario.body(i)
+            started = time.perf_counter()
+            try:
+                resp = await client.post(url, json=body)
+                resp.read()
+                ok = resp.status_code == 200
+                key = str(resp.status_code)
+            except httpx.HTTPError as e:
+                ok, key = False, type(e).__name__
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            if ok:
+                latencies.append(elapsed_ms)
+            else:
+                errors[key] = errors.get(key, 0) + 1
+            if sampler is not None and i % 20 == 0:
+                rss = sampler.rss_bytes()
+                if rss is not None:
+                    rss_peak = max(rss_peak or 0, rss)
+
+    cpu_before = sampler.cpu_seconds() if sampler else None
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall_s = time.perf_counter() - started
+    cpu_after = sampler.cpu_seconds() if sampler else None
+
+    cpu_ms = None
+    if cpu_before is not None and cpu_after is not None and requests:
+        cpu_ms = round((cpu_after - cpu_before) * 1000.0 / requests, 3)
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(latencies) / wall_s, 2) if wall_s > 0 else 0.0,
+        "backend_ms": scenario.backend_ms,
+        "latency_ms": summarize(latencies),
+        "overhead_ms": summarize([max(0.0, v - scenario.backend_ms) for v in latencies]),
+        "gateway_cpu_ms_per_request": cpu_ms,
+        "gateway_rss_mb": round(rss_peak / (1024 * 1024), 1) if rss_peak else None,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(REPO_ROOT), capture_output=True, text=True, timeout=5
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    scenarios = build_scenarios(args)
+    stub_proc = gateway_proc = None
+    tmpdir = tempfile.TemporaryDirectory(prefix="vilms-bench-")
+    try:
+        if args.gateway_url:
+            # An external gateway must already point at the stubs, so use their fixed default ports.
+            ports = {"ollama": 18434, "vllm": 18000, "embedding": 18001}
+        else:
+            ports = {"ollama": free_port(), "vllm": free_port(), "embedding": free_port()}
+        stub_proc = _spawn([
+            sys.executable, "-m", "bench.stubs",
+            "--ollama-port", str(ports["ollama"]),
+            "--vllm-port", str(ports["vllm"]),
+            "--embedding-port", str(ports["embedding"]),
+            "--latency-ms", str(args.latency_ms),
+            "--completion-tokens", str(args.completion_tokens),
+            "--embedding-dim", str(args.embedding_dim),
+        ])
+        urls = {kind: f"http://127.0.0.1:{port}" for kind, port in ports.items()}
+        for url in urls.values():
+            await wait_ready(url + "/v1/models", stub_proc)
+
+        gateway_url = args.gateway_url.rstrip("/") if args.gateway_url else None
+        sampler = ProcessSampler(args.gateway_pid) if args.gateway_pid else None
+        if gateway_url is None:
+            config_path = Path(tmpdir.name) / "config.yaml"
+            config_path.write_text(yaml.safe_dump(gateway_config(urls["ollama"], urls["vllm"], urls["embedding"], args)))
+            port = free_port()
+            gateway_proc = _spawn(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+                 "--log-level", "warning", "--no-access-log"],
+                env={"VILMS_CONFIG": str(config_path)},
+            )
+            gateway_url = f"http://127.0.0.1:{port}"
+            sampler = ProcessSampler(gateway_proc.pid)
+        await wait_ready(gateway_url + "/health_check", gateway_proc)
+
+        results = []
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        async with httpx.AsyncClient(timeout=args.timeout_s, limits=limits) as client:
+            for scenario in scenarios:
+                for concurrency in args.concurrency:
+                    row = await run_level(client, gateway_url, scenario, concurrency, args.requests, sampler)
+                    results.append(row)
+                    print(
+                        f"{row['scenario']:<22} c={concurrency:<4} {row['throughput_rps']:>9.1f} req/s  "
+                        f"overhead p50/p95/p99 {row['overhead_ms']['p50']:.2f}/{row['overhead_ms']['p95']:.2f}/"
+                        f"{row['overhead_ms']['p99']:.2f} ms  errors={sum(row['errors'].values())}",
+                        file=sys.stderr,
+                    )
+        return {
+            "schema": SCHEMA_VERSION,
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "args": {k: v for k, v in vars(args).items() if k not in ("output",)},
+            },
+            "results": results,
+        }
+    finally:
+        _stop(gateway_proc)
+        _stop(stub_proc)
+        tmpdir.cleanup()
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Measure the latency/CPU/RSS the gateway adds on top of its backends")
+    p.add_argument("--scenarios", type=lambda v: [s.strip() for s in v.split(",") if s.strip()],
+                   default=["text-ollama", "text-vllm", "vlm-ollama", "embeddings"],
+                   help="comma list of: text-ollama, text-vllm, vlm-ollama, embeddings")
+    p.add_argument("--concurrency", type=_int_list, default=[1, 8, 32], help="comma list of concurrency levels")
+    p.add_argument("--requests", type=int, default=200, help="measured requests per scenario and level")
+    p.add_argument("--latency-ms", type=float, default=StubProfile.latency_ms, help="stub backend latency")
+    p.add_argument("--completion-tokens", type=int, default=StubProfile.completion_tokens)
+    p.add_argument("--frames", type=int, default=4, help="images per VLM request")
+    p.add_argument("--image-kb", type=int, default=64, help="size of each VLM image")
+    p.add_argument("--embed-batch", type=int, default=16, help="inputs per embeddings request")
+    p.add_argument("--embedding-dim", type=int, default=StubProfile.embedding_dim)
+    p.add_argument("--embedding-cache", action="store_true", help="leave the gateway embedding cache on")
+    p.add_argument("--timeout-s", type=float, default=60.0)
+    p.add_argument("--gateway-url", help="benchmark an already running gateway instead of starting one")
+    p.add_argument("--gateway-pid", type=int, help="with --gateway-url: pid to sample CPU/RSS from")
+    p.add_argument("--output", help="write the JSON report here (default: stdout)")
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = _parse_args(argv)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+# bench/stubs.py
+"""
+Stub Ollama / vLLM / embedding backends for the gateway benchmark.
+
+Plain asyncio HTTP/1.1 (keep-alive, chunked streaming) so the stubs cost as
+little as possible and need nothing beyond the standard library. Every
+response takes exactly `latency_ms` before its first byte, which lets the
+benchmark subtract backend time and report what the gateway adds.
+
+    python -m bench.stubs --ollama-port 18434 --vllm-port 18000 --embedding-port 18001
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+OLLAMA = "ollama"
+VLLM = "vllm"
+EMBEDDING = "embedding"
+KINDS = (OLLAMA, VLLM, EMBEDDING)
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found"}
+
+
+@dataclass
+class StubProfile:
+    """Shape of every stub response."""
+
+    latency_ms: float = 20.0  # before the first byte (non-stream: whole response)
+    completion_tokens: int = 64  # words in a chat completion
+    token_interval_ms: float = 0.0  # between streamed chunks
+    embedding_dim: int = 1024
+
+
+class StubBackend:
+    """One stub server: `kind` selects which API surface it answers."""
+
+    def __init__(self, kind: str, profile: Optional[StubProfile] = None, host: str = "127.0.0.1", port: int = 0):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown stub kind: {kind}")
+        self.kind = kind
+        self.profile = profile or StubProfile()
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._content = " ".join(f"tok{i}" for i in range(self.profile.completion_tokens))
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "StubBackend":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def aclose(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    # ---------- HTTP plumbing ----------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, body = request
+                self.requests += 1
+                await self._respond(writer, method, path, body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bytes]]:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = lines[0].split(" ", 2)
+        length = 0
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value.strip())
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], body
+
+    @staticmethod
+    def _write_head(writer: asyncio.StreamWriter, status: int, content_type: str, length: Optional[int]) -> None:
+        headers = [f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}", f"Content-Type: {content_type}"]
+        headers.append(f"Content-Length: {length}" if length is not None else "Transfer-Encoding: chunked")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1"))
+
+    async def _respond(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes) -> None:
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            return self._send_json(writer, {"error": "invalid JSON body"}, status=400)
+
+        route = self._route(method, path)
+        if route is None:
+            return self._send_json(writer, {"error": f"{method} {path} not served by {self.kind} stub"}, status=404)
+        if route in ("chat", "native_chat", "embeddings", "generate"):
+            await asyncio.sleep(self.profile.latency_ms / 1000.0)
+        if route == "chat" and payload.get("stream"):
+            return await self._send_stream(writer, "text/event-stream", self._sse_chunks(payload))
+        if route == "native_chat" and payload.get("stream", True):
+            return await self._send_stream(writer, "application/x-ndjson", self._ndjson_chunks(payload))
+        return self._send_json(writer, getattr(self, f"_{route}")(payload))
+
+    def _send_json(self, writer: asyncio.StreamWriter, obj: Any, status: int = 200) -> None:
+        data = json.dumps(obj).encode("utf-8")
+        self._write_head(writer, status, "application/json", len(data))
+        writer.write(data)
+
+    async def _send_stream(self, writer: asyncio.StreamWriter, content_type: str, chunks: AsyncIterator[bytes]) -> None:
+        self._write_head(writer, 200, content_type, None)
+        async for chunk in chunks:
+            writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+
+    def _route(self, method: str, path: str) -> Optional[str]:
+        routes: Dict[Tuple[str, str], str] = {("GET", "/v1/models"): "models"}
+        if self.kind in (OLLAMA, VLLM):
+            routes[("POST", "/v1/chat/completions")] = "chat"
+        if self.kind == OLLAMA:
+            routes.update({
+                ("POST", "/api/chat"): "native_chat",
+                ("POST", "/api/generate"): "generate",
+                ("GET", "/api/version"): "version",
+                ("GET", "/api/ps"): "ps",
+            })
+        if self.kind == VLLM:
+            routes[("GET", "/health")] = "version"
+        if self.kind == EMBEDDING:
+            routes[("POST", "/v1/embeddings")] = "embeddings"
+        return routes.get((method, path))
+
+    # ---------- Response bodies ----------
+    def _usage(self, payload: dict) -> Dict[str, int]:
+        prompt = sum(len(str(m.get("content", ""))) // 4 for m in payload.get("messages") or [] if isinstance(m, dict))
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": self.profile.completion_tokens,
+            "total_tokens": prompt + self.profile.completion_tokens,
+        }
+
+    def _chat(self, payload: dict) -> dict:
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": self._content}, "finish_reason": "stop"}],
+            "usage": self._usage(payload),
+        }
+
+    def _native_chat(self, payload: dict) -> dict:
+        latency_ns = int(self.profile.latency_ms * 1e6)
+        return {
+            "model": payload.get("model", ""),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": self._content},
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": latency_ns,
+            "load_duration": 0,
+            "prompt_eval_count": self._usage(payload)["prompt_tokens"],
+            "eval_count": self.profile.completion_tokens,
+        }
+
+    def _generate(self, payload: dict) -> dict:
+        return {"model": payload.get("model", ""), "response": "", "done": True, "load_duration": 0, "total_duration": 0}
+
+    def _embeddings(self, payload: dict) -> dict:
+        inputs = payload.get("input")
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        vector = [0.001] * self.profile.embedding_dim
+        return {
+            "object": "list",
+            "model": payload.get("model", ""),
+            "data": [{"object": "embedding", "index": i, "embedding": vector} for i in range(len(inputs))],
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+        }
+
+    def _models(self, payload: dict) -> dict:
+        return {"object": "list", "data": []}
+
+    def _version(self, payload: dict) -> dict:
+        return {"version": "0.0.0-stub"}
+
+    def _ps(self, payload: dict) -> dict:
+        return {"models": []}
+
+    # ---------- Streaming bodies ----------
+    def _words(self) -> List[str]:
+        return [f"tok{i} " for i in range(self.profile.completion_tokens)]
+
+    async def _pace(self) -> None:
+        if self.profile.token_interval_ms > 0:
+            await asyncio.sleep(self.profile.token_interval_ms / 1000.0)
+
+    async def _sse_chunks(self, payload: dict) -> AsyncIterator[bytes]:
+        base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": payload.get("model", "")}
+        for word in self._words():
+            chunk = dict(base, choices=[{"index": 0, "delta": {"content": word}, "finish_reason": None}])
+            yield b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n"
+            await self._pace()
+        yield b"data: " + json.dumps(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])).encode("utf-8") + b"\n\n"
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            yield b"data: " + json.dumps(dict(base, choices=[], usage=self._usage(payload))).encode("utf-8") + b"\n\n"
+        yield b"data: [DONE]\n\n"
+
+    async def _ndjson_chunks(self, payload: dict) -> AsyncIterator[bytes]:
+        model = payload.get("model", "")
+        for word in self._words():
+            yield json.dumps({"model": model, "message": {"role": "assistant", "content": word}, "done": False}).encode("utf-8") + b"\n"
+            await self._pace()
+        final = self._native_chat(payload)
+        final["message"] = {"role": "assistant", "content": ""}
+        yield json.dumps(final).encode("utf-8") + b"\n"
+
+
+async def serve(ports: Dict[str, int], profile: StubProfile, host: str = "127.0.0.1") -> None:
+    stubs = [await StubBackend(kind, profile, host, port).start() for kind, port in ports.items()]
+    for stub in stubs:
+        print(f"{stub.kind} stub listening on {stub.base_url}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for stub in stubs:
+            await stub.aclose()
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Stub Ollama/vLLM/embedding backends for benchmarking the gateway")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--ollama-port", type=int, default=18434)
+    p.add_argument("--vllm-port", type=int, default=18000)
+    p.add_argument("--embedding-port", type=int, default=18001)
+    p.add_argument("--latency-ms", type=float, default=StubProfile.latency_ms)
+    p.add_argument("--completion-tokens", type=int, default=StubProfile.completion_tokens)
+    p.add_argument("--token-interval-ms", type=float, default=StubProfile.token_interval_ms)
+    p.add_argument("--embedding-dim", type=int, default=StubProfile.embedding_dim)
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = _parse_args(argv)
+    profile = StubProfile(
+        latency_ms=args.latency_ms,
+        completion_tokens=args.completion_tokens,
+        token_interval_ms=args.token_interval_ms,
+        embedding_dim=args.embedding_dim,
+    )
+    ports = {OLLAMA: args.ollama_port, VLLM: args.vllm_port, EMBEDDING: args.embedding_port}
+    try:
+        asyncio.run(serve(ports, profile, args.host))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
+import asyncio
+import os
+import tempfile
+import time
 import unittest
+from unittest.mock import patch
+
+import httpx
 
 from fastapi.testclient import TestClient
 
 from app.main import app
 from app import routes
+from app.services.admission import AdmissionController
+from app.services.readiness import ReadinessMonitor
+from app.services.response_cache import ResponseCache
 
 
 class _FakeChatEngine:
@@ -45,6 +55,42 @@ class _RecordingFakeChatEngine:
         }
 
 
+class _FakeStreamingChatEngine:
+    async def chat_completion(self, payload: dict):
+        raise AssertionError("stream requests must not use chat_completion")
+
+    async def chat_completion_stream(self, payload: dict, response_model=None):
+        yield b'data: {"model": "%s", "choices": [{"delta": {"content": "ok"}}]}\n\n' % response_model.encode()
+        yield b"data: [DONE]\n\n"
+
+
+class _RawBytesChatEngine:
+    """vLLM-style engine that hands back the upstream body undecoded."""
+
+    BODY = (
+        b'{"id":"chatcmpl-raw","object":"chat.completion","model":"qwen3:4b-instruct",'
+        b'"choices":[{"index":0,"message":{"role":"assistant","content":"raw"},"finish_reason":"stop"}],'
+        b'"usage":{"prompt_tokens":2,"completion_tokens":1,"total_tokens":3}}'
+    )
+
+    async def chat_completion(self, payload: dict):
+        raise AssertionError("uncached requests must use chat_completion_bytes")
+
+    async def chat_completion_bytes(self, payload: dict) -> bytes:
+        return self.BODY
+
+
+class _SlowCountingChatEngine(_RecordingFakeChatEngine):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def chat_completion(self, payload: dict):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return await super().chat_completion(payload)
+
+
 class _FakeEmbeddingEngine:
     def embed(self, inputs, model_name=None):
         return [[0.1, 0.2, 0.3] for _ in inputs]
@@ -56,17 +102,42 @@ class ApiTests(unittest.TestCase):
         self._orig_map_model_alias = routes.factory.map_model_alias
         self._orig_resolve_chat_engine = routes.factory.resolve_chat_engine
         self._orig_embedding = routes.factory.embedding
+        self._orig_admission = routes.factory.admission
 
     def tearDown(self):
         routes.factory.map_model_alias = self._orig_map_model_alias
         routes.factory.resolve_chat_engine = self._orig_resolve_chat_engine
         routes.factory.embedding = self._orig_embedding
+        routes.factory.admission = self._orig_admission
 
     def test_health_check(self):
         res = self.client.get("/health_check")
         self.assertEqual(res.status_code, 200)
         self.assertEqual(res.json(), {"status": "ok"})
 
+    def test_ready_holds_traffic_until_warm_up_and_backends_answer(self):
+        state = {"up": False}
+
+        async def ollama():
+            if not state["up"]:
+                raise RuntimeError("No backend answered. Tried: http://ollama")
+            return "1/1 up"
+
+        monitor = ReadinessMonitor({"ollama": ollama}, {"embedding": lambda: asyncio.sleep(0)})
+        with patch.object(routes.factory, "readiness", monitor):
+            warming = self.client.get("/ready")
+            asyncio.run(monitor.warm_up())
+            down = self.client.get("/ready")
+            state["up"] = True
+            asyncio.run(monitor.refresh())
+            up = self.client.get("/ready")
+        self.assertEqual(warming.status_code, 503)
+        self.assertTrue(warming.json()["warming_up"])
+        self.assertEqual(down.status_code, 503)
+        self.assertIn("Tried: http://ollama", down.json()["components"]["ollama"]["error"])
+        self.assertEqual(up.status_code, 200)
+        self.assertEqual(up.json()["components"]["ollama"]["detail"], "1/1 up")
+
     def test_chat_completion_method_not_allowed(self):
         res = self.client.get("/v1/chat/completions")
         self.assertEqual(res.status_code, 200)
@@ -128,6 +199,197 @@ class ApiTests(unittest.TestCase):
         self.assertIsNotNone(fake_engine.last_payload)
         self.assertEqual(fake_engine.last_payload["model"], "qwen3-vl:4b-instruct")
 
+    def test_raw_upstream_body_is_passed_through_with_only_model_rewritten(self):
+        routes.factory.map_model_alias = lambda m: "qwen3:4b-instruct" if m == "LLM_SMALL" else m
+        routes.factory.resolve_chat_engine = lambda _m: _RawBytesChatEngine()
+
+        payload = {"model": "LLM_SMALL", "messages": [{"role": "user", "content": "ping"}]}
+        res = self.client.post("/v1/chat/completions", json=payload)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers["content-type"], "application/json")
+        self.assertEqual(
+            res.content, _RawBytesChatEngine.BODY.replace(b'"model":"qwen3:4b-instruct"', b'"model":"LLM_SMALL"')
+        )
+
+    def test_chat_completion_stream_returns_event_stream(self):
+        routes.factory.map_model_alias = lambda m: m
+        routes.factory.resolve_chat_engine = lambda _m: _FakeStreamingChatEngine()
+
+        payload = {
+            "model": "LLM_SMALL",
+            "messages": [{"role": "user", "content": "ping"}],
+            "stream": True,
+        }
+        res = self.client.post("/v1/chat/completions", json=payload)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.headers["content-type"].startswith("text/event-stream"))
+        self.assertIn('"model": "LLM_SMALL"', res.text)
+        self.assertTrue(res.text.endswith("data: [DONE]\n\n"))
+
+    def test_stream_cleanup_runs_once_even_if_the_body_never_starts(self):
+        class _TrackedStream(_FakeStreamingChatEngine):
+            closed = 0
+
+            async def chat_completion_stream(self, payload, response_model=None):
+                try:
+                    async for chunk in super().chat_completion_stream(payload, response_model):
+                        yield chunk
+                finally:
+                    _TrackedStream.closed += 1
+
+        async def scenario(send):
+            calls = []
+            response = await routes._stream_chat_completion(
+                _TrackedStream(), {"model": "m"}, "m", lambda usage, failed: calls.append(failed)
+            )
+
+            async def receive():
+                await asyncio.sleep(10)
+                return {"type": "http.disconnect"}
+
+            try:
+                await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+            except Exception:  # OSError, surfaced by Starlette as ClientDisconnect
+                pass
+            return calls
+
+        async def broken_send(message):
+            raise OSError("client went away")
+
+        sent = []
+
+        async def ok_send(message):
+            sent.append(message)
+
+        self.assertEqual(asyncio.run(scenario(broken_send)), [False])
+        self.assertEqual(_TrackedStream.closed, 1)
+        self.assertEqual(asyncio.run(scenario(ok_send)), [False])
+        self.assertEqual(_TrackedStream.closed, 2)
+        self.assertTrue(sent[-2]["body"].endswith(b"data: [DONE]\n\n"))
+
+    def test_chat_completion_over_model_limit_returns_429_with_retry_after(self):
+        admission = AdmissionController()
+        admission.configure(
+            {"queue-timeout-s": 1, "engines": {}},
+            [{"name": "qwen2.5:3b", "params": {"max-concurrency": 1, "max-queue": 0}}],
+        )
+        admission.models["qwen2.5:3b"].active = 1  # slot already taken
+        routes.factory.admission = admission
+        routes.factory.map_model_alias = lambda m: m
+        routes.factory.resolve_chat_engine = lambda _m: _FakeChatEngine()
+
+        payload = {"model": "qwen2.5:3b", "messages": [{"role": "user", "content": "ping"}]}
+        res = self.client.post("/v1/chat/completions", json=payload)
+
+        self.assertEqual(res.status_code, 429)
+        self.assertGreaterEqual(int(res.headers["retry-after"]), 1)
+        self.assertEqual(admission.stats()["models"]["qwen2.5:3b"]["rejected"], 1)
+
+    def test_identical_concurrent_requests_are_coalesced_when_enabled(self):
+        fake_engine = _SlowCountingChatEngine()
+        routes.factory.map_model_alias = lambda m: "qwen2.5:3b"
+        routes.factory.resolve_chat_engine = lambda _m: fake_engine
+        before = routes.factory.coalescer.stats()["coalesced"]
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://gw") as client:
+                payload = {"messages": [{"role": "user", "content": "classify"}], "temperature": 0}
+                return await asyncio.gather(
+                    *(client.post("/v1/chat/completions", json={**payload, "model": m}) for m in ("LLM", "llm", "LLM"))
+                )
+
+        with patch.object(routes, "_coalescing_enabled", lambda _cfg: True):
+            responses = asyncio.run(scenario())
+
+        self.assertEqual(fake_engine.calls, 1)
+        self.assertEqual([r.json()["model"] for r in responses], ["LLM", "llm", "LLM"])
+        self.assertEqual(routes.factory.coalescer.stats()["coalesced"] - before, 2)
+
+    def test_sampled_requests_are_not_coalesced_unless_asked(self):
+        fake_engine = _SlowCountingChatEngine()
+        routes.factory.map_model_alias = lambda m: "qwen2.5:3b"
+        routes.factory.resolve_chat_engine = lambda _m: fake_engine
+
+        async def scenario(headers):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://gw") as client:
+                payload = {"model": "LLM", "messages": [{"role": "user", "content": "a poem"}], "temperature": 0.8}
+                return await asyncio.gather(
+                    *(client.post("/v1/chat/completions", json=payload, headers=headers) for _ in range(3))
+                )
+
+        with patch.object(routes, "_coalescing_enabled", lambda _cfg: True):
+            asyncio.run(scenario({}))
+            sampled_calls = fake_engine.calls
+            asyncio.run(scenario({"X-Coalesce": "use"}))
+
+        self.assertEqual(sampled_calls, 3)
+        self.assertEqual(fake_engine.calls - sampled_calls, 1)
+
+    def test_deterministic_requests_hit_response_cache_unless_bypassed(self):
+        fake_engine = _SlowCountingChatEngine()
+        routes.factory.map_model_alias = lambda m: "qwen2.5:3b"
+        routes.factory.resolve_chat_engine = lambda _m: fake_engine
+        cache_cfg = {"enabled": True, "max-entries": 8, "ttl-s": 60}
+        payload = {"messages": [{"role": "user", "content": "label: spam?"}], "temperature": 0}
+
+        with patch.object(routes.settings, "RESPONSE_CACHE", cache_cfg), patch.object(
+            routes.factory, "response_cache", ResponseCache(8, 60)
+        ):
+            first = self.client.post("/v1/chat/completions", json={**payload, "model": "LLM"})
+            second = self.client.post("/v1/chat/completions", json={**payload, "model": "llm"})
+            bypass = self.client.post(
+                "/v1/chat/completions", json={**payload, "model": "LLM"}, headers={"X-Response-Cache": "bypass"}
+            )
+            sampled = self.client.post("/v1/chat/completions", json={**payload, "model": "LLM", "temperature": 0.7})
+
+        self.assertEqual(first.headers["x-response-cache"], "miss")
+        self.assertEqual(second.headers["x-response-cache"], "hit")
+        self.assertEqual(second.json()["model"], "llm")
+        self.assertNotIn("x-response-cache", bypass.headers)
+        self.assertNotIn("x-response-cache", sampled.headers)
+        self.assertEqual(fake_engine.calls, 3)
+
+    def test_metrics_endpoint_reports_chat_requests_and_tokens(self):
+        routes.factory.map_model_alias = lambda m: m
+        routes.factory.resolve_chat_engine = lambda _m: _FakeChatEngine()
+        payload = {"model": "qwen3:4b-instruct", "messages": [{"role": "user", "content": "ping"}]}
+        self.assertEqual(self.client.post("/v1/chat/completions", json=payload).status_code, 200)
+
+        res = self.client.get("/metrics")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.headers["content-type"].startswith("text/plain"))
+        self.assertIn('vilms_requests_total{route="chat",requested_model="qwen3:4b-instruct"', res.text)
+        self.assertIn('vilms_tokens_total{model="qwen3:4b-instruct",engine="ollama",kind="completion"}', res.text)
+        self.assertIn("vilms_request_duration_seconds_bucket", res.text)
+        self.assertIn("vilms_admission_queue_depth", res.text)
+
+    def test_chat_response_carries_server_timing_and_optional_profile(self):
+        routes.factory.map_model_alias = lambda m: m
+        routes.factory.resolve_chat_engine = lambda _m: _FakeChatEngine()
+        payload = {"model": "qwen3:4b-instruct", "messages": [{"role": "user", "content": "ping"}]}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            profiling = {"server-timing": True, "enabled": True, "dir": tmp, "interval-ms": 1, "max-seconds": 5}
+            with patch.object(routes.settings, "PROFILING", profiling):
+                res = self.client.post("/v1/chat/completions", json=payload, headers={"X-Profile": "1"})
+                for _ in range(100):
+                    if not routes.PROFILER.stats()["active"]:
+                        break
+                    time.sleep(0.01)
+                files = os.listdir(tmp)
+
+        self.assertEqual(res.status_code, 200)
+        stages = [entry.split(";")[0] for entry in res.headers["server-timing"].split(", ")]
+        self.assertEqual(stages[:2], ["alias", "optimize"])
+        self.assertIn("admission", stages)
+        self.assertEqual(stages[-1], "total")
+        self.assertEqual(files, [res.headers["x-profile-file"]])
+
     def test_embeddings_disabled(self):
         routes.factory.embedding = None
 
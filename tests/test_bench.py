@@ -0,0 +1,90 @@
+import asyncio
+import os
+import unittest
+
+import httpx
+
+from app.config import AppConfig
+from app.services.validator import validate_config_dict
+from bench import run as bench_run
+from bench.stubs import StubBackend, StubProfile
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+class BenchStatsTests(unittest.TestCase):
+    def test_percentiles_interpolate(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertAlmostEqual(bench_run.percentile(values, 50), 50.5)
+        self.assertAlmostEqual(bench_run.percentile(values, 99), 99.01)
+        self.assertEqual(bench_run.summarize([])["p95"], 0.0)
+
+    def test_generated_gateway_config_is_valid(self):
+        args = bench_run._parse_args(["--frames", "12"])
+        cfg = bench_run.gateway_config("http://127.0.0.1:1", "http://127.0.0.1:2", "http://127.0.0.1:3", args)
+        self.assertEqual(validate_config_dict(cfg).errors, [])
+        self.assertEqual(cfg["serving"]["default-max-frames"], 12)
+        routing = AppConfig(data=cfg).routing
+        self.assertEqual(
+            [routing.engine_for(m) for m in (bench_run.TEXT_MODEL, bench_run.VLM_MODEL, bench_run.VLLM_MODEL)],
+            ["ollama", "ollama", "vllm"],
+        )
+        names = [s.name for s in bench_run.build_scenarios(args)]
+        self.assertEqual(names, ["text-ollama", "text-vllm", "vlm-ollama-12f", "embeddings-b16"])
+
+    @unittest.skipUnless(os.path.exists(f"/proc/{os.getpid()}/stat"), "needs /proc")
+    def test_process_sampler_reads_proc(self):
+        sampler = bench_run.ProcessSampler(os.getpid())
+        self.assertGreaterEqual(sampler.cpu_seconds(), 0.0)
+        self.assertGreater(sampler.rss_bytes(), 0)
+
+
+class StubBackendTests(unittest.TestCase):
+    def test_ollama_stub_answers_native_and_streams_ndjson(self):
+        async def scenario():
+            stub = await StubBackend("ollama", StubProfile(latency_ms=0, completion_tokens=3)).start()
+            try:
+                async with httpx.AsyncClient(base_url=stub.base_url) as client:
+                    body = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+                    full = await client.post("/api/chat", json=dict(body, stream=False))
+                    streamed = await client.post("/api/chat", json=body)
+                    missing = await client.post("/v1/embeddings", json={"input": "x"})
+                return full, streamed, missing, stub.requests
+            finally:
+                await stub.aclose()
+
+        full, streamed, missing, count = _run(scenario())
+        self.assertEqual(full.json()["message"]["content"], "tok0 tok1 tok2")
+        self.assertEqual(full.json()["eval_count"], 3)
+        self.assertEqual(len(streamed.text.strip().splitlines()), 4)
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(count, 3)
+
+    def test_vllm_and_embedding_stubs_use_openai_shapes(self):
+        async def scenario():
+            profile = StubProfile(latency_ms=0, completion_tokens=2, embedding_dim=8)
+            vllm = await StubBackend("vllm", profile).start()
+            embedding = await StubBackend("embedding", profile).start()
+            try:
+                async with httpx.AsyncClient() as client:
+                    chat = await client.post(
+                        vllm.base_url + "/v1/chat/completions",
+                        json={"model": "m", "messages": [], "stream": True, "stream_options": {"include_usage": True}},
+                    )
+                    vectors = await client.post(embedding.base_url + "/v1/embeddings", json={"input": ["a", "b"]})
+                return chat, vectors
+            finally:
+                await vllm.aclose()
+                await embedding.aclose()
+
+        chat, vectors = _run(scenario())
+        events = [line for line in chat.text.splitlines() if line.startswith("data: ")]
+        self.assertEqual(events[-1], "data: [DONE]")
+        self.assertIn('"usage"', events[-2])
+        self.assertEqual([len(d["embedding"]) for d in vectors.json()["data"]], [8, 8])
+
+
+if __name__ == "__main__":
+    unittest.main()
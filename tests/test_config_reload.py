@@ -0,0 +1,177 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import yaml
+from fastapi.testclient import TestClient
+
+from app import routes
+from app.config import AppConfig, current_config, set_active_config
+from app.cores.factory import EngineFactory
+from app.engines.embedding_engine import CachedEmbeddingEngine
+from app.main import app
+from app.services.readiness import ComponentStatus, ReadinessMonitor
+from app.services.config_reload import ConfigReloader
+
+
+def _config(alias_target: str, engine: str = "ollama") -> dict:
+    return {
+        "host": {"platform": "dgpu"},
+        "serving": {
+            "engine": engine,
+            "base-url": "http://localhost:11434",
+            "models": [{"name": "qwen2.5:3b", "type": "llm"}, {"name": "qwen3:4b-instruct", "type": "llm"}],
+        },
+        "embedding": {"enabled": False},
+        "model-aliases": {"LLM": alias_target},
+    }
+
+
+class ConfigReloadTests(unittest.TestCase):
+    def setUp(self):
+        self._orig_config = current_config()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp.name) / "config.yaml"
+        self._write(_config("qwen2.5:3b"))
+        self.holder = {"factory": EngineFactory(AppConfig(str(self.path)))}
+        self.reloader = ConfigReloader(
+            self.path,
+            get_factory=lambda: self.holder["factory"],
+            set_factory=lambda f: self.holder.__setitem__("factory", f),
+            drain_timeout_s=5,
+        )
+
+    def tearDown(self):
+        set_active_config(self._orig_config)
+        self._tmp.cleanup()
+
+    def _write(self, data: dict) -> None:
+        self.path.write_text(yaml.safe_dump(data), encoding="utf-8")
+
+    def test_reload_swaps_snapshot_and_old_factory_drains_before_close(self):
+        async def scenario():
+            old = self.holder["factory"]
+            old.begin()  # a request still running on the old snapshot
+
+            self._write(_config("qwen3:4b-instruct"))
+            res = await self.reloader.reload("test")
+            new = self.holder["factory"]
+
+            self.assertTrue(res["ok"])
+            self.assertIsNot(new, old)
+            self.assertEqual(new.map_model_alias("LLM"), "qwen3:4b-instruct")
+            self.assertEqual(old.config.routing.resolve_alias("LLM"), "qwen2.5:3b")
+            self.assertIs(current_config(), new.config)
+
+            old_client = old.ollama.client
+            await asyncio.sleep(0.01)
+            self.assertFalse(old_client.is_closed)
+
+            old.end()
+            await asyncio.gather(*self.reloader._drain_tasks)
+            self.assertTrue(old_client.is_closed)
+            await new.aclose()
+
+        asyncio.run(scenario())
+
+    def test_shutdown_closes_a_snapshot_that_is_still_draining(self):
+        async def scenario():
+            old = self.holder["factory"]
+            old.readiness.start()
+            old.begin()  # never finishes
+            self._write(_config("qwen3:4b-instruct"))
+            await self.reloader.reload("test")
+            new = self.holder["factory"]
+            old_client = old.ollama.client
+            await asyncio.sleep(0.01)
+            self.assertFalse(old_client.is_closed)
+
+            await self.reloader.aclose()
+            self.assertTrue(old_client.is_closed)
+            self.assertIsNone(old.readiness._task)
+            self.assertFalse(self.reloader._drain_tasks)
+            await new.aclose()
+
+        asyncio.run(scenario())
+
+    def test_invalid_config_is_rejected_and_current_snapshot_kept(self):
+        async def scenario():
+            old = self.holder["factory"]
+            self._write({"serving": {"engine": "ollama", "models": []}})
+            res = await self.reloader.reload("test")
+            self.assertFalse(res["ok"])
+            self.assertTrue(any("backend URL" in e for e in res["errors"]))
+            self.assertIs(self.holder["factory"], old)
+            await old.aclose()
+
+        asyncio.run(scenario())
+
+    def test_failed_startup_closes_new_factory_and_keeps_old_limits(self):
+        created = []
+
+        async def failing_startup(factory):
+            created.append(factory)
+            _ = factory.ollama.client  # opened before the failure
+            raise RuntimeError("boom")
+
+        async def scenario():
+            old = self.holder["factory"]
+            old_client = old.ollama.client
+            limits_before = old.admission.stats()["engines"]
+            data = _config("qwen3:4b-instruct")
+            data["serving"]["admission"] = {"queue-timeout-s": 5, "engines": {"ollama": {"max-concurrency": 3}}}
+            self._write(data)
+            with patch.object(EngineFactory, "startup", failing_startup):
+                res = await self.reloader.reload("test")
+
+            self.assertFalse(res["ok"])
+            self.assertIn("boom", res["errors"][0])
+            self.assertIs(self.holder["factory"], old)
+            self.assertEqual(old.admission.stats()["engines"], limits_before)
+            self.assertEqual(old.admission.queue_timeout_s, 30.0)
+            self.assertIsNone(created[0].ollama._client)  # half-built factory's pool closed
+            self.assertFalse(old_client.is_closed)
+            await old.aclose()
+
+        asyncio.run(scenario())
+
+    def test_ready_stays_up_when_reload_keeps_the_warm_embedding_model(self):
+        data = _config("qwen2.5:3b")
+        data["embedding"] = {"enabled": True, "cache": {"enabled": False}}
+        data["serving"]["readiness"] = {"warmup": True, "require": "any"}
+        self._write(data)
+        unused = self.holder["factory"]
+        self.holder["factory"] = EngineFactory(AppConfig(str(self.path)))
+        client = TestClient(app)
+
+        async def scenario():
+            await unused.aclose()
+            old = self.holder["factory"]
+            engine = old.embedding.engine if isinstance(old.embedding, CachedEmbeddingEngine) else old.embedding
+            engine.model = object()  # warm-up already loaded the model
+            old.readiness.warmed_up = True
+            old.readiness.components["embedding"] = ComponentStatus(ready=True, detail="loaded")
+
+            data["model-aliases"] = {"LLM": "qwen3:4b-instruct"}
+            self._write(data)
+            with patch.object(ReadinessMonitor, "start", lambda monitor: None):
+                res = await self.reloader.reload("test")
+            new = self.holder["factory"]
+            with patch.object(routes, "factory", new):
+                ready = client.get("/ready")
+            await asyncio.gather(*self.reloader._drain_tasks)
+            await new.aclose()
+            return res, new, old, ready
+
+        res, new, old, ready = asyncio.run(scenario())
+        self.assertTrue(res["ok"])
+        self.assertIs(new.embedding, old.embedding)
+        self.assertEqual(ready.status_code, 200)
+        self.assertFalse(ready.json()["warming_up"])
+        self.assertEqual(new.readiness.warmups, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import tempfile
+import unittest
+
+import httpx
+
+from app.engines.embedding_engine import CachedEmbeddingEngine, HFEmbeddingEngine, RemoteEmbeddingEngine
+from app.services.batcher import MicroBatcher
+from app.services.embedding_cache import EmbeddingCache, embedding_cache_key
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+class RemoteEmbeddingEngineTests(unittest.TestCase):
+    def test_aembed_falls_back_then_sticks_to_working_candidate(self):
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request.url.host)
+            if request.url.host == "localhost":
+                raise httpx.ConnectError("refused", request=request)
+            body = json.loads(request.content)
+            return httpx.Response(
+                200,
+                json={"data": [{"index": i, "embedding": [float(i)]} for i, _ in enumerate(body["input"])]},
+            )
+
+        async def scenario():
+            engine = RemoteEmbeddingEngine("http://localhost:8001")
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            first = await engine.aembed(["a", "b"], model_name="e5")
+            client = engine.client
+            second = await engine.aembed(["c"], model_name="e5")
+            self.assertIs(engine.client, client)
+            await engine.aclose()
+            return first, second
+
+        first, second = _run(scenario())
+        self.assertEqual(first, [[0.0], [1.0]])
+        self.assertEqual(second, [[0.0]])
+        # Second request goes straight to the URL that answered last time.
+        self.assertEqual(calls, ["localhost", "vilms-embedding", "vilms-embedding"])
+
+    def test_aembed_rejects_malformed_response(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={"data": [{"index": 0}]})
+
+        async def scenario():
+            engine = RemoteEmbeddingEngine("http://vilms-embedding:8001")
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            try:
+                await engine.aembed(["a"])
+            finally:
+                await engine.aclose()
+
+        with self.assertRaisesRegex(RuntimeError, r"data\[0\]"):
+            _run(scenario())
+
+
+class _Vectors(list):
+    def tolist(self):
+        return list(self)
+
+
+class _FakeSentenceTransformer:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, inputs, normalize_embeddings=True):
+        self.calls.append(list(inputs))
+        return _Vectors([[float(len(text))] for text in inputs])
+
+
+class MicroBatchingTests(unittest.TestCase):
+    def test_concurrent_requests_share_one_encode_call(self):
+        engine = HFEmbeddingEngine()
+        engine.model = _FakeSentenceTransformer()
+        engine.batcher = MicroBatcher(engine.embed, max_batch_size=16, max_wait_ms=50)
+
+        async def scenario():
+            results = await asyncio.gather(*[engine.aembed(["x" * (i + 1)]) for i in range(6)])
+            await engine.aclose()
+            return results
+
+        results = _run(scenario())
+        self.assertEqual(results, [[[float(i + 1)]] for i in range(6)])
+        self.assertEqual(len(engine.model.calls), 1)
+        self.assertEqual(len(engine.model.calls[0]), 6)
+
+    def test_batches_respect_max_size_without_splitting_requests(self):
+        batches = []
+
+        def fn(items):
+            batches.append(list(items))
+            return [item.upper() for item in items]
+
+        batcher = MicroBatcher(fn, max_batch_size=3, max_wait_ms=50)
+
+        async def scenario():
+            results = await asyncio.gather(
+                batcher.submit(["a", "b"]),
+                batcher.submit(["c", "d"]),
+                batcher.submit(["e"]),
+            )
+            await batcher.aclose()
+            return results
+
+        results = _run(scenario())
+        self.assertEqual(results, [["A", "B"], ["C", "D"], ["E"]])
+        self.assertTrue(all(len(b) <= 3 for b in batches))
+        self.assertEqual(sorted(x for b in batches for x in b), ["a", "b", "c", "d", "e"])
+
+    def test_batch_errors_propagate_to_every_caller(self):
+        def fn(items):
+            raise ValueError("model failed")
+
+        batcher = MicroBatcher(fn, max_batch_size=8, max_wait_ms=10)
+
+        async def scenario():
+            results = await asyncio.gather(batcher.submit(["a"]), batcher.submit(["b"]), return_exceptions=True)
+            await batcher.aclose()
+            return results
+
+        for result in _run(scenario()):
+            self.assertIsInstance(result, ValueError)
+
+
+class _CountingEngine:
+    normalize = True
+
+    def __init__(self):
+        self.calls = []
+
+    def resolve_model_name(self, model_name=None):
+        return model_name or "e5"
+
+    async def aembed(self, inputs, model_name=None):
+        self.calls.append(list(inputs))
+        return [[float(len(text)), 0.5] for text in inputs]
+
+    async def aclose(self):
+        pass
+
+
+class EmbeddingCacheTests(unittest.TestCase):
+    def test_partial_hit_sends_only_distinct_misses_and_keeps_order(self):
+        inner = _CountingEngine()
+        engine = CachedEmbeddingEngine(inner, EmbeddingCache(max_entries=100))
+
+        first = _run(engine.aembed(["aa", "b"]))
+        second = _run(engine.aembed(["b", "cccc", "aa", "cccc"]))
+
+        self.assertEqual(first, [[2.0, 0.5], [1.0, 0.5]])
+        self.assertEqual(second, [[1.0, 0.5], [4.0, 0.5], [2.0, 0.5], [4.0, 0.5]])
+        self.assertEqual(inner.calls, [["aa", "b"], ["cccc"]])
+        stats = engine.cache.stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 4)
+
+    def test_miss_and_later_hit_return_equal_vectors(self):
+        class _Float64Engine(_CountingEngine):
+            async def aembed(self, inputs, model_name=None):
+                return [[0.1, 1 / 3] for _ in inputs]
+
+        engine = CachedEmbeddingEngine(_Float64Engine(), EmbeddingCache(max_entries=10))
+        miss = _run(engine.aembed(["x"]))
+        hit = _run(engine.aembed(["x"]))
+        self.assertEqual(engine.cache.stats()["hits"], 1)
+        self.assertEqual(miss, hit)
+
+    def test_key_depends_on_model_and_normalize_flag(self):
+        base = embedding_cache_key("e5", True, "hello")
+        self.assertNotEqual(base, embedding_cache_key("e5-large", True, "hello"))
+        self.assertNotEqual(base, embedding_cache_key("e5", False, "hello"))
+        self.assertEqual(base, embedding_cache_key("e5", True, "hello"))
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = EmbeddingCache(max_entries=2)
+        a, b, c = (embedding_cache_key("m", True, t) for t in "abc")
+        cache.put_many([(a, [1.0]), (b, [2.0])])
+        cache.get_many([a])
+        cache.put_many([(c, [3.0])])
+        self.assertEqual(cache.get_many([a, b, c]), [[1.0], None, [3.0]])
+
+    def test_disk_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            key = embedding_cache_key("m", True, "persist me")
+            cache = EmbeddingCache(max_entries=10, disk_path=tmp)
+            cache.put_many([(key, [0.25, -1.5, 3.0])])
+            cache.close()
+
+            reopened = EmbeddingCache(max_entries=10, disk_path=tmp)
+            self.assertEqual(reopened.get_many([key]), [[0.25, -1.5, 3.0]])
+            self.assertEqual(reopened.stats()["disk_hits"], 1)
+            reopened.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
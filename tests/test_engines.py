@@ -0,0 +1,403 @@
+import asyncio
+import json
+import unittest
+
+import httpx
+
+from app.config import AppConfig, use_config
+from app.engines.ollama_engine import OllamaEngine
+from app.engines.vllm_engine import VLLMEngine
+from app.services.ollama_residency import OllamaResidency, residency_options
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+class PooledClientTests(unittest.TestCase):
+    def test_engine_reuses_one_client_across_requests(self):
+        seen_clients = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(
+                200,
+                json={"message": {"role": "assistant", "content": "ok"}, "done": True},
+            )
+
+        async def scenario():
+            engine = OllamaEngine("http://ollama.test:11434")
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            payload = {"model": "qwen2.5:3b", "messages": [{"role": "user", "content": "hi"}]}
+            for _ in range(3):
+                res = await engine.chat_completion(payload)
+                self.assertEqual(res["choices"][0]["message"]["content"], "ok")
+                seen_clients.append(engine.client)
+            await engine.aclose()
+            self.assertIsNone(engine._client)
+
+        _run(scenario())
+        self.assertEqual(len({id(c) for c in seen_clients}), 1)
+
+    def test_startup_and_aclose_manage_client_lifecycle(self):
+        async def scenario():
+            engine = VLLMEngine()
+            await engine.startup()
+            client = engine.client
+            self.assertFalse(client.is_closed)
+            await engine.aclose()
+            self.assertTrue(client.is_closed)
+            # Lazily recreated when used after close.
+            self.assertIsNot(engine.client, client)
+            await engine.aclose()
+
+        _run(scenario())
+
+
+def _sse_payloads(raw: bytes):
+    out = []
+    for block in raw.decode("utf-8").split("\n\n"):
+        if block.startswith("data: "):
+            data = block[len("data: "):]
+            out.append(data if data == "[DONE]" else json.loads(data))
+    return out
+
+
+class StreamingTests(unittest.TestCase):
+    def test_ollama_native_ndjson_is_translated_to_openai_chunks(self):
+        lines = [
+            {"message": {"role": "assistant", "content": "Hel"}, "done": False},
+            {"message": {"role": "assistant", "content": "lo"}, "done": False},
+            {"message": {"role": "assistant", "content": ""}, "done": True, "done_reason": "stop",
+             "prompt_eval_count": 5, "eval_count": 2},
+        ]
+        captured = {}
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            captured["url"] = str(request.url)
+            captured["body"] = json.loads(request.content)
+            body = "".join(json.dumps(line) + "\n" for line in lines)
+            return httpx.Response(200, content=body.encode("utf-8"))
+
+        async def scenario():
+            engine = OllamaEngine("http://ollama.test:11434")
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            payload = {"model": "qwen2.5:3b", "messages": [{"role": "user", "content": "hi"}], "stream": True}
+            raw = b"".join([c async for c in engine.chat_completion_stream(payload, response_model="LLM")])
+            await engine.aclose()
+            return raw
+
+        events = _sse_payloads(_run(scenario()))
+        self.assertTrue(captured["url"].endswith("/api/chat"))
+        self.assertTrue(captured["body"]["stream"])
+        self.assertEqual(events[-1], "[DONE]")
+        chunks = events[:-1]
+        self.assertEqual(chunks[0]["object"], "chat.completion.chunk")
+        self.assertEqual(chunks[0]["model"], "LLM")
+        self.assertEqual(chunks[0]["choices"][0]["delta"], {"role": "assistant", "content": "Hel"})
+        text = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+        self.assertEqual(text, "Hello")
+        self.assertEqual(chunks[-2]["choices"][0]["finish_reason"], "stop")
+        self.assertEqual(chunks[-1]["choices"], [])
+        self.assertEqual(chunks[-1]["usage"], {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7})
+
+    def test_vllm_stream_is_proxied_byte_for_byte(self):
+        upstream = b'data: {"id":"x","choices":[{"delta":{"content":"hi"}}]}\n\ndata: [DONE]\n\n'
+        captured = {}
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            captured["body"] = json.loads(request.content)
+            return httpx.Response(200, content=upstream, headers={"content-type": "text/event-stream"})
+
+        async def scenario():
+            engine = VLLMEngine()
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            payload = {"model": "qwen3:4b-instruct", "messages": [{"role": "user", "content": "hi"}], "stream": True}
+            raw = b"".join([c async for c in engine.chat_completion_stream(payload)])
+            await engine.aclose()
+            return raw
+
+        self.assertEqual(_run(scenario()), upstream)
+        self.assertEqual(captured["body"]["stream_options"], {"include_usage": True})
+
+    def test_vllm_stream_keeps_client_stream_options_and_adds_usage(self):
+        captured = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            captured.append(json.loads(request.content)["stream_options"])
+            return httpx.Response(200, content=b"data: [DONE]\n\n", headers={"content-type": "text/event-stream"})
+
+        async def scenario():
+            engine = VLLMEngine()
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            for options in ({}, {"continuous_usage_stats": True}, {"include_usage": False}):
+                payload = {"model": "qwen3:4b-instruct", "messages": [], "stream": True, "stream_options": options}
+                [c async for c in engine.chat_completion_stream(payload)]
+            await engine.aclose()
+
+        _run(scenario())
+        self.assertEqual(captured, [
+            {"include_usage": True},
+            {"continuous_usage_stats": True, "include_usage": True},
+            {"include_usage": True},
+        ])
+
+    def test_ollama_v1_stream_fallback_reports_the_requested_model(self):
+        upstream = (
+            b'data: {"id":"c","object":"chat.completion.chunk","model":"qwen3:4b-instruct",'
+            b'"choices":[{"index":0,"delta":{"content":"say \\"model\\":\\"x\\""}}]}\n\n'
+            b'data: {"id":"c","object":"chat.completion.chunk","model":"qwen3:4b-instruct","choices":[],'
+            b'"usage":{"prompt_tokens":3,"completion_tokens":1,"total_tokens":4}}\n\n'
+            b"data: [DONE]\n\n"
+        )
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path == "/api/chat":
+                return httpx.Response(404, json={"error": "not found"})
+            return httpx.Response(200, content=upstream, headers={"content-type": "text/event-stream"})
+
+        async def scenario():
+            engine = OllamaEngine("http://ollama.test:11434")
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            payload = {"model": "qwen3:4b-instruct", "messages": [{"role": "user", "content": "hi"}], "stream": True}
+            raw = b"".join([c async for c in engine.chat_completion_stream(payload, response_model="LLM")])
+            await engine.aclose()
+            return raw
+
+        events = _sse_payloads(_run(scenario()))
+        self.assertEqual([e["model"] for e in events[:-1]], ["LLM", "LLM"])
+        self.assertEqual(events[0]["choices"][0]["delta"]["content"], 'say "model":"x"')
+        self.assertEqual(events[1]["usage"]["total_tokens"], 4)
+        self.assertEqual(events[-1], "[DONE]")
+
+
+class CapabilityProbeTests(unittest.TestCase):
+    def test_v1_only_host_is_called_on_v1_directly_after_probe(self):
+        paths = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            paths.append(request.url.path)
+            if request.url.path == "/v1/models":
+                return httpx.Response(200, json={"object": "list", "data": []})
+            if request.url.path == "/v1/chat/completions":
+                return httpx.Response(200, json={"choices": [{"message": {"content": "v1"}}]})
+            return httpx.Response(404)
+
+        async def scenario():
+            engine = OllamaEngine("http://ollama.test:11434")
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            caps = await engine.prober.probe_all()
+            self.assertFalse(caps["http://ollama.test:11434/v1/chat/completions"].native)
+            self.assertTrue(caps["http://ollama.test:11434/v1/chat/completions"].v1)
+
+            paths.clear()
+            payload = {"model": "qwen2.5:3b", "messages": [{"role": "user", "content": "hi"}]}
+            res = await engine.chat_completion(payload)
+            self.assertEqual(res["choices"][0]["message"]["content"], "v1")
+            await engine.aclose()
+
+        _run(scenario())
+        self.assertEqual(paths, ["/v1/chat/completions"])
+
+    def test_native_host_reports_version_and_loaded_models(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path == "/api/version":
+                return httpx.Response(200, json={"version": "0.5.7"})
+            if request.url.path == "/api/ps":
+                return httpx.Response(200, json={"models": [{"name": "qwen2.5vl:3b"}]})
+            return httpx.Response(404)
+
+        async def scenario():
+            engine = OllamaEngine("http://ollama.test:11434")
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            await engine.prober.probe_all()
+            snap = engine.prober.snapshot()["http://ollama.test:11434/v1/chat/completions"]
+            await engine.aclose()
+            return snap
+
+        snap = _run(scenario())
+        self.assertEqual(snap["version"], "0.5.7")
+        self.assertTrue(snap["native"])
+        self.assertFalse(snap["v1"])
+        self.assertEqual(snap["loaded_models"], ["qwen2.5vl:3b"])
+
+
+class OllamaResidencyTests(unittest.TestCase):
+    CONFIG = {"serving": {
+        "engine": "ollama",
+        "ollama-probe": {"enabled": False},
+        "models": [
+            {"name": "qwen2.5:3b", "params": {"pin": True}},
+            {"name": "qwen2.5vl:3b", "params": {"keep-alive": "30m", "preload": True}},
+        ],
+    }}
+
+    def test_keep_alive_is_sent_and_load_time_split_from_inference(self):
+        bodies = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            bodies.append(json.loads(request.content))
+            return httpx.Response(200, json={
+                "message": {"role": "assistant", "content": "ok"}, "done": True,
+                "load_duration": 3_000_000_000, "total_duration": 4_500_000_000,
+            })
+
+        async def scenario():
+            engine = OllamaEngine("http://ollama.test:11434")
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            await engine.chat_completion({"model": "qwen2.5vl:3b", "messages": [{"role": "user", "content": "hi"}]})
+            await engine.chat_completion({"model": "qwen2.5:3b", "messages": [{"role": "user", "content": "hi"}]})
+            snap = engine.residency.snapshot()
+            await engine.aclose()
+            return snap
+
+        with use_config(AppConfig(data=self.CONFIG)):
+            snap = _run(scenario())
+        self.assertEqual(bodies[0]["keep_alive"], "30m")
+        self.assertEqual(bodies[1]["keep_alive"], -1)
+        self.assertEqual(snap["qwen2.5vl:3b"]["cold_loads"], 1)
+        self.assertEqual(snap["qwen2.5vl:3b"]["last_load_s"], 3.0)
+
+    def test_preload_and_reload_of_evicted_pinned_model(self):
+        calls = []
+        resident = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request.url.path)
+            if request.url.path == "/api/ps":
+                return httpx.Response(200, json={"models": [{"name": m} for m in resident]})
+            body = json.loads(request.content)
+            calls.append(body["model"])
+            return httpx.Response(200, json={"model": body["model"], "done": True})
+
+        async def scenario():
+            engine = OllamaEngine("http://ollama.test:11434")
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            residency = engine.residency
+            await residency.preload()
+            resident[:] = ["qwen2.5vl:3b"]  # the pinned text model was evicted
+            await residency.refresh()
+            evicted = [n for n, st in residency.models.items() if st.pinned and not st.resident]
+            await residency.preload(evicted)
+            await engine.aclose()
+            return evicted
+
+        with use_config(AppConfig(data=self.CONFIG)):
+            evicted = _run(scenario())
+        self.assertEqual(evicted, ["qwen2.5:3b"])
+        self.assertEqual(
+            calls,
+            ["/api/generate", "qwen2.5:3b", "/api/generate", "qwen2.5vl:3b", "/api/ps", "/api/generate", "qwen2.5:3b"],
+        )
+
+    def test_untagged_config_name_matches_latest_in_ps(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={"models": [
+                {"name": "moondream:latest", "size_vram": 1024},
+                {"name": "registry.local:5000/team/llava:latest"},
+            ]})
+
+        async def scenario():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            residency = OllamaResidency(
+                {name: residency_options({}) for name in ("moondream", "registry.local:5000/team/llava", "qwen2.5:3b")},
+                get_candidates=lambda: ["http://ollama.test:11434"],
+                get_client=lambda: client,
+            )
+            await residency.refresh()
+            await client.aclose()
+            return residency.snapshot()
+
+        snap = _run(scenario())
+        self.assertTrue(snap["moondream"]["resident"])
+        self.assertEqual(snap["moondream"]["size_vram"], 1024)
+        self.assertTrue(snap["registry.local:5000/team/llava"]["resident"])
+        self.assertFalse(snap["qwen2.5:3b"]["resident"])
+
+
+class ReplicaBalancingTests(unittest.TestCase):
+    REPLICAS = ["http://vllm-a:8000", "http://vllm-b:8000", "http://vllm-c:8000"]
+
+    def _config(self, **load_balancing):
+        return AppConfig(data={"serving": {
+            "engine": "vllm",
+            "vllm-base-url": self.REPLICAS,
+            "load-balancing": load_balancing,
+            "models": [{"name": "qwen3:4b-instruct", "type": "llm"}],
+        }})
+
+    def test_concurrent_requests_spread_over_least_loaded_replicas(self):
+        hosts = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            hosts.append(request.url.host)
+            await asyncio.sleep(0.02)
+            return httpx.Response(200, json={"choices": []})
+
+        async def scenario():
+            engine = VLLMEngine()
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            payload = {"model": "qwen3:4b-instruct", "messages": [{"role": "user", "content": "hi"}]}
+            await asyncio.gather(*(engine.chat_completion(payload) for _ in range(6)))
+            snap = engine.balancer.snapshot()
+            await engine.aclose()
+            return snap
+
+        with use_config(self._config()):
+            snap = _run(scenario())
+        self.assertEqual(sorted(hosts), sorted(["vllm-a", "vllm-b", "vllm-c"] * 2))
+        self.assertTrue(all(r["inflight"] == 0 for r in snap.values()))
+
+    def test_failing_replica_is_ejected_and_request_moves_on(self):
+        hosts = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            hosts.append(request.url.host)
+            if request.url.host == "vllm-a":
+                return httpx.Response(503, json={"error": "overloaded"})
+            return httpx.Response(200, json={"choices": []})
+
+        async def scenario():
+            engine = VLLMEngine()
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            payload = {"model": "qwen3:4b-instruct", "messages": [{"role": "user", "content": "hi"}]}
+            for _ in range(6):
+                await engine.chat_completion(payload)
+            state = {ep["url"]: ep["state"] for ep in engine.health.snapshot()["endpoints"]}
+            await engine.aclose()
+            return state
+
+        with use_config(self._config()):
+            state = _run(scenario())
+        self.assertEqual(state["http://vllm-a:8000"], "open")
+        # Threshold is 2 consecutive failures; after that vllm-a is skipped.
+        self.assertEqual(hosts.count("vllm-a"), 2)
+        self.assertEqual(len(hosts), 8)
+
+    def test_model_replicas_override_default_and_4xx_is_not_retried(self):
+        hosts = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            hosts.append(request.url.host)
+            return httpx.Response(400, json={"error": "bad request"})
+
+        cfg = AppConfig(data={"serving": {
+            "engine": "vllm",
+            "vllm-base-url": "http://vilms-vllm:8000",
+            "models": [{"name": "m", "replicas": ["http://m-1:8000", "http://m-2:8000"]}],
+        }})
+
+        async def scenario():
+            engine = VLLMEngine()
+            engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            with self.assertRaises(httpx.HTTPStatusError):
+                await engine.chat_completion({"model": "m", "messages": []})
+            await engine.aclose()
+
+        with use_config(cfg):
+            _run(scenario())
+        self.assertEqual(len(hosts), 1)
+        self.assertIn(hosts[0], {"m-1", "m-2"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,13 @@
 import unittest
-from unittest.mock import PropertyMock, patch
+from unittest.mock import patch
 
+from app.config import AppConfig, use_config
 from app.cores.factory import EngineFactory
-import app.cores.factory as factory_module
+from app.cores.routing import RoutingIndex
+
+
+def _index(models, engine="vllm", host_platform="dgpu", aliases=None):
+    return RoutingIndex(aliases=aliases or {}, models=models, engine=engine, host_platform=host_platform)
 
 
 class FactoryRoutingTests(unittest.TestCase):
@@ -10,22 +15,66 @@ class FactoryRoutingTests(unittest.TestCase):
         self.factory = EngineFactory()
 
     def test_global_ollama_force_beats_model_engine_override(self):
-        with patch.object(factory_module.settings, "find_model", return_value={"engine": "vllm"}):
-            with patch.object(type(factory_module.settings), "ENGINE", new_callable=PropertyMock, return_value="ollama"):
-                with patch.object(type(factory_module.settings), "HOST_PLATFORM", new_callable=PropertyMock, return_value="dgpu"):
-                    self.assertEqual(self.factory.resolve_chat_engine_name("LLM"), "ollama")
+        index = _index([{"name": "LLM", "engine": "vllm"}], engine="ollama")
+        with patch.object(self.factory.config, "routing", index):
+            self.assertEqual(self.factory.resolve_chat_engine_name("LLM"), "ollama")
 
     def test_model_engine_override_used_when_not_forced(self):
-        with patch.object(factory_module.settings, "find_model", return_value={"engine": "ollama"}):
-            with patch.object(type(factory_module.settings), "ENGINE", new_callable=PropertyMock, return_value="vllm"):
-                with patch.object(type(factory_module.settings), "HOST_PLATFORM", new_callable=PropertyMock, return_value="dgpu"):
-                    self.assertEqual(self.factory.resolve_chat_engine_name("custom-model"), "ollama")
+        index = _index([{"name": "custom-model", "engine": "ollama"}], engine="vllm")
+        with patch.object(self.factory.config, "routing", index):
+            self.assertEqual(self.factory.resolve_chat_engine_name("custom-model"), "ollama")
 
     def test_model_type_vlm_routes_to_ollama_without_name_heuristic(self):
-        with patch.object(factory_module.settings, "find_model", return_value={"type": "vlm"}):
-            with patch.object(type(factory_module.settings), "ENGINE", new_callable=PropertyMock, return_value="vllm"):
-                with patch.object(type(factory_module.settings), "HOST_PLATFORM", new_callable=PropertyMock, return_value="dgpu"):
-                    self.assertEqual(self.factory.resolve_chat_engine_name("my-vision-model"), "ollama")
+        index = _index([{"name": "my-vision-model", "type": "vlm"}], engine="vllm")
+        with patch.object(self.factory.config, "routing", index):
+            self.assertEqual(self.factory.resolve_chat_engine_name("my-vision-model"), "ollama")
+
+    def test_jetson_prefers_ollama(self):
+        index = _index([{"name": "qwen3:4b-instruct", "type": "llm"}], engine="vllm", host_platform="js")
+        with patch.object(self.factory.config, "routing", index):
+            self.assertEqual(self.factory.resolve_chat_engine_name("qwen3:4b-instruct"), "ollama")
+
+    def test_routing_follows_the_factory_snapshot_not_the_active_config(self):
+        index = _index([{"name": "custom-model", "engine": "ollama"}], engine="vllm")
+        other = _index([{"name": "custom-model", "engine": "vllm"}], engine="vllm")
+        with patch.object(self.factory.config, "routing", index), use_config(AppConfig(data={})) as active:
+            with patch.object(active, "routing", other):
+                self.assertEqual(self.factory.resolve_chat_engine_name("custom-model"), "ollama")
+
+    def test_unknown_model_uses_name_heuristic(self):
+        index = _index([], engine="vllm")
+        with patch.object(self.factory.config, "routing", index):
+            self.assertEqual(self.factory.resolve_chat_engine_name("some-vl-model"), "ollama")
+            self.assertEqual(self.factory.resolve_chat_engine_name("some-text-model"), "vllm")
+
+
+class RoutingIndexTests(unittest.TestCase):
+    def test_alias_chains_are_flattened_and_local_aliases_merged(self):
+        index = _index(
+            [{"name": "qwen3:4b-instruct", "type": "llm", "aliases": ["LLM_QWEN3"]}],
+            aliases={"LLM": "Qwen3-4B-Instruct", "Qwen3-4B-Instruct": "qwen3:4b-instruct"},
+        )
+        self.assertEqual(index.aliases["LLM"], "qwen3:4b-instruct")
+        self.assertEqual(index.resolve_alias("LLM_QWEN3"), "qwen3:4b-instruct")
+        self.assertEqual(index.resolve_alias("not-an-alias"), "not-an-alias")
+
+    def test_alias_cycles_stop_like_the_chain_walk(self):
+        index = _index([], aliases={"A": "B", "B": "A"})
+        self.assertEqual(index.resolve_alias("A"), "A")
+        self.assertEqual(index.resolve_alias("B"), "B")
+
+    def test_route_carries_canonical_name_metadata_and_engine(self):
+        index = _index(
+            [{"name": "qwen2.5vl:3b", "type": "vlm", "aliases": ["VLM_SMALL"]}],
+            aliases={"VLM": "VLM_SMALL"},
+        )
+        route = index.route("VLM")
+        self.assertEqual(route.canonical, "qwen2.5vl:3b")
+        self.assertEqual(route.model["type"], "vlm")
+        self.assertEqual(route.engine, "ollama")
+        self.assertIs(index.find_model("VLM_SMALL"), route.model)
+        with self.assertRaises(TypeError):
+            route.model["type"] = "llm"
 
 
 if __name__ == "__main__":
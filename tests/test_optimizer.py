@@ -0,0 +1,111 @@
+import asyncio
+import base64
+import unittest
+from unittest.mock import patch
+
+import app.services.optimizer as optimizer
+from app.services.optimizer import optimize_payload, preprocess_images, select_frames
+
+_PREPROCESS = {
+    "enabled": True,
+    "max-edge": 64,
+    "format": "jpeg",
+    "quality": 80,
+    "executor": "thread",
+    "workers": 1,
+}
+
+
+def _png_data_url(width: int, height: int) -> str:
+    import cv2
+    import numpy as np
+
+    img = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+    ok, buf = cv2.imencode(".png", img)
+    return "data:image/png;base64," + base64.b64encode(buf.tobytes()).decode("ascii")
+
+
+def _vision_payload(*urls):
+    return {
+        "model": "qwen2.5vl:3b",
+        "messages": [
+            {"role": "system", "content": "describe"},
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": "what changed?"}]
+                + [{"type": "image_url", "image_url": {"url": u}} for u in urls],
+            },
+        ],
+    }
+
+
+@unittest.skipIf(optimizer.cv2 is None, "OpenCV is not installed")
+class ImagePreprocessTests(unittest.TestCase):
+    def _run(self, payload, model_cfg=None, options=None):
+        with patch.object(optimizer.settings, "IMAGE_PREPROCESS", options or _PREPROCESS):
+            return asyncio.run(preprocess_images(payload, model_cfg))
+
+    def test_large_frames_are_downscaled_and_bytes_saved_reported(self):
+        import cv2
+        import numpy as np
+
+        payload = _vision_payload(_png_data_url(320, 240))
+        out, stats = self._run(payload)
+
+        url = out["messages"][1]["content"][1]["image_url"]["url"]
+        self.assertTrue(url.startswith("data:image/jpeg;base64,"))
+        img = cv2.imdecode(np.frombuffer(base64.b64decode(url.split(",", 1)[1]), np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(img.shape[:2], (48, 64))
+        self.assertEqual(stats["images"], 1)
+        self.assertGreater(stats["bytes_saved"], 0)
+
+        # Only the changed message is rebuilt; the caller's payload is untouched.
+        self.assertIs(out["messages"][0], payload["messages"][0])
+        self.assertTrue(payload["messages"][1]["content"][1]["image_url"]["url"].startswith("data:image/png"))
+
+    def test_per_model_params_override_defaults(self):
+        payload = _vision_payload(_png_data_url(320, 240))
+        model_cfg = {"params": {"image-format": "webp", "image-max-edge": 32}}
+        out, stats = self._run(payload, model_cfg)
+        self.assertTrue(out["messages"][1]["content"][1]["image_url"]["url"].startswith("data:image/webp;base64,"))
+
+    def test_disabled_or_undecodable_images_pass_through(self):
+        payload = _vision_payload("data:image/png;base64,bm90LWFuLWltYWdl")
+        out, stats = self._run(payload)
+        self.assertIs(out, payload)
+        self.assertEqual(stats["images"], 0)
+
+        payload = _vision_payload(_png_data_url(320, 240))
+        out, _ = self._run(payload, options={**_PREPROCESS, "enabled": False})
+        self.assertIs(out, payload)
+
+
+class FrameSelectionTests(unittest.TestCase):
+    def test_strategies_pick_expected_frames(self):
+        self.assertEqual(select_frames(10, 4, "last"), [6, 7, 8, 9])
+        self.assertEqual(select_frames(10, 4, "uniform"), [1, 3, 6, 8])
+        self.assertEqual(select_frames(10, 4, "first-last-uniform"), [0, 3, 6, 9])
+        self.assertEqual(select_frames(3, 4, "uniform"), [0, 1, 2])
+
+    def test_jetson_trim_shares_untouched_parts_and_uses_model_params(self):
+        urls = [f"data:image/jpeg;base64,frame{i}" for i in range(6)]
+        payload = _vision_payload(*urls)
+        model_cfg = {"params": {"max-frames": 3, "frame-strategy": "first-last-uniform"}}
+
+        with patch.object(optimizer.settings, "HOST_PLATFORM", "js"):
+            out = optimize_payload(payload, model_cfg)
+
+        content = out["messages"][1]["content"]
+        self.assertEqual([it["image_url"]["url"] for it in content[1:]], [urls[0], urls[2], urls[5]])
+        self.assertIs(content[1], payload["messages"][1]["content"][1])
+        self.assertIs(out["messages"][0], payload["messages"][0])
+        self.assertEqual(len(payload["messages"][1]["content"]), 7)
+
+    def test_payload_within_limit_is_returned_as_is(self):
+        payload = _vision_payload("data:image/jpeg;base64,a", "data:image/jpeg;base64,b")
+        with patch.object(optimizer.settings, "HOST_PLATFORM", "js"):
+            self.assertIs(optimize_payload(payload), payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
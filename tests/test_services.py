@@ -0,0 +1,715 @@
+import asyncio
+import base64
+import random
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+
+from app.services.admission import AdmissionController, AdmissionLimiter, AdmissionRejected, ModelAffinityLimiter
+from app.services.coalescer import SingleFlight, request_key
+from app.services.endpoint_health import EndpointHealth
+from app.cores import fastjson
+from app.services.image_fetcher import ImageFetcher, data_url_payload
+from app.services.load_balancer import ReplicaBalancer
+from app.services import metrics
+from app.services.metrics import Counter, Histogram, Registry, error_type
+from app.services.profiler import RequestProfiler, StackSampler
+from app.services.readiness import ReadinessMonitor, http_probe
+from app.services.response_cache import ResponseCache
+from app.services.scheduler import FairQueue, Ticket, classify
+from app.services.shared_state import ByteLRU, SharedStateClient, SharedStateServer
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class EndpointHealthTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        self.health = EndpointHealth(
+            ["http://a", "http://b"], failure_threshold=2, cooldown_s=10, max_cooldown_s=40, clock=self.clock
+        )
+
+    def test_last_working_url_is_tried_first(self):
+        self.assertEqual(self.health.candidates(), ["http://a", "http://b"])
+        self.health.record_failure("http://a", "refused")
+        self.health.record_success("http://b")
+        self.assertEqual(self.health.candidates(), ["http://b", "http://a"])
+
+    def test_circuit_opens_after_threshold_and_half_opens_for_one_probe(self):
+        self.health.record_failure("http://a")
+        self.assertTrue(self.health.allow("http://a"))
+        self.health.record_failure("http://a")
+        self.assertFalse(self.health.allow("http://a"))
+        self.assertEqual(self.health.candidates()[-1], "http://a")
+
+        self.clock.now += 10
+        self.assertEqual(self.health.snapshot()["endpoints"][0]["state"], "half_open")
+        self.assertTrue(self.health.allow("http://a"))
+        # Only one concurrent probe is let through.
+        self.assertFalse(self.health.allow("http://a"))
+
+        self.health.record_success("http://a")
+        self.assertEqual(self.health.snapshot()["endpoints"][0]["state"], "closed")
+        self.assertTrue(self.health.allow("http://a"))
+
+    def test_failed_probe_doubles_cooldown_up_to_max(self):
+        for _ in range(2):
+            self.health.record_failure("http://a")
+        for expected in (20, 40, 40):
+            self.clock.now += 1000
+            self.assertTrue(self.health.allow("http://a"))
+            self.health.record_failure("http://a")
+            self.assertEqual(self.health.snapshot()["endpoints"][0]["retry_in_s"], expected)
+
+
+class ImageFetcherTests(unittest.TestCase):
+    def _fetch_all(self, fetcher, handler, urls):
+        async def scenario():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                return await fetcher.fetch_all(client, urls)
+
+        return asyncio.run(scenario())
+
+    def test_fetches_concurrently_up_to_limit_and_preserves_order(self):
+        state = {"active": 0, "peak": 0}
+
+        async def handler(request):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.01)
+            state["active"] -= 1
+            return httpx.Response(200, content=request.url.path.encode())
+
+        urls = [f"http://cam/frame{i}.jpg" for i in range(6)] + ["data:image/png;base64,QUJD"]
+        out = self._fetch_all(ImageFetcher(max_concurrency=3), handler, urls)
+
+        expected = [base64.b64encode(f"/frame{i}.jpg".encode()).decode() for i in range(6)] + ["QUJD"]
+        self.assertEqual(out, expected)
+        self.assertEqual(state["peak"], 3)
+
+    def test_repeated_frames_are_served_from_cache_and_share_content(self):
+        calls = []
+
+        def handler(request):
+            calls.append(str(request.url))
+            return httpx.Response(200, content=b"same-frame")
+
+        fetcher = ImageFetcher()
+        first = self._fetch_all(fetcher, handler, ["http://cam/a.jpg", "http://cam/b.jpg"])
+        second = self._fetch_all(fetcher, handler, ["http://cam/a.jpg", "http://cam/b.jpg"])
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(fetcher.stats()["hits"], 2)
+        self.assertEqual(fetcher.stats()["cached_blobs"], 1)
+
+    def test_oversized_image_is_rejected(self):
+        def handler(request):
+            return httpx.Response(200, content=b"x" * 2048)
+
+        with self.assertRaises(ValueError):
+            self._fetch_all(ImageFetcher(max_bytes=1024), handler, ["http://cam/big.jpg"])
+
+    def test_data_url_is_validated_in_place(self):
+        url = "data:image/png;base64," + base64.b64encode(b"frame-bytes").decode("ascii")
+        self.assertEqual(data_url_payload(url), base64.b64encode(b"frame-bytes").decode("ascii"))
+        with self.assertRaises(ValueError):
+            data_url_payload("data:image/png;base64,not*base64")
+        with self.assertRaises(ValueError):
+            data_url_payload(url, max_bytes=4)
+
+    def test_url_safe_and_whitespace_data_urls_are_normalized(self):
+        raw = bytes(range(250, 256)) + b"\xfb\xff?"
+        standard = base64.b64encode(raw).decode("ascii")
+        urlsafe = base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+        self.assertNotEqual(urlsafe, standard)
+        self.assertEqual(data_url_payload("data:image/jpeg;base64," + urlsafe), standard)
+        spaced = "data:image/jpeg;base64, " + " \t".join(standard[i:i + 4] for i in range(0, len(standard), 4)) + "\n"
+        self.assertEqual(data_url_payload(spaced), standard)
+        self.assertEqual(base64.b64decode(data_url_payload("data:image/jpeg;base64,YWJj ZA")), b"abcd")
+
+    def test_data_url_padding_and_header_are_checked(self):
+        self.assertEqual(data_url_payload("data:image/jpeg;base64,YWJjZA"), "YWJjZA==")
+        self.assertEqual(data_url_payload("data:image/jpeg;base64,YWJjZA="), "YWJjZA==")
+        self.assertEqual(data_url_payload("data:image/jpeg;base64,YWJjZGU"), "YWJjZGU=")
+        self.assertEqual(data_url_payload("data:image/jpeg;base64,YWJj"), "YWJj")
+        for bad in (
+            "data:image/jpeg;base64,AAAAA",  # 5 chars: no byte count encodes to this
+            "data:image/jpeg;base64,AAAAA=",
+            "data:image/jpeg;base64,AA AA A",
+            "data:text/plain,hello",  # not base64 at all
+        ):
+            with self.assertRaises(ValueError, msg=bad):
+                data_url_payload(bad)
+
+
+class FastJSONTests(unittest.TestCase):
+    BODY = (
+        b'{"id":"cmpl-1","object":"chat.completion","created":1,"model":"/models/qwen3",'
+        b'"choices":[{"index":0,"message":{"role":"assistant","content":"\\"model\\":\\"x\\""}}],'
+        b'"usage":{"prompt_tokens":3,"completion_tokens":5,"total_tokens":8}}'
+    )
+
+    def test_rewrite_model_touches_only_the_top_level_field(self):
+        out = fastjson.rewrite_model(self.BODY, "LLM")
+        self.assertEqual(out, self.BODY.replace(b'"model":"/models/qwen3"', b'"model":"LLM"'))
+        decoded = fastjson.loads(out)
+        self.assertEqual(decoded["model"], "LLM")
+        self.assertEqual(decoded["choices"][0]["message"]["content"], fastjson.loads(self.BODY)["choices"][0]["message"]["content"])
+        self.assertIsNone(fastjson.rewrite_model(b'{"choices":[],"model":"m"}', "LLM"))
+        # No "choices": a nested "model" must not be taken for the top-level one.
+        self.assertIsNone(fastjson.rewrite_model(b'{"error":{"model":"m","message":"x"}}', "LLM"))
+
+    def test_usage_is_read_from_the_body_tail(self):
+        self.assertEqual(fastjson.usage_from_body(self.BODY), {"prompt_tokens": 3, "completion_tokens": 5, "total_tokens": 8})
+        self.assertIsNone(fastjson.usage_from_body(b'{"usage":null}'))
+
+
+class AdmissionLimiterTests(unittest.TestCase):
+    def test_queued_requests_are_admitted_in_order_and_overflow_is_rejected(self):
+        async def scenario():
+            limiter = AdmissionLimiter("model m", max_concurrency=1, max_queue=2)
+            deadline = time.monotonic() + 5
+            await limiter.acquire(deadline)
+            order = []
+
+            async def waiter(tag):
+                await limiter.acquire(deadline)
+                order.append(tag)
+
+            tasks = [asyncio.create_task(waiter(t)) for t in ("a", "b")]
+            await asyncio.sleep(0)
+            self.assertEqual(limiter.queued, 2)
+            with self.assertRaises(AdmissionRejected):
+                await limiter.acquire(deadline)
+
+            limiter.release()
+            await asyncio.sleep(0)
+            limiter.release()
+            await asyncio.gather(*tasks)
+            self.assertEqual(order, ["a", "b"])
+            self.assertEqual(limiter.stats()["rejected"], 1)
+
+        asyncio.run(scenario())
+
+    def test_queue_deadline_rejects_and_frees_the_queue_slot(self):
+        async def scenario():
+            limiter = AdmissionLimiter("engine ollama", max_concurrency=1, max_queue=1)
+            await limiter.acquire(time.monotonic() + 5)
+            with self.assertRaises(AdmissionRejected) as ctx:
+                await limiter.acquire(time.monotonic() + 0.01)
+            self.assertGreaterEqual(ctx.exception.retry_after_s, 1)
+            self.assertEqual(limiter.queued, 0)
+            self.assertEqual(limiter.stats()["timed_out"], 1)
+
+        asyncio.run(scenario())
+
+
+class ModelAffinityTests(unittest.TestCase):
+    def _run_waiters(self, limiter, models, order):
+        deadline = time.monotonic() + 5
+
+        async def waiter(tag, model):
+            await limiter.acquire(deadline, model=model)
+            order.append(tag)
+
+        return [asyncio.create_task(waiter(tag, model)) for tag, model in models]
+
+    def test_current_model_queue_drains_before_switching(self):
+        async def scenario():
+            clock = _Clock()
+            limiter = ModelAffinityLimiter("engine ollama", max_concurrency=1, max_queue=8, max_wait_s=10, clock=clock)
+            await limiter.acquire(time.monotonic() + 5, model="llm")
+            order = []
+            tasks = self._run_waiters(limiter, [("vlm-1", "vlm"), ("llm-2", "llm"), ("llm-3", "llm")], order)
+            await asyncio.sleep(0)
+            self.assertEqual(limiter.stats()["queued_by_model"], {"vlm": 1, "llm": 2})
+            for _ in range(3):
+                limiter.release()
+                await asyncio.sleep(0)
+            await asyncio.gather(*tasks)
+            self.assertEqual(order, ["llm-2", "llm-3", "vlm-1"])
+            self.assertEqual(limiter.stats()["swaps"], 1)
+
+        asyncio.run(scenario())
+
+    def test_waiting_model_gets_the_engine_after_max_wait(self):
+        async def scenario():
+            clock = _Clock()
+            limiter = ModelAffinityLimiter("engine ollama", max_concurrency=0, max_queue=8, max_wait_s=10, clock=clock)
+            await limiter.acquire(time.monotonic() + 5, model="llm")
+            order = []
+            tasks = self._run_waiters(limiter, [("vlm-1", "vlm")], order)
+            await asyncio.sleep(0)
+            # Same model keeps being admitted concurrently while the wait is short.
+            await limiter.acquire(time.monotonic() + 5, model="llm")
+            clock.now += 11
+            late = self._run_waiters(limiter, [("llm-late", "llm")], order)
+            await asyncio.sleep(0)
+            self.assertEqual(order, [])
+            limiter.release()
+            limiter.release()
+            await asyncio.sleep(0.01)
+            self.assertEqual(order, ["vlm-1"])
+            limiter.release()
+            await asyncio.gather(*tasks, *late)
+            self.assertEqual(order, ["vlm-1", "llm-late"])
+            self.assertEqual(limiter.stats()["swaps"], 2)
+
+        asyncio.run(scenario())
+
+    def test_zero_max_queue_rejects_instead_of_queueing(self):
+        async def scenario():
+            admission = AdmissionController()
+            admission.configure(
+                {"queue-timeout-s": 5, "engines": {"ollama": {
+                    "max-concurrency": 1, "max-queue": 0, "model-affinity": True, "affinity-max-wait-s": 10,
+                }}},
+                [],
+            )
+            limiter = admission.engines["ollama"]
+            await limiter.acquire(time.monotonic() + 5, model="llm")
+            for model in ("llm", "vlm"):
+                with self.assertRaises(AdmissionRejected):
+                    await limiter.acquire(time.monotonic() + 5, model=model)
+            return limiter.stats()
+
+        stats = asyncio.run(scenario())
+        self.assertTrue(stats["model_affinity"])
+        self.assertEqual((stats["queued"], stats["rejected"]), (0, 2))
+
+
+_SCHEDULING = {
+    "classes": {"interactive": {"weight": 4.0}, "batch": {"weight": 1.0}},
+    "default-class": "interactive",
+    "class-header": "X-Priority",
+    "tenant-header": "X-Tenant",
+    "tenant-max-inflight": 0,
+    "tenant-max-queue": 16,
+    "api-keys": {"sk-nightly": {"tenant": "nightly", "class": "batch", "max-inflight": 1}},
+}
+
+
+class FairSchedulingTests(unittest.TestCase):
+    def test_classify_uses_api_key_then_headers_then_defaults(self):
+        ticket = classify({"authorization": "Bearer sk-nightly", "x-priority": "interactive"}, _SCHEDULING)
+        self.assertEqual(ticket, Ticket("nightly", "batch", 1))
+
+        ticket = classify({"x-tenant": "ui", "x-priority": "made-up"}, _SCHEDULING)
+        self.assertEqual((ticket.tenant, ticket.priority), ("ui", "interactive"))
+
+        ticket = classify({"authorization": "Bearer sk-other"}, _SCHEDULING)
+        self.assertTrue(ticket.tenant.startswith("key:"))
+        self.assertNotIn("sk-other", ticket.tenant)
+
+    def test_weighted_share_between_classes_and_round_robin_between_tenants(self):
+        queue = FairQueue({"interactive": 4.0, "batch": 1.0})
+        for i in range(10):
+            queue.push(Ticket("nightly", "batch"), f"b{i}")
+        for i in range(4):
+            queue.push(Ticket("ui-a", "interactive"), f"a{i}")
+            queue.push(Ticket("ui-b", "interactive"), f"u{i}")
+
+        order = [queue.pop() for _ in range(10)]
+        self.assertEqual(sum(1 for o in order if o.startswith("b")), 2)
+        interactive = [o for o in order if not o.startswith("b")]
+        self.assertEqual(interactive, ["a0", "u0", "a1", "u1", "a2", "u2", "a3", "u3"])
+
+    def test_tenant_cap_queues_that_tenant_only(self):
+        async def scenario():
+            controller = AdmissionController()
+            controller.configure({"queue-timeout-s": 5, "engines": {}}, [], _SCHEDULING)
+            nightly = classify({"authorization": "Bearer sk-nightly"}, _SCHEDULING)
+
+            release = await controller.acquire("ollama", "m", nightly)
+            second = asyncio.create_task(controller.acquire("ollama", "m", nightly))
+            await asyncio.sleep(0)
+            self.assertFalse(second.done())
+            self.assertEqual(controller.stats()["tenants"]["nightly"]["queued"], 1)
+
+            other = await controller.acquire("ollama", "m", Ticket("ui", "interactive"))
+            other()
+            release()
+            (await second)()
+            self.assertNotIn("nightly", controller.tenants)
+            self.assertEqual(controller.stats()["classes"]["batch"]["admitted"], 2)
+
+        asyncio.run(scenario())
+
+
+class SingleFlightTests(unittest.TestCase):
+    def test_request_key_ignores_dict_order(self):
+        a = {"model": "m", "messages": [{"role": "user", "content": "x"}], "temperature": 0}
+        b = {"temperature": 0, "messages": [{"content": "x", "role": "user"}], "model": "m"}
+        self.assertEqual(request_key(a), request_key(b))
+        self.assertNotEqual(request_key(a), request_key({**a, "temperature": 0.7}))
+
+    def test_followers_share_the_leader_result_and_errors(self):
+        async def scenario():
+            flight = SingleFlight()
+            calls = []
+
+            async def work():
+                calls.append(1)
+                await asyncio.sleep(0.01)
+                return {"answer": 42}
+
+            results = await asyncio.gather(*(flight.run("k", work) for _ in range(3)))
+            self.assertEqual(len(calls), 1)
+            self.assertTrue(all(r == {"answer": 42} for r in results))
+
+            async def boom():
+                await asyncio.sleep(0.01)
+                raise RuntimeError("upstream down")
+
+            outcomes = await asyncio.gather(flight.run("e", boom), flight.run("e", boom), return_exceptions=True)
+            self.assertTrue(all(isinstance(o, RuntimeError) for o in outcomes))
+            self.assertEqual(flight.stats(), {"inflight": 0, "leaders": 2, "coalesced": 3})
+
+        asyncio.run(scenario())
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def test_ttl_and_lru_eviction(self):
+        clock = _Clock()
+        cache = ResponseCache(max_entries=2, ttl_s=10, clock=clock)
+        cache.put("a", {"model": "m", "choices": []})
+        cache.put("b", {"model": "m", "choices": []})
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("c", {"model": "m", "choices": []})  # evicts b (least recently used)
+        self.assertIsNone(cache.get("b"))
+
+        hit = cache.get("a")
+        hit["model"] = "rewritten"
+        self.assertEqual(cache.get("a")["model"], "m")
+
+        clock.now += 11
+        self.assertIsNone(cache.get("c"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+class ReplicaBalancerTests(unittest.TestCase):
+    URLS = ["http://a", "http://b", "http://c"]
+
+    def test_least_outstanding_picks_idle_replica_and_rotates_ties(self):
+        balancer = ReplicaBalancer("least-outstanding")
+        release_a = balancer.acquire("http://a")
+        balancer.acquire("http://b")
+        self.assertEqual(balancer.order(self.URLS), ["http://c", "http://a", "http://b"])
+        release_a()
+        release_a()  # idempotent
+        self.assertEqual(balancer.inflight("http://a"), 0)
+        firsts = {balancer.order(["http://a", "http://c"])[0] for _ in range(2)}
+        self.assertEqual(firsts, {"http://a", "http://c"})
+
+    def test_power_of_two_prefers_less_loaded_of_sampled_pair(self):
+        balancer = ReplicaBalancer("power-of-two", rng=random.Random(7))
+        for _ in range(5):
+            balancer.acquire("http://a")
+        firsts = [balancer.order(["http://a", "http://b"])[0] for _ in range(10)]
+        self.assertEqual(set(firsts), {"http://b"})
+        self.assertEqual(balancer.snapshot()["http://b"]["picks"], 10)
+
+
+class MetricsTests(unittest.TestCase):
+    def test_render_counter_histogram_and_scrape_time_families(self):
+        registry = Registry()
+        requests = registry.register(Counter("t_requests_total", "Requests.", ("model", "status")))
+        latency = registry.register(Histogram("t_latency_seconds", "Latency.", ("model",), buckets=(0.1, 1)))
+        requests.inc(model='a"b', status=200)
+        requests.inc(model='a"b', status=200)
+        latency.observe(0.05, model="a")
+        latency.observe(0.5, model="a")
+        latency.observe(5, model="a")
+
+        text = registry.render([("t_queue_depth", "gauge", "Queued.", [({"engine": "ollama"}, 3)])])
+
+        self.assertIn("# TYPE t_requests_total counter", text)
+        self.assertIn('t_requests_total{model="a\\"b",status="200"} 2', text)
+        self.assertIn('t_latency_seconds_bucket{model="a",le="0.1"} 1', text)
+        self.assertIn('t_latency_seconds_bucket{model="a",le="1"} 2', text)
+        self.assertIn('t_latency_seconds_bucket{model="a",le="+Inf"} 3', text)
+        self.assertIn('t_latency_seconds_sum{model="a"} 5.55', text)
+        self.assertIn('t_latency_seconds_count{model="a"} 3', text)
+        self.assertIn('t_queue_depth{engine="ollama"} 3', text)
+
+    def test_error_type_classifies_http_and_transport_errors(self):
+        request = httpx.Request("GET", "http://x")
+        status = httpx.HTTPStatusError("boom", request=request, response=httpx.Response(503, request=request))
+        self.assertEqual(error_type(status), "http_503")
+        self.assertEqual(error_type(httpx.ConnectError("refused")), "connect")
+        self.assertEqual(error_type(httpx.ReadTimeout("slow")), "timeout")
+
+    def test_spans_accumulate_into_server_timing(self):
+        async def scenario():
+            trace = metrics.start_trace()
+            for _ in range(2):
+                with metrics.span("image_fetch"):
+                    await asyncio.sleep(0.01)
+            with metrics.span("upstream"):
+                pass
+            return trace
+
+        trace = asyncio.run(scenario())
+        self.assertGreaterEqual(trace.stages["image_fetch"], 0.02)
+        header = trace.server_timing()
+        self.assertRegex(header, r"^image_fetch;dur=\d+\.\d{3}, upstream;dur=\d+\.\d{3}, total;dur=\d+\.\d{3}$")
+        with metrics.span("outside"):  # no trace in this context: nothing recorded, no error
+            pass
+
+
+class ProfilerTests(unittest.TestCase):
+    def _cfg(self, tmp, enabled=True):
+        return {"enabled": enabled, "dir": tmp, "interval-ms": 1, "max-seconds": 5}
+
+    def test_sampler_writes_folded_stacks_of_the_target_thread(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "p.folded"
+            sampler = StackSampler(threading.get_ident(), path, interval_s=0.001).start()
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                sum(range(1000))
+            sampler.stop()
+            sampler.join(5)
+            lines = path.read_text().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertIn("test_sampler_writes_folded_stacks_of_the_target_thread", stack)
+        self.assertGreater(int(count), 0)
+
+    def test_requests_are_profiled_by_header_or_armed_count_one_at_a_time(self):
+        profiler = RequestProfiler()
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertIsNone(profiler.start("chat", {"x-profile": "1"}, self._cfg(tmp, enabled=False)))
+            self.assertIsNone(profiler.start("chat", {}, self._cfg(tmp)))
+
+            first = profiler.start("chat", {"x-profile": "1"}, self._cfg(tmp))
+            self.assertIsNotNone(first)
+            profiler.arm(1)
+            self.assertIsNone(profiler.start("chat", {}, self._cfg(tmp)))  # one profile at a time
+            first.stop()
+            first.join(5)
+
+            armed = profiler.start("chat", {}, self._cfg(tmp))
+            self.assertIsNotNone(armed)
+            armed.stop()
+            armed.join(5)
+            self.assertEqual(profiler.stats()["armed"], 0)
+            self.assertEqual(len(profiler.stats()["recent"]), 2)
+
+
+class SharedStateTests(unittest.TestCase):
+    def _run_with_sidecar(self, scenario, max_bytes=1 << 20):
+        async def main():
+            with tempfile.TemporaryDirectory() as tmp:
+                path = str(Path(tmp) / "state.sock")
+                server = await SharedStateServer(path, max_bytes).start()
+                clients = [SharedStateClient(path, autostart=False, breaker_sync_s=0) for _ in range(2)]
+                try:
+                    for client in clients:
+                        await client.startup()
+                    return await scenario(server, *clients)
+                finally:
+                    for client in clients:
+                        await client.aclose()
+                    await server.aclose()
+
+        return asyncio.run(main())
+
+    def test_byte_lru_evicts_by_size_and_expires_by_ttl(self):
+        clock = _Clock()
+        lru = ByteLRU(10, clock=clock)
+        lru.set("a", b"12345")
+        lru.set("b", b"12345", ttl_s=5)
+        lru.get("a")
+        lru.set("c", b"123")  # over budget: "b" is least recently used
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("a"), (b"12345", 0.0))
+        lru.set("d", b"12", ttl_s=5)
+        clock.now += 6
+        self.assertIsNone(lru.get("d"))
+        self.assertEqual(lru.stats()["evictions"], 1)
+
+    def test_semaphore_caps_across_workers_and_frees_permits_of_dropped_connections(self):
+        async def scenario(server, a, b):
+            first = await a.acquire("admission:engine vllm", 1, 0)
+            blocked = await b.acquire("admission:engine vllm", 1, 0.05)
+            waiter = asyncio.create_task(b.acquire("admission:engine vllm", 1, 2))
+            await asyncio.sleep(0.05)
+            first()
+            second = await waiter
+            await a.aclose()  # holds nothing now; b's permit stays
+            held_while_b_holds = server.stats()["semaphores"]["admission:engine vllm"]["held"]
+            await b.aclose()  # worker gone without releasing
+            await asyncio.sleep(0.05)
+            return blocked, second, held_while_b_holds, server.stats()["semaphores"], await b.incr("n", 2)
+
+        blocked, second, held, semaphores, counter = self._run_with_sidecar(scenario)
+        self.assertIsNone(blocked)
+        self.assertIsNotNone(second)
+        self.assertEqual(held, 1)
+        self.assertEqual(semaphores, {})
+        self.assertEqual(counter, 2)  # b reconnects on the next call
+
+    def test_cancelled_acquire_hands_back_a_late_grant(self):
+        async def scenario(server, a, b):
+            holder = await a.acquire("admission:engine vllm", 1, 0)
+            waiter = asyncio.create_task(b.acquire("admission:engine vllm", 1, 5))
+            await asyncio.sleep(0.05)
+            waiter.cancel()  # e.g. the client disconnected while queued
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            holder()  # the sidecar now grants the permit to b's abandoned request
+            await asyncio.sleep(0.05)
+            semaphores = server.stats()["semaphores"]
+            regained = await a.acquire("admission:engine vllm", 1, 0)
+            return semaphores, regained, b.connected
+
+        semaphores, regained, connected = self._run_with_sidecar(scenario)
+        self.assertEqual(semaphores, {})
+        self.assertIsNotNone(regained)
+        self.assertTrue(connected)
+
+    def test_autostart_replaces_a_stale_socket_file_and_respawns_after_a_crash(self):
+        async def scenario():
+            with tempfile.TemporaryDirectory() as tmp:
+                path = str(Path(tmp) / "state.sock")
+                stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                stale.bind(path)  # bound, never listening: what a crashed sidecar leaves behind
+                stale.close()
+                servers = []
+
+                def popen(cmd, **kwargs):  # run the sidecar in-process instead of a subprocess
+                    servers.append(asyncio.ensure_future(SharedStateServer(path, 1 << 20).start()))
+
+                client = SharedStateClient(path, autostart=True, breaker_sync_s=0, reconnect_s=0)
+                try:
+                    with patch("app.services.shared_state.subprocess.Popen", popen):
+                        await client.startup()
+                        first = (client.connected, await client.incr("n"))
+                        await (await servers[0]).aclose()  # the sidecar crashes or idle-exits
+                        client._writer.close()
+                        await asyncio.sleep(0.05)
+                        dropped = client.connected
+                        second = await client.incr("n")  # same worker launches it again
+                    return first, dropped, second, len(servers)
+                finally:
+                    await client.aclose()
+                    for server in servers:
+                        await (await server).aclose()
+
+        first, dropped, second, spawned = asyncio.run(scenario())
+        self.assertEqual(first, (True, 1))
+        self.assertFalse(dropped)
+        self.assertEqual(second, 1)  # a fresh sidecar starts with empty state
+        self.assertEqual(spawned, 2)
+
+    def test_admission_cap_holds_host_wide(self):
+        def controller(shared):
+            admission = AdmissionController()
+            admission.configure({"queue-timeout-s": 0.05, "engines": {"vllm": {"max-concurrency": 1}}}, [])
+            admission.shared = shared
+            return admission
+
+        async def scenario(server, a, b):
+            release = await controller(a).acquire("vllm", "m")
+            with self.assertRaises(AdmissionRejected):
+                await controller(b).acquire("vllm", "m")
+            release()
+            await asyncio.sleep(0.02)
+            (await controller(b).acquire("vllm", "m"))()
+
+        self._run_with_sidecar(scenario)
+
+    def test_response_cache_and_breakers_are_shared(self):
+        async def scenario(server, a, b):
+            worker_a, worker_b = ResponseCache(8, 60), ResponseCache(8, 60)
+            worker_a.shared, worker_b.shared = a, b
+            worker_a.put("k", {"model": "m", "choices": []})
+            health_a = EndpointHealth(["http://x", "http://y"], failure_threshold=1, cooldown_s=30)
+            health_b = EndpointHealth(["http://x", "http://y"], failure_threshold=1, cooldown_s=30)
+            a.watch_breakers({"vllm": health_a})
+            b.watch_breakers({"vllm": health_b})
+            health_a.record_failure("http://x", "refused")
+            await asyncio.sleep(0.02)
+            await b.sync_breakers()
+            return await worker_b.aget("k"), worker_b.stats(), health_b.is_available("http://x")
+
+        cached, stats, available = self._run_with_sidecar(scenario)
+        self.assertEqual(cached, {"model": "m", "choices": []})
+        self.assertEqual((stats["hits"], stats["shared_hits"]), (1, 1))
+        self.assertFalse(available)
+
+    def test_unreachable_sidecar_fails_open(self):
+        async def scenario():
+            shared = SharedStateClient("/nonexistent/vilms.sock", autostart=False)
+            admission = AdmissionController()
+            admission.configure({"queue-timeout-s": 1, "engines": {"vllm": {"max-concurrency": 1}}}, [])
+            admission.shared = shared
+            cache = ResponseCache(8, 60)
+            cache.shared = shared
+            release = await admission.acquire("vllm", "m")
+            release()
+            return await cache.aget("k"), (await shared.stats())["connected"]
+
+        self.assertEqual(asyncio.run(scenario()), (None, False))
+
+
+class ReadinessTests(unittest.TestCase):
+    def test_http_probe_needs_one_answering_url(self):
+        def handler(request):
+            if request.url.host == "down":
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response(404 if request.url.host == "up" else 503)
+
+        async def scenario():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            probes = {
+                "mixed": http_probe(lambda: client, ["http://down/health", "http://up/health"], 1),
+                "failing": http_probe(lambda: client, ["http://down/health", "http://broken/health"], 1),
+            }
+            monitor = ReadinessMonitor(probes, require="any")
+            await monitor.warm_up()
+            await client.aclose()
+            return monitor
+
+        monitor = asyncio.run(scenario())
+        mixed, failing = monitor.components["mixed"], monitor.components["failing"]
+        self.assertTrue(mixed.ready)
+        self.assertEqual(mixed.detail, "1/2 up: http://up/health")
+        self.assertFalse(failing.ready)
+        self.assertIn("http://broken/health (HTTP 503)", failing.error)
+        self.assertTrue(monitor.ready)  # require: any
+        monitor.require = "all"
+        self.assertFalse(monitor.ready)
+
+    def test_failed_warm_up_is_reported_and_reload_keeps_results(self):
+        async def broken():
+            raise RuntimeError("sentence-transformers is not installed")
+
+        async def ok():
+            return "fine"
+
+        monitor = ReadinessMonitor({"vllm": ok}, {"embedding": broken})
+        asyncio.run(monitor.warm_up())
+        reloaded = ReadinessMonitor({"vllm": ok}, previous=monitor)
+        self.assertTrue(monitor.ready)
+        self.assertEqual(monitor.snapshot()["warmup_errors"], {"embedding": "sentence-transformers is not installed"})
+        self.assertTrue(reloaded.ready)
+        self.assertEqual(reloaded.components["vllm"].detail, "fine")
+
+
+if __name__ == "__main__":
+    unittest.main()